@@ -6,7 +6,7 @@ from .models import Post, Comment, Interaction
 class PostAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'status', 'date_posted')
     list_filter = ('status', 'date_posted') # Sidebar filters
-    search_fields = ('title', 'content', 'author__username')
+    search_fields = ('title', 'content__stored', 'author__username')  # Uncompressed bodies only (blog/fields.py)
 
 # 2. COMMENT ADMIN
 @admin.register(Comment)
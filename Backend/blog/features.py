@@ -0,0 +1,283 @@
+"""
+In-process feature store for feed ranking.
+
+The default feed used to push a Case/When relevance expression and three
+aggregates into SQL on every request, over every published post. The
+ranking inputs are small, so each process keeps them as NumPy columns:
+
+    id, topic code, tag bitset (uint64 words), date posted,
+    comments, OP replies
+
+and scores a request with a few vectorized operations: relevance 5 for a
+tag the user clicked, 2 for a topic of interest, then a lexsort on
+(-relevance, -date_posted, -quality_ratio). Only the requested page of
+ids is then loaded from the database.
+
+Freshness:
+  * Post and comment saves/deletes mark post ids dirty (blog/signals.py);
+    the next read reloads just those rows. This covers the process that saw the event.
+  * Everything is rebuilt every FEATURE_STORE_TTL seconds by a background
+    refresher thread, which brings in other workers' changes. Requests keep
+    ranking with the current columns meanwhile; only the very first build
+    of a process happens on the request path.
+  * With FEATURE_STORE_SNAPSHOT set (a directory), a rebuild also writes
+    the columns there as .npy files and other workers memory-map the
+    latest snapshot instead of running the aggregate query themselves.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+
+from mysite import metrics
+from .models import TOPIC_CHOICES, Post
+
+logger = logging.getLogger(__name__)
+
+TOPIC_CODES = {code: i for i, (code, _) in enumerate(TOPIC_CHOICES)}
+COLUMNS = ('id', 'topic', 'date', 'comments', 'op_replies', 'tags')
+
+
+def normalize_tags(tags):
+    return {t.strip().lstrip('#').lower() for t in (tags or '').split(',') if t.strip()}
+
+
+def _feature_rows(queryset):
+    return queryset.annotate(
+        n_comments=Count('comments', distinct=True),
+        n_op_replies=Count('comments', filter=Q(comments__author=F('author')), distinct=True),
+    ).values_list('id', 'topic', 'tags', 'date_posted', 'n_comments', 'n_op_replies')
+
+
+class FeatureStore:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # One rebuild at a time
+        self._columns = None
+        self._vocabulary = {}      # tag -> bit
+        self._built_at = 0.0       # time.time() of the data currently held
+        self._dirty = set()
+        self._refresher = None
+        self._wakeup = threading.Event()
+        self._counters = {'rebuilds': 0, 'snapshot_loads': 0, 'dirty_reloads': 0, 'rankings': 0}
+
+    # ---------- building ----------
+    def _build(self, rows):
+        vocabulary = {}
+        for row in rows:
+            for tag in normalize_tags(row[2]):
+                vocabulary.setdefault(tag, len(vocabulary))
+        words = max(1, -(-len(vocabulary) // 64))
+
+        n = len(rows)
+        columns = {
+            'id': np.empty(n, np.int64),
+            'topic': np.empty(n, np.int8),
+            'date': np.empty(n, np.float64),
+            'comments': np.empty(n, np.int32),
+            'op_replies': np.empty(n, np.int32),
+            'tags': np.zeros((n, words), np.uint64),
+        }
+        for i, (post_id, topic, tags, date_posted, comments, op_replies) in enumerate(rows):
+            columns['id'][i] = post_id
+            columns['topic'][i] = TOPIC_CODES.get(topic, -1)
+            columns['date'][i] = date_posted.timestamp()
+            columns['comments'][i] = comments
+            columns['op_replies'][i] = op_replies
+            for tag in normalize_tags(tags):
+                bit = vocabulary[tag]
+                columns['tags'][i, bit // 64] |= np.uint64(1 << (bit % 64))
+        return columns, vocabulary
+
+    def _rebuild(self):
+        rows = list(_feature_rows(Post.published.all()))
+        columns, vocabulary = self._build(rows)
+        built_at = time.time()
+        with self._lock:
+            self._columns, self._vocabulary, self._built_at = columns, vocabulary, built_at
+            self._counters['rebuilds'] += 1
+        if settings.FEATURE_STORE_SNAPSHOT:
+            try:
+                self._write_snapshot(columns, vocabulary, built_at)
+            except OSError:
+                logger.exception("feature store: snapshot write failed")
+
+    def _reload_dirty(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        rows = list(_feature_rows(Post.published.filter(id__in=dirty)))
+        fresh, _ = self._build(rows)
+
+        with self._lock:
+            columns = self._columns
+            keep = ~np.isin(columns['id'], list(dirty))
+            # Tag bits of the fresh rows, in this store's vocabulary
+            for row in rows:
+                for tag in normalize_tags(row[2]):
+                    self._vocabulary.setdefault(tag, len(self._vocabulary))
+            words = max(columns['tags'].shape[1], -(-len(self._vocabulary) // 64))
+            remapped = np.zeros((len(rows), words), np.uint64)
+            for i, row in enumerate(rows):
+                for tag in normalize_tags(row[2]):
+                    bit = self._vocabulary[tag]
+                    remapped[i, bit // 64] |= np.uint64(1 << (bit % 64))
+            old_tags = columns['tags'][keep]
+            if old_tags.shape[1] < words:
+                old_tags = np.pad(old_tags, ((0, 0), (0, words - old_tags.shape[1])))
+
+            # New arrays (never in place: snapshot columns are read-only memory maps)
+            merged = {name: np.concatenate([columns[name][keep], fresh[name]]) for name in COLUMNS if name != 'tags'}
+            merged['tags'] = np.concatenate([old_tags, remapped])
+            self._columns = merged
+            self._counters['dirty_reloads'] += 1
+
+    def _stale(self):
+        return time.time() - self._built_at > settings.FEATURE_STORE_TTL
+
+    def _ensure_fresh(self):
+        if self._columns is None:
+            with self._refresh_lock:
+                # Cold start: nothing to rank with yet, so this request waits
+                if self._columns is None and not self._load_snapshot():
+                    self._rebuild()
+        elif self._stale():
+            self._ensure_refresher()
+            self._wakeup.set()
+        # Dirty rows wait for the next request while a rebuild is running
+        if self._dirty and self._refresh_lock.acquire(blocking=False):
+            try:
+                self._reload_dirty()
+            finally:
+                self._refresh_lock.release()
+
+    # ---------- background refresher ----------
+    def refresh(self):
+        """ Rebuild (or pick up a newer snapshot) if the data is older than FEATURE_STORE_TTL. """
+        with self._refresh_lock:
+            if self._stale() and not self._load_snapshot():
+                self._rebuild()
+
+    def _ensure_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = threading.Thread(target=self._refresh_loop, name='feature-store', daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            close_old_connections()
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("feature store: background rebuild failed")
+            finally:
+                close_old_connections()
+            self._wakeup.wait(settings.FEATURE_STORE_TTL)
+            self._wakeup.clear()
+
+    # ---------- snapshot (shared across workers) ----------
+    def _write_snapshot(self, columns, vocabulary, built_at):
+        root = settings.FEATURE_STORE_SNAPSHOT
+        version = f"v{int(built_at * 1000)}-{os.getpid()}"
+        target = os.path.join(root, version)
+        os.makedirs(target, exist_ok=True)
+        for name, array in columns.items():
+            np.save(os.path.join(target, f"{name}.npy"), array)
+        with open(os.path.join(target, 'meta.json'), 'w') as f:
+            json.dump({'built_at': built_at, 'vocabulary': vocabulary}, f)
+
+        pointer = os.path.join(root, 'CURRENT')
+        with open(f"{pointer}.{os.getpid()}", 'w') as f:
+            f.write(version)
+        os.replace(f"{pointer}.{os.getpid()}", pointer)  # Atomic switch for readers
+
+        # Keep the previous version for readers still mapping it
+        versions = sorted(d for d in os.listdir(root) if d.startswith('v') and d != version)
+        for old in versions[:-1]:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+    def _load_snapshot(self):
+        root = settings.FEATURE_STORE_SNAPSHOT
+        if not root:
+            return False
+        try:
+            with open(os.path.join(root, 'CURRENT')) as f:
+                target = os.path.join(root, f.read().strip())
+            with open(os.path.join(target, 'meta.json')) as f:
+                meta = json.load(f)
+            if time.time() - meta['built_at'] > settings.FEATURE_STORE_TTL or meta['built_at'] <= self._built_at:
+                return False
+            columns = {name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode='r') for name in COLUMNS}
+        except (OSError, ValueError, KeyError):
+            return False
+        with self._lock:
+            self._columns, self._vocabulary, self._built_at = columns, meta['vocabulary'], meta['built_at']
+            self._counters['snapshot_loads'] += 1
+        return True
+
+    # ---------- change events ----------
+    def mark_dirty(self, post_ids):
+        """ Reload these posts on the next read (once the current transaction commits). """
+        post_ids = set(post_ids)
+
+        def mark():
+            with self._lock:
+                self._dirty |= post_ids
+        transaction.on_commit(mark)
+
+    # ---------- ranking ----------
+    def rank(self, topics=(), tags=()):
+        """
+        All published post ids in feed order, with their relevance:
+        (ids, relevance) as NumPy arrays.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            c = self._columns
+            vocabulary = self._vocabulary
+            self._counters['rankings'] += 1
+
+        relevance = np.zeros(len(c['id']), np.int8)
+        codes = [TOPIC_CODES[t] for t in topics if t in TOPIC_CODES]
+        if codes:
+            relevance[np.isin(c['topic'], codes)] = 2
+
+        bits = [vocabulary[t] for t in tags if t in vocabulary]
+        if bits:
+            mask = np.zeros(c['tags'].shape[1], np.uint64)
+            for bit in bits:
+                mask[bit // 64] |= np.uint64(1 << (bit % 64))
+            relevance[(c['tags'] & mask).any(axis=1)] = 5  # Tags win over topics
+
+        comments = c['comments']
+        quality = np.divide(c['op_replies'], comments, out=np.zeros(len(comments)), where=comments > 0)
+        # lexsort: last key is primary
+        order = np.lexsort((-quality, -c['date'], -relevance))
+        return c['id'][order], relevance[order]
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                posts=0 if self._columns is None else len(self._columns['id']),
+                tags=len(self._vocabulary),
+                age=round(time.time() - self._built_at, 1) if self._built_at else None,
+                dirty=len(self._dirty),
+            )
+
+
+store = FeatureStore()
+metrics.register('feature_store', store.stats)
@@ -0,0 +1,188 @@
+"""
+Compressed text storage for long post bodies.
+
+``CompressedTextField`` is a plain text column. Values at least
+POST_CONTENT_COMPRESSION_MIN_BYTES long are written as
+
+    '\\x1f' + codec + ':' + base64(compressed utf-8)
+
+when POST_CONTENT_COMPRESSION is on (opt-in). Values without the marker
+are ordinary text, so existing rows and short posts need no migration and
+the setting can be turned off at any time.
+
+Rows are decompressed lazily: loading a Post keeps the stored string and
+only the first access to ``post.content`` decodes it (then caches it on
+the instance). Querysets that never touch the body (admin changelists,
+the cleanup job, counters) pay nothing for it.
+
+Values are compressed on the way into the database only (saves,
+``update()``), never in lookups. ``content=`` and ``content__in`` match a
+text however it is stored: plain, or compressed as this process would
+write it. Pattern lookups (``contains``, ``icontains``, ``startswith``,
+...) can't look inside compressed rows, so they raise; ``content__stored__``
+applies them to the stored string instead, i.e. to uncompressed rows only.
+
+Caveat: ``values()``/``values_list()`` return the stored string, use
+``decompress()`` on it.
+
+zlib is always available; zstd is used when POST_CONTENT_CODEC = 'zstd'
+and the optional ``zstandard`` package is installed.
+"""
+
+import base64
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import FieldError
+from django.db import models
+from django.db.models import lookups
+from django.db.models.query_utils import DeferredAttribute
+
+try:
+    import zstandard
+except ImportError:  # Optional, zlib is the fallback
+    zstandard = None
+
+MARKER = '\x1f'
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor(level=10).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'zstd': (_zstd_compress, _zstd_decompress),
+}
+
+
+def available_codecs():
+    return [name for name in CODECS if name != 'zstd' or zstandard is not None]
+
+
+def is_compressed(value):
+    return isinstance(value, str) and value.startswith(MARKER)
+
+
+def compress(text, codec=None):
+    codec = codec or settings.POST_CONTENT_CODEC
+    if codec not in available_codecs():
+        codec = 'zlib'
+    packed = CODECS[codec][0](text.encode('utf-8'))
+    return f"{MARKER}{codec}:{base64.b64encode(packed).decode('ascii')}"
+
+
+def stored_forms(text):
+    """ Every way ``text`` may sit in the column: as is, and compressed with each available codec. """
+    if not text:
+        return [text]
+    return [text, *(compress(text, codec) for codec in available_codecs())]
+
+
+def decompress(value):
+    """ Stored value -> text. Plain (uncompressed) values pass through. """
+    if not is_compressed(value):
+        return value
+    codec, _, payload = value[1:].partition(':')
+    return CODECS[codec][1](base64.b64decode(payload)).decode('utf-8')
+
+
+class StoredText(str):
+    """ A value as read from the database (possibly still compressed). """
+
+
+class CompressedAttribute(DeferredAttribute):
+    """ Keeps the stored value on the instance, decodes it on first read. """
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        # Only database values are payloads; assigned text is returned untouched
+        if instance is not None and isinstance(value, StoredText) and is_compressed(value):
+            value = decompress(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    descriptor_class = CompressedAttribute
+
+    def from_db_value(self, value, expression, connection):
+        # No decoding here (that is the descriptor's job), only tagging
+        return value if value is None else StoredText(value)
+
+    def get_db_prep_save(self, value, connection):
+        # Only writes are encoded: lookups compare plain text (see the lookups below)
+        if isinstance(value, str) and value:
+            value = self.encode(value)
+        return super().get_db_prep_save(value, connection)
+
+    @staticmethod
+    def encode(value):
+        if is_compressed(value):
+            # Text that merely starts with the marker must not be read back as
+            # a payload. Already-encoded values are written with a Value() expression.
+            return compress(value)
+        if (
+            settings.POST_CONTENT_COMPRESSION
+            and len(value) >= settings.POST_CONTENT_COMPRESSION_MIN_BYTES
+        ):
+            compressed = compress(value)
+            if len(compressed) < len(value):
+                return compressed
+        return value
+
+    def value_to_string(self, obj):
+        # dumpdata / serializers: always the readable text
+        return decompress(self.value_from_object(obj))
+
+
+@CompressedTextField.register_lookup
+class StoredExact(lookups.Exact):
+    """ Matches the text whether its row is plain or compressed. """
+
+    def as_sql(self, compiler, connection):
+        if self.rhs_is_direct_value() and isinstance(self.rhs, str) and self.rhs:
+            return lookups.In(self.lhs, stored_forms(self.rhs)).as_sql(compiler, connection)
+        return super().as_sql(compiler, connection)
+
+
+@CompressedTextField.register_lookup
+class StoredIn(lookups.In):
+
+    def get_prep_lookup(self):
+        if self.rhs_is_direct_value():
+            self.rhs = [form for text in self.rhs for form in (stored_forms(text) if isinstance(text, str) else [text])]
+        return super().get_prep_lookup()
+
+
+@CompressedTextField.register_lookup
+class Stored(models.Transform):
+    """ ``content__stored__icontains``: the raw column, so uncompressed rows only. """
+    lookup_name = 'stored'
+    output_field = models.TextField()
+
+    def as_sql(self, compiler, connection):
+        return compiler.compile(self.lhs)
+
+
+class UnsupportedLookup(lookups.Lookup):
+
+    def __init__(self, lhs, rhs):
+        raise FieldError(
+            f"'{self.lookup_name}' can't see inside compressed rows; use "
+            f"'stored__{self.lookup_name}' to match uncompressed rows only."
+        )
+
+
+for _name in (
+    'iexact', 'contains', 'icontains', 'startswith', 'istartswith',
+    'endswith', 'iendswith', 'regex', 'iregex',
+):
+    CompressedTextField.register_lookup(type(f'Unsupported_{_name}', (UnsupportedLookup,), {'lookup_name': _name}))
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from blog.models import Notification, Post
+
+# (label, method, path); {post} is a published post id
+ENDPOINTS = [
+    ('feed', 'GET', '/api/posts/'),
+    ('detail', 'GET', '/api/posts/{post}/'),
+    ('record_view', 'POST', '/api/posts/{post}/record_view/'),
+    ('notifications', 'GET', '/api/notifications/'),
+    ('recommendations', 'GET', '/api/recommendations/'),
+]
+# Feed fake views into real view counts: only run when named in --only
+WRITES = {'record_view'}
+
+
+def _percentile(timings, fraction):
+    return sorted(timings)[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Throughput and latency of the async API views at several concurrency levels. "
+            "Runs the ASGI app in-process, or against a running server with --url "
+            "(e.g. uvicorn mysite.asgi:application), so two builds can be compared. "
+            "Creates a token and a notification for the user, so it only runs with DEBUG on or --allow-writes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='', help="Base URL of a running ASGI server. Default: in-process.")
+        parser.add_argument('--user', default='', help="Username to authenticate as. Default: first active user.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and concurrency level.")
+        parser.add_argument('--concurrency', default='1,10,50', help="Comma-separated concurrency levels.")
+        parser.add_argument('--only', default='', help="Comma-separated endpoint labels to run "
+                                                       "(record_view is only run when listed here).")
+        parser.add_argument('--allow-writes', action='store_true',
+                            help="Run with DEBUG off, writing to the configured database.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['allow_writes']:
+            raise CommandError("Writes a token and a notification to the configured database: "
+                               "run with DEBUG on, or pass --allow-writes.")
+        logging.getLogger('httpx').setLevel(logging.WARNING)  # One INFO line per request otherwise
+        users = User.objects.filter(is_active=True).order_by('id')
+        user = users.filter(username=options['user']).first() if options['user'] else users.first()
+        post_id = Post.published.order_by('-date_posted').values_list('id', flat=True).first()
+        if user is None or post_id is None:
+            raise CommandError("Needs an active user and a published post.")
+        token, _ = Token.objects.get_or_create(user=user)
+        Notification.objects.get_or_create(recipient=user, post_id=post_id, action='COMMENT', defaults={'text': 'benchmark'})
+
+        levels = [int(c) for c in options['concurrency'].split(',') if c.strip()]
+        only = {label.strip() for label in options['only'].split(',') if label.strip()}
+        endpoints = [e for e in ENDPOINTS if e[0] in only or (not only and e[0] not in WRITES)]
+
+        self.stdout.write(f"Target: {options['url'] or 'in-process ASGI'}, user {user.username}, post {post_id}")
+        self.stdout.write(f"{'endpoint':<16} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for label, method, path in endpoints:
+            for concurrency in levels:
+                elapsed, timings, errors = async_to_sync(self._run)(
+                    options['url'], token.key, method, path.format(post=post_id), options['requests'], concurrency,
+                )
+                self.stdout.write(
+                    f"{label:<16} {concurrency:>5} {len(timings) / elapsed:>9.1f} "
+                    f"{_percentile(timings, 0.5) * 1000:>8.1f} {_percentile(timings, 0.95) * 1000:>8.1f} {errors:>7}"
+                )
+
+    async def _run(self, url, token, method, path, total, concurrency):
+        if url:
+            client = httpx.AsyncClient(base_url=url, timeout=30)
+        else:
+            from mysite.asgi import application
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url='http://testserver', timeout=30)
+
+        timings, errors = [], 0
+        remaining = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                response = await client.request(method, path, headers={'Authorization': f'Token {token}'})
+                timings.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+
+        async with client:
+            await client.request(method, path, headers={'Authorization': f'Token {token}'})  # Warm-up
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+        return elapsed, timings or [0.0], errors
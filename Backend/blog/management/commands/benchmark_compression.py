@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from blog import recommender
+from blog.models import Post
+from blog.serializers import PostSerializer
+from mysite import compression
+
+LEVELS = {'gzip': [1, 6, 9], 'br': [1, 5, 9, 11]}
+
+
+class Command(BaseCommand):
+    help = ("CPU cost vs bytes saved of gzip and Brotli levels on real feed pages and post details, "
+            "and the cost of serving an already stored compressed body instead.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=5, help="Feed pages to render (FEED_PAGE_SIZE posts each).")
+        parser.add_argument('--details', type=int, default=20, help="Post detail bodies to render.")
+        parser.add_argument('--repeat', type=int, default=20, help="Compressions per payload and level.")
+
+    def handle(self, *args, **options):
+        posts = recommender.with_viewer_state(
+            recommender.with_stats(Post.published.select_related('author__profile')), AnonymousUser(),
+        ).order_by('-date_posted')
+        size = settings.FEED_PAGE_SIZE
+        renderer = JSONRenderer()
+        feed = [
+            renderer.render({'results': PostSerializer(posts[i * size:(i + 1) * size], many=True).data})
+            for i in range(options['pages'])
+        ]
+        details = [renderer.render(PostSerializer(post).data) for post in posts[:options['details']]]
+        feed = [body for body in feed if len(body) > len(b'{"results":[]}')]
+        if not feed:
+            raise CommandError("Needs published posts.")
+
+        self.stdout.write(f"Encodings available: {', '.join(compression.available_encodings())}")
+        for label, bodies in (('feed page', feed), ('post detail', details)):
+            total = sum(len(body) for body in bodies)
+            self.stdout.write(f"\n{label}: {len(bodies)} bodies, {total / len(bodies) / 1024:.1f} KB average")
+            self.stdout.write(f"{'encoding':<10} {'level':>5} {'KB out':>8} {'saved':>7} {'CPU ms':>8} {'MB/s':>8}")
+            for encoding in compression.available_encodings():
+                for level in LEVELS[encoding]:
+                    self._measure(encoding, level, bodies, total, options['repeat'])
+            self._measure_stored(bodies, options['repeat'])
+
+    def _measure(self, encoding, level, bodies, total, repeat):
+        encode = compression.ENCODERS[encoding][0]
+        start = time.process_time()
+        for _ in range(repeat):
+            out = sum(len(encode(body, level)) for body in bodies)
+        cpu = (time.process_time() - start) / (repeat * len(bodies))
+        self.stdout.write(
+            f"{encoding:<10} {level:>5} {out / len(bodies) / 1024:>8.1f} {1 - out / total:>7.1%} "
+            f"{cpu * 1000:>8.3f} {total / len(bodies) / cpu / 1e6 if cpu else 0:>8.1f}"
+        )
+
+    def _measure_stored(self, bodies, repeat):
+        # What a repeat of a body costs once its encoding is stored: hash + cache get
+        encoding = compression.available_encodings()[0]
+        for body in bodies:
+            compression.encode(body, encoding, store=True)
+        start = time.process_time()
+        for _ in range(repeat):
+            for body in bodies:
+                compression.encode(body, encoding, store=True)
+        cpu = (time.process_time() - start) / (repeat * len(bodies))
+        self.stdout.write(f"{'stored':<10} {encoding:>5} {'':>8} {'':>7} {cpu * 1000:>8.3f}  (hash + cache get)")
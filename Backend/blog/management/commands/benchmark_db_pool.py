@@ -0,0 +1,104 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from mysite.db_pool import POSTGRES_ENGINE
+
+
+class Command(BaseCommand):
+    help = ("Request-shaped database latency with per-thread persistent connections (conn_max_age) "
+            "vs the psycopg pool. Like Django under uvicorn, every request runs on a fresh thread. "
+            "PostgreSQL only.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--queries', type=int, default=3, help="Queries per request.")
+        parser.add_argument('--pool-min', type=int, default=2)
+        parser.add_argument('--pool-max', type=int, default=10)
+
+    def handle(self, *args, **options):
+        base = connections.settings[DEFAULT_DB_ALIAS]
+        if base['ENGINE'] != POSTGRES_ENGINE:
+            raise CommandError("Needs a PostgreSQL DATABASE_URL (and psycopg 3 for the pool).")
+        plain_options = {k: v for k, v in base['OPTIONS'].items() if k != 'pool'}
+        modes = {
+            'persistent': {**base, 'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': plain_options},
+            'pool': {
+                **base, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True,
+                'OPTIONS': {**plain_options, 'pool': {'min_size': options['pool_min'], 'max_size': options['pool_max']}},
+            },
+        }
+
+        self.stdout.write(f"{options['requests']} requests x {options['queries']} queries, "
+                          f"concurrency {options['concurrency']}")
+        self.stdout.write(f"{'mode':<11} {'req/s':>8} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} "
+                          f"{'server conns':>13} {'pool wait ms':>13}")
+        for mode, settings_dict in modes.items():
+            alias = f'benchmark_{mode}'
+            connections.settings[alias] = settings_dict
+            try:
+                elapsed, timings, peak = self._run(alias, options)
+                pool = connections[alias].pool
+                wait = pool.get_stats().get('requests_wait_ms', 0) / len(timings) if pool else None
+            finally:
+                if connections[alias].pool:
+                    connections[alias].close_pool()
+                connections[alias].close()
+                del connections.settings[alias]
+
+            timings.sort()
+            self.stdout.write(
+                f"{mode:<11} {len(timings) / elapsed:>8.1f} {statistics.mean(timings) * 1000:>8.2f} "
+                f"{timings[len(timings) // 2] * 1000:>7.2f} {timings[int(len(timings) * 0.95)] * 1000:>7.2f} "
+                f"{peak:>13} {'-' if wait is None else f'{wait:.2f}':>13}"
+            )
+        self.stdout.write("server conns: peak backends in pg_stat_activity for this database while running.")
+
+    def _run(self, alias, options):
+        timings, lock = [], threading.Lock()
+        slots = threading.Semaphore(options['concurrency'])
+        done = threading.Event()
+        peak = [0]
+
+        def request():
+            try:
+                start = time.perf_counter()
+                connection = connections[alias]
+                with connection.cursor() as cursor:
+                    for _ in range(options['queries']):
+                        cursor.execute("SELECT 1")
+                        cursor.fetchone()
+                # What request_finished does: returns a pooled connection, keeps a persistent one
+                connection.close_if_unusable_or_obsolete()
+                with lock:
+                    timings.append(time.perf_counter() - start)
+            finally:
+                slots.release()
+
+        def monitor():
+            with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                while not done.is_set():
+                    cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()")
+                    peak[0] = max(peak[0], cursor.fetchone()[0])
+                    done.wait(0.05)
+            connections[DEFAULT_DB_ALIAS].close()
+
+        watcher = threading.Thread(target=monitor, daemon=True)
+        watcher.start()
+        threads = []
+        start = time.perf_counter()
+        for _ in range(options['requests']):
+            slots.acquire()
+            thread = threading.Thread(target=request, daemon=True)  # Fresh thread per request
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        watcher.join()
+        return elapsed, timings, peak[0]
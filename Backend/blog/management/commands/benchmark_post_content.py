@@ -0,0 +1,120 @@
+import random
+import time
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from blog.fields import available_codecs, decompress
+from blog.models import Post
+from blog.serializers import PostSerializer
+
+
+def _vocabulary(rng, size=3000):
+    letters = 'etaoinshrdlcumwfgypbvkjxqz'
+    weights = sorted((rng.random() for _ in letters), reverse=True)
+    return [''.join(rng.choices(letters, weights, k=rng.randint(2, 10))) for _ in range(size)]
+
+
+def realistic_corpus(count, seed=42):
+    """
+    Editor-like HTML: headings, paragraphs, emphasis, links and image tags,
+    Zipf-distributed words, log-normal lengths (median ~6 KB, long tail).
+    """
+    rng = random.Random(seed)
+    words = _vocabulary(rng)
+    zipf = [1 / (rank + 1) for rank in range(len(words))]
+
+    def sentence():
+        text = ' '.join(rng.choices(words, zipf, k=rng.randint(6, 24))).capitalize() + '.'
+        if rng.random() < 0.15:
+            text += f' <a href="https://example.com/{rng.choice(words)}">{rng.choice(words)}</a>'
+        if rng.random() < 0.1:
+            text = f'<strong>{text}</strong>'
+        return text
+
+    corpus = []
+    for _ in range(count):
+        target = int(rng.lognormvariate(8.7, 0.9))
+        parts = []
+        while sum(len(p) for p in parts) < target:
+            roll = rng.random()
+            if roll < 0.1:
+                parts.append(f'<h2>{sentence()}</h2>')
+            elif roll < 0.13:
+                parts.append(f'<p><img src="https://cdn.example.com/posts/{rng.getrandbits(256):064x}-1600.webp"></p>')
+            else:
+                parts.append('<p>' + ' '.join(sentence() for _ in range(rng.randint(2, 6))) + '</p>')
+        corpus.append(''.join(parts))
+    return corpus
+
+
+def _best(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = "Compare plain vs compressed post bodies: stored size, row fetch time, serialization time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=500, help="Synthetic corpus size.")
+        parser.add_argument('--from-db', action='store_true', help="Use the existing post bodies as the corpus.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timings are the best of N runs.")
+        parser.add_argument('--min-bytes', type=int, default=4096, help="Compression threshold to benchmark.")
+
+    def handle(self, *args, **options):
+        if options['from_db']:
+            corpus = [decompress(c) for c in Post.objects.values_list('content', flat=True)]
+        else:
+            corpus = realistic_corpus(options['posts'])
+        raw_bytes = sum(len(text.encode('utf-8')) for text in corpus)
+        self.stdout.write(f"Corpus: {len(corpus)} posts, {raw_bytes} bytes of HTML "
+                          f"(avg {raw_bytes // max(len(corpus), 1)}).")
+        self.stdout.write(f"{'codec':<6} {'stored bytes':>13} {'ratio':>6} {'db bytes':>11} "
+                          f"{'fetch ms':>9} {'fetch+read ms':>14} {'serialize ms':>13}")
+
+        context = {'request': SimpleNamespace(user=AnonymousUser())}
+        for codec in ['plain'] + available_codecs():
+            overrides = {
+                'POST_CONTENT_COMPRESSION': codec != 'plain',
+                'POST_CONTENT_CODEC': codec if codec != 'plain' else 'zlib',
+                'POST_CONTENT_COMPRESSION_MIN_BYTES': options['min_bytes'],
+            }
+            # Everything is written and measured inside a transaction that is rolled back
+            with override_settings(**overrides), transaction.atomic():
+                author = User.objects.create(username=f'__bench_{codec}')
+                posts = Post.objects.bulk_create(
+                    [Post(title=f'bench {i}', content=text, author=author, status=1) for i, text in enumerate(corpus)],
+                    batch_size=200,
+                )
+                ids = [post.pk for post in posts]
+                queryset = Post.objects.filter(id__in=ids).select_related('author__profile')
+
+                stored = sum(len(s.encode('utf-8')) for s in Post.objects.filter(id__in=ids).values_list('content', flat=True))
+                db_bytes = self._db_bytes(ids)
+
+                # .all(): a fresh queryset (and database fetch) every run
+                fetch = _best(options['repeat'], lambda: list(queryset.all()))
+                fetch_read = _best(options['repeat'], lambda: [p.content for p in queryset.all()])
+                serialize = _best(options['repeat'], lambda: PostSerializer(queryset.all(), many=True, context=context).data)
+
+                transaction.set_rollback(True)
+
+            self.stdout.write(f"{codec:<6} {stored:>13} {raw_bytes / stored:>6.2f} {db_bytes:>11} "
+                              f"{fetch:>9.1f} {fetch_read:>14.1f} {serialize:>13.1f}")
+
+        self.stdout.write("db bytes: pg_column_size (after TOAST compression) on PostgreSQL, '-' elsewhere.")
+
+    def _db_bytes(self, ids):
+        if connection.vendor != 'postgresql':
+            return '-'
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT SUM(pg_column_size(content)) FROM blog_post WHERE id = ANY(%s)", [ids])
+            return cursor.fetchone()[0]
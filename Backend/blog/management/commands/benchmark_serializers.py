@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from blog.management.commands.benchmark_post_content import _best, realistic_corpus
+from blog.models import Comment, Post
+from blog.recommender import with_stats, with_viewer_state
+from blog.serializers import CommentSerializer, PostSerializer, comment_rows, post_rows
+from mysite.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = ("Rendering time of post and comment list pages (rows already fetched): "
+            "DRF serializers + JSONRenderer vs flat rows + ORJSONRenderer.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000', help="Comma-separated page sizes.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timings are the best of N runs.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        user = AnonymousUser()
+        context = {'request': SimpleNamespace(user=user)}
+        json_renderer, orjson_renderer = JSONRenderer(), ORJSONRenderer()
+
+        self.stdout.write(f"{'page':<14} {'rows':>5} {'drf ms':>8} {'drf+orjson':>11} {'flat+json':>10} "
+                          f"{'flat+orjson':>12} {'speedup':>8} {'same bytes':>11}")
+        # Rows are written inside a transaction that is rolled back
+        with transaction.atomic():
+            author = User.objects.create(username='__bench_serializers')
+            corpus = realistic_corpus(max(sizes))
+            posts = Post.objects.bulk_create([
+                Post(title=f'bench {i}', content=text, author=author, status=1, topic='TECH', tags='python, web, bench')
+                for i, text in enumerate(corpus)
+            ], batch_size=200)
+            comments = Comment.objects.bulk_create(
+                [Comment(post=posts[0], author=author, text=f'comment {i} ' * 8) for i in range(max(sizes))],
+                batch_size=500,
+            )
+            Comment.objects.bulk_create(
+                [Comment(post=posts[0], author=author, text='reply', parent=comment) for comment in comments[::4]],
+                batch_size=500,
+            )
+
+            for size in sizes:
+                rows = list(with_viewer_state(with_stats(
+                    Post.objects.filter(id__in=[post.pk for post in posts[:size]]).select_related('author__profile')
+                ), user))
+                self._report('posts', size, options['repeat'], [
+                    lambda: PostSerializer(rows, many=True, context=context).data,
+                    lambda: post_rows(rows, user),
+                ], json_renderer, orjson_renderer)
+
+                threads = list(
+                    Comment.objects.filter(post=posts[0], parent=None).select_related('author__profile')
+                    .prefetch_related('replies', 'replies__author', 'replies__author__profile')
+                    .order_by('-date_posted')[:size]
+                )
+                self._report('comments', size, options['repeat'], [
+                    lambda: CommentSerializer(threads, many=True, context=context).data,
+                    lambda: comment_rows(threads),
+                ], json_renderer, orjson_renderer)
+
+            transaction.set_rollback(True)
+
+    def _report(self, label, size, repeat, builders, json_renderer, orjson_renderer):
+        drf, flat = builders
+        timings = [
+            _best(repeat, lambda: json_renderer.render(drf())),
+            _best(repeat, lambda: orjson_renderer.render(drf())),
+            _best(repeat, lambda: json_renderer.render(flat())),
+            _best(repeat, lambda: orjson_renderer.render(flat())),
+        ]
+        same = json_renderer.render(drf()) == orjson_renderer.render(flat())
+        self.stdout.write(
+            f"{label:<14} {size:>5} {timings[0]:>8.1f} {timings[1]:>11.1f} {timings[2]:>10.1f} "
+            f"{timings[3]:>12.1f} {timings[0] / timings[3]:>7.1f}x {'yes' if same else 'NO':>11}"
+        )
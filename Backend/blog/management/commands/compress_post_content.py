@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Value
+
+from blog.fields import available_codecs, compress, decompress, is_compressed
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = "Rewrite existing post bodies compressed (or back to plain text with --decompress)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--decompress', action='store_true', help="Store every body as plain text again.")
+        parser.add_argument('--codec', help="Override POST_CONTENT_CODEC.")
+        parser.add_argument('--min-bytes', type=int, help="Override POST_CONTENT_COMPRESSION_MIN_BYTES.")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true', help="Only report the size change.")
+
+    def handle(self, *args, **options):
+        codec = options['codec'] or settings.POST_CONTENT_CODEC
+        if not options['decompress'] and codec not in available_codecs():
+            raise CommandError(f"Codec '{codec}' is not available (installed: {', '.join(available_codecs())}).")
+        min_bytes = settings.POST_CONTENT_COMPRESSION_MIN_BYTES if options['min_bytes'] is None else options['min_bytes']
+
+        before = after = rewritten = 0
+        last_id = 0
+        while True:
+            # values_list: the stored string as is, no lazy decoding involved
+            rows = list(
+                Post.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'content')[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for post_id, stored in rows:
+                text = decompress(stored)
+                if options['decompress']:
+                    # (text that itself starts with the marker has to stay encoded)
+                    new = stored if is_compressed(text) else text
+                elif is_compressed(stored) or len(text) < min_bytes:
+                    new = stored
+                else:
+                    new = compress(text, codec)
+                    if len(new) >= len(text):
+                        new = text  # Incompressible: keep it readable
+                before += len(stored)
+                after += len(new)
+                if new != stored:
+                    updates.append((post_id, new))
+
+            rewritten += len(updates)
+            if options['dry_run'] or not updates:
+                continue
+            with transaction.atomic():
+                for post_id, new in updates:
+                    # Value(): written verbatim, bypassing CompressedTextField.get_prep_value
+                    Post.objects.filter(pk=post_id).update(content=Value(new, output_field=models.TextField()))
+
+        verb = "Would rewrite" if options['dry_run'] else "Rewrote"
+        self.stdout.write(f"{verb} {rewritten} posts: {before} -> {after} stored bytes.")
+        self.stdout.write(self.style.SUCCESS("Done."))
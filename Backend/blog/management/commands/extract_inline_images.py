@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from blog.media import InvalidImage, extract_inline_images, update_references
+from blog.models import Post
+from mysite import caching
+
+
+class Command(BaseCommand):
+    help = "Move base64 data-URI images out of existing post contents into media storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only list the posts that embed images.")
+        parser.add_argument('--base-url', default='', help="Prefix for relative media URLs, e.g. https://api.example.com")
+
+    def handle(self, *args, **options):
+        # Posts without inline images are skipped by the database, not by Python.
+        # Only uncompressed rows can be matched (blog/fields.py).
+        posts = Post.objects.filter(content__stored__contains='data:image/').only('id', 'content', 'updated_on').order_by('id')
+        total_posts = total_images = total_saved = 0
+
+        for post in posts.iterator(chunk_size=50):
+            if options['dry_run']:
+                self.stdout.write(f"Post {post.id}: {len(post.content)} bytes of content")
+                total_posts += 1
+                continue
+
+            try:
+                content, images, saved = extract_inline_images(post.content, base_url=options['base_url'].rstrip('/'))
+            except InvalidImage as e:
+                self.stderr.write(f"Post {post.id}: skipped ({e})")
+                continue
+            if not images:
+                continue
+
+            # update() keeps updated_on untouched: this is not an author edit.
+            # Matching on it too means a concurrent edit wins; the next run retries.
+            if not Post.objects.filter(pk=post.pk, updated_on=post.updated_on).update(content=content):
+                self.stderr.write(f"Post {post.id}: skipped (edited meanwhile)")
+                continue
+            update_references(post.content, content)
+            caching.invalidate(f'post:{post.id}')  # update() sends no post_save
+
+            self.stdout.write(f"Post {post.id}: {images} images, {saved} bytes saved")
+            total_posts += 1
+            total_images += images
+            total_saved += saved
+
+        if options['dry_run']:
+            self.stdout.write(f"{total_posts} posts embed inline images.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Done. {total_images} images from {total_posts} posts, {total_saved} bytes saved."
+            ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from blog.media import collect_garbage, recount_references
+
+
+class Command(BaseCommand):
+    help = "Delete uploaded images that no post references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help="Rebuild reference counts from post contents first.")
+        parser.add_argument('--grace-hours', type=int, help="Override MEDIA_GC_GRACE_HOURS.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            changed = recount_references()
+            self.stdout.write(f"Corrected {changed} reference counts.")
+
+        result = collect_garbage(options['grace_hours'], dry_run=options['dry_run'])
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(f"{verb} {result['blobs']} blobs ({result['bytes']} bytes).")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog.recommender import refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = "Rebuild stale, expired and missing precomputed recommendation lists."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild the list of every active user.")
+
+    def handle(self, *args, **options):
+        result = refresh_recommendations(full=options['full'])
+        self.stdout.write(f"Refreshed {result['refreshed']} lists ({result['failed']} failed).")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from blog.rollups import prune_interactions, rollup_pending_days
+
+
+class Command(BaseCommand):
+    help = "Roll raw interactions up into PostDailyStats, then prune expired raw rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-prune', action='store_true', help="Only roll up, keep raw rows.")
+        parser.add_argument('--retention-days', type=int, help="Override INTERACTION_RETENTION_DAYS.")
+        parser.add_argument('--history-size', type=int, help="Override INTERACTION_HISTORY_SIZE.")
+
+    def handle(self, *args, **options):
+        rolled = rollup_pending_days()
+        self.stdout.write(f"Rolled up {rolled} post-day rows.")
+
+        if not options['no_prune']:
+            pruned = prune_interactions(options['retention_days'], options['history_size'])
+            self.stdout.write(f"Pruned {pruned} raw interactions.")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
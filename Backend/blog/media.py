@@ -0,0 +1,319 @@
+"""
+Image upload pipeline.
+
+Uploads used to be stored byte-for-byte, so multi-megabyte phone photos
+ended up embedded in posts. Every image now goes through ``process_image``:
+  1. decode with Pillow and apply the EXIF orientation,
+  2. drop all metadata (EXIF, GPS, ICC, comments are simply not re-saved),
+  3. cap the longest side at IMAGE_MAX_DIMENSION,
+  4. re-encode to IMAGE_FORMAT (WebP, or JPEG) at IMAGE_QUALITY,
+  5. store one file per width in IMAGE_VARIANT_WIDTHS narrower than the image.
+
+Decoding and storage uploads are blocking, so they run on a dedicated
+thread pool of IMAGE_WORKERS threads: the event loop never runs them and
+at most that many images are processed at once across the process.
+
+Post images are content-addressed (``store_upload``): the upload is hashed
+while it is streamed, stored as ``posts/<sha256>-<width>.<ext>`` (the
+storage backend may suffix the name) and indexed in MediaBlob. Uploading
+the same bytes again returns the existing URLs without touching storage. Reference counts follow the post contents
+(``update_references``) and ``collect_garbage`` removes blobs no post uses.
+
+Images pasted into the editor arrive as base64 ``data:`` URIs inside the
+post HTML. ``extract_inline_images`` pushes them through the same upload
+path and rewrites the HTML to the stored URLs.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from mysite import metrics
+from .fields import decompress
+
+logger = logging.getLogger(__name__)
+
+_pool = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='images')
+_lock = threading.Lock()
+_counters = {'uploads': 0, 'dedupe_hits': 0, 'bytes_saved': 0}
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+# Any stored variant URL of a content-addressed upload, wherever it is hosted:
+# .../posts/<sha256>-<width>.webp locally, .../posts/<sha256>-<width>_<suffix>
+# on Cloudinary (use_filename appends a random suffix, image URLs drop the extension)
+BLOB_REF = re.compile(r'/([0-9a-f]{64})-\d+(?:_[A-Za-z0-9]+)?(?:\.(?:webp|jpg))?')
+
+# A base64 image inside a quoted attribute value (Quill: <img src="data:image/png;base64,...">)
+DATA_URI = re.compile(r'data:image/[\w.+-]+;base64,([A-Za-z0-9+/=\s]+)(?=["\'])', re.IGNORECASE)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _decode(fileobj):
+    try:
+        image = Image.open(fileobj)
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(str(e))
+    return ImageOps.exif_transpose(image)
+
+
+def _encode(image, fmt):
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('P', 'LA') else 'RGB')
+    out = io.BytesIO()
+    # No exif/icc_profile arguments: the re-encoded file carries no metadata
+    image.save(out, format=fmt, quality=settings.IMAGE_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def process_image(fileobj, prefix, max_dimension=None, widths=None, stem=None):
+    """
+    Blocking. Returns {'url', 'name', 'width', 'height', 'srcset', 'variants'}
+    where ``url``/``name`` point to the largest stored variant.
+    """
+    max_dimension = max_dimension or settings.IMAGE_MAX_DIMENSION
+    widths = settings.IMAGE_VARIANT_WIDTHS if widths is None else widths
+    fmt = settings.IMAGE_FORMAT
+
+    image = _decode(fileobj)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    stem = f"{prefix}/{stem or uuid.uuid4().hex[:16]}"
+    sizes = sorted({w for w in widths if w < image.width} | {image.width})
+
+    variants = []
+    for width in sizes:
+        if width == image.width:
+            resized = image
+        else:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        data = _encode(resized, fmt)
+        name = default_storage.save(f"{stem}-{width}.{EXTENSIONS[fmt]}", ContentFile(data))
+        variants.append({'width': width, 'url': default_storage.url(name), 'name': name, 'bytes': len(data)})
+
+    largest = variants[-1]
+    return {
+        'url': largest['url'],
+        'name': largest['name'],
+        'width': image.width,
+        'height': image.height,
+        'srcset': srcset(variants),
+        'variants': variants,
+    }
+
+
+def process_image_blocking(fileobj, prefix, **kwargs):
+    """ From sync code: still goes through the pool so the concurrency bound holds. """
+    return _pool.submit(process_image, fileobj, prefix, **kwargs).result()
+
+
+async def aprocess_image(fileobj, prefix, **kwargs):
+    """ From async views: awaits the pool without blocking the event loop. """
+    return await asyncio.wrap_future(_pool.submit(process_image, fileobj, prefix, **kwargs))
+
+
+# ==========================================
+# CONTENT-ADDRESSED UPLOADS
+# ==========================================
+def srcset(variants):
+    return ", ".join(f"{v['url']} {v['width']}w" for v in variants)
+
+
+def _hash(fileobj):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in fileobj.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def _blob_result(blob, deduplicated):
+    return {
+        'url': blob.url,
+        'name': blob.name,
+        'width': blob.width,
+        'height': blob.height,
+        'srcset': srcset(blob.variants),
+        'variants': blob.variants,
+        'deduplicated': deduplicated,
+    }
+
+
+def _delete_files(variants):
+    for variant in variants:
+        default_storage.delete(variant['name'])
+
+
+def store_upload(fileobj, prefix):
+    """
+    Blocking. ``process_image`` behind the content-addressed MediaBlob index:
+    a known hash returns the stored blob, anything else is processed once.
+    """
+    from .models import MediaBlob
+
+    close_old_connections()
+    try:
+        sha256, size = _hash(fileobj)
+        blob = MediaBlob.objects.filter(sha256=sha256).first()
+        if blob is None:
+            result = process_image(fileobj, prefix, stem=sha256)
+            try:
+                blob = MediaBlob.objects.create(
+                    sha256=sha256, name=result['name'], url=result['url'],
+                    width=result['width'], height=result['height'],
+                    variants=result['variants'], size=size,
+                )
+                deduplicated = False
+            except IntegrityError:
+                # Same bytes uploaded concurrently: keep the winner's files
+                _delete_files(result['variants'])
+                blob = MediaBlob.objects.get(sha256=sha256)
+                deduplicated = True
+        else:
+            deduplicated = True
+    finally:
+        close_old_connections()
+
+    with _lock:
+        _counters['uploads'] += 1
+        if deduplicated:
+            _counters['dedupe_hits'] += 1
+            _counters['bytes_saved'] += sum(v['bytes'] for v in blob.variants)
+    return _blob_result(blob, deduplicated)
+
+
+async def astore_upload(fileobj, prefix):
+    return await asyncio.wrap_future(_pool.submit(store_upload, fileobj, prefix))
+
+
+# ==========================================
+# INLINE (DATA URI) IMAGES
+# ==========================================
+def has_inline_images(content):
+    return bool(content) and DATA_URI.search(content) is not None
+
+
+def strip_inline_images(content):
+    """ Text for consumers that only need the words (e.g. the AI moderation call). """
+    return DATA_URI.sub('', content or '')
+
+
+def extract_inline_images(content, prefix='posts', base_url=''):
+    """
+    Blocking. Store every data-URI image of ``content`` through the upload
+    pipeline and point the HTML at the stored URL instead (``base_url`` is
+    prepended to relative URLs, as the editor does for uploads).
+    Returns (new_content, images_extracted, bytes_saved). Raises InvalidImage.
+    """
+    if not has_inline_images(content):
+        return content, 0, 0
+
+    stored = {}
+    for match in DATA_URI.finditer(content):
+        uri = match.group(0)
+        if uri in stored:
+            continue
+        try:
+            data = base64.b64decode(re.sub(r'\s+', '', match.group(1)), validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise InvalidImage(f"Bad base64 payload: {e}")
+        url = _pool.submit(store_upload, ContentFile(data), prefix).result()['url']
+        stored[uri] = base_url + url if url.startswith('/') else url
+
+    new_content = DATA_URI.sub(lambda m: stored[m.group(0)], content)
+    return new_content, len(stored), len(content) - len(new_content)
+
+
+# ==========================================
+# REFERENCES & GARBAGE COLLECTION
+# ==========================================
+def referenced_blobs(content):
+    """ SHA-256 of every content-addressed image embedded in ``content``. """
+    return set(BLOB_REF.findall(content or ''))
+
+
+def update_references(old_content, new_content):
+    """ Adjust ref counts by the images added to / removed from one post. """
+    from .models import MediaBlob
+
+    old, new = referenced_blobs(old_content), referenced_blobs(new_content)
+    if new - old:
+        MediaBlob.objects.filter(sha256__in=new - old).update(ref_count=F('ref_count') + 1)
+    if old - new:
+        MediaBlob.objects.filter(sha256__in=old - new, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+def recount_references():
+    """ Rebuild every ref count from the post contents. Returns blobs changed. """
+    from .models import MediaBlob, Post
+
+    counts = {}
+    for content in Post.objects.values_list('content', flat=True).iterator(chunk_size=500):
+        for sha256 in referenced_blobs(decompress(content)):
+            counts[sha256] = counts.get(sha256, 0) + 1
+
+    changed = []
+    for blob in MediaBlob.objects.only('id', 'sha256', 'ref_count').iterator(chunk_size=500):
+        if blob.ref_count != counts.get(blob.sha256, 0):
+            blob.ref_count = counts.get(blob.sha256, 0)
+            changed.append(blob)
+    MediaBlob.objects.bulk_update(changed, ['ref_count'], batch_size=500)
+    return len(changed)
+
+
+def collect_garbage(grace_hours=None, dry_run=False):
+    """
+    Delete blobs no post references and that are older than the grace period
+    (a fresh upload sits at zero refs until its draft is saved).
+    Returns {'blobs': n, 'bytes': n}.
+    """
+    from .models import MediaBlob
+
+    grace_hours = settings.MEDIA_GC_GRACE_HOURS if grace_hours is None else grace_hours
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    candidates = MediaBlob.objects.filter(ref_count=0, created_at__lt=cutoff)
+
+    blobs = freed = 0
+    for blob in candidates.iterator(chunk_size=200):
+        if not dry_run:
+            # Re-check at delete time: a post may have picked it up meanwhile
+            if not MediaBlob.objects.filter(pk=blob.pk, ref_count=0).delete()[0]:
+                continue
+            _delete_files(blob.variants)
+        blobs += 1
+        freed += sum(v['bytes'] for v in blob.variants)
+
+    logger.info("media gc: %d blobs, %d bytes%s", blobs, freed, " (dry run)" if dry_run else "")
+    return {'blobs': blobs, 'bytes': freed}
+
+
+def stats():
+    with _lock:
+        return dict(_counters)
+
+
+metrics.register('media', stats)
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def tag_existing_replies(apps, schema_editor):
+    # Rows written before the digest existed only carry the rendered text
+    Notification = apps.get_model('blog', 'Notification')
+    Notification.objects.filter(text__contains=' replied to you: ').update(action='REPLY')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_remove_comment_blog_commen_post_id_fe6079_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='action',
+            field=models.CharField(choices=[('COMMENT', 'Comment'), ('REPLY', 'Reply')], default='COMMENT', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'post', 'action'], name='blog_notifi_recipie_1689fb_idx'),
+        ),
+        migrations.RunPython(tag_existing_replies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+TYPE_CODES = {'VIEW': 1, 'COMMENT': 2}
+# Written before 0009 narrowed the choices; a like implies the post was viewed
+LEGACY_TYPES = {'LIKE': 1}
+
+
+def encode_types(apps, schema_editor):
+    Interaction = apps.get_model('blog', 'Interaction')
+    codes = {**LEGACY_TYPES, **TYPE_CODES}
+    # Checked before anything is changed: the column becomes NOT NULL below
+    unknown = set(
+        Interaction.objects.exclude(interaction_type__in=codes).values_list('interaction_type', flat=True)
+    )
+    if unknown:
+        raise RuntimeError(
+            f"Interaction rows with unknown interaction_type {sorted(unknown)!r}: "
+            f"map them to one of {sorted(codes)} or delete them, then migrate again."
+        )
+    for name, code in codes.items():
+        Interaction.objects.filter(interaction_type=name).update(type_code=code)
+
+
+def decode_types(apps, schema_editor):
+    Interaction = apps.get_model('blog', 'Interaction')
+    for name, code in TYPE_CODES.items():
+        Interaction.objects.filter(type_code=code).update(interaction_type=name)
+
+
+def dedupe_interactions(apps, schema_editor):
+    # Racing get_or_create calls left duplicate (user, post, type) rows, and
+    # legacy likes now share the VIEW code. Keep the newest row of each group
+    # and give it the latest timestamp.
+    Interaction = apps.get_model('blog', 'Interaction')
+    duplicates = (
+        Interaction.objects.values('user_id', 'post_id', 'type_code')
+        .annotate(n=Count('id'), keep_id=Max('id'), last_seen=Max('date_interacted'))
+        .filter(n__gt=1)
+    )
+    for group in duplicates.iterator():
+        rows = Interaction.objects.filter(
+            user_id=group['user_id'],
+            post_id=group['post_id'],
+            type_code=group['type_code'],
+        )
+        rows.exclude(id=group['keep_id']).delete()
+        # .update() skips auto_now, so the timestamp is preserved as-is
+        rows.update(date_interacted=group['last_seen'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_notification_digest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # 1. CharField('VIEW') -> SmallInteger(1) through a temporary column
+        migrations.AddField(
+            model_name='interaction',
+            name='type_code',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(encode_types, decode_types),
+
+        # 2. Collapse duplicates so the unique constraint can be created
+        migrations.RunPython(dedupe_interactions, migrations.RunPython.noop),
+
+        # 3. The code column replaces the old one
+        migrations.RemoveIndex(
+            model_name='interaction',
+            name='blog_intera_user_id_41306e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='interaction',
+            name='blog_intera_interac_832398_idx',
+        ),
+        migrations.RemoveField(
+            model_name='interaction',
+            name='interaction_type',
+        ),
+        migrations.RenameField(
+            model_name='interaction',
+            old_name='type_code',
+            new_name='interaction_type',
+        ),
+        migrations.AlterField(
+            model_name='interaction',
+            name='interaction_type',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'View'), (2, 'Comment')]),
+        ),
+
+        # 4. Indexes for the real access patterns + the upsert target
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['user', '-date_interacted'], name='blog_intera_user_id_3032d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['post', 'interaction_type'], name='blog_intera_post_id_17f328_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='interaction',
+            constraint=models.UniqueConstraint(fields=('user', 'post', 'interaction_type'), name='unique_user_post_interaction'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:16
+
+import hashlib
+import math
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# A frozen copy of blog.sketches.HyperLogLog (format 0x01, precision 10):
+# only what seeding needs, so later changes to that module can't alter
+# what this migration writes.
+PRECISION = 10
+REGISTERS = 1 << PRECISION
+_RANK_BITS = 64 - PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+
+class HyperLogLog:
+
+    def __init__(self):
+        self.registers = bytearray(REGISTERS)
+
+    def to_bytes(self):
+        return b'\x01' + zlib.compress(bytes(self.registers))
+
+    def add(self, key):
+        h = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+        index = h >> _RANK_BITS
+        rank = _RANK_BITS - (h & ((1 << _RANK_BITS) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        zeros = self.registers.count(0)
+        estimate = _ALPHA * REGISTERS * REGISTERS / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * REGISTERS and zeros:
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+
+def seed_reader_sketches(apps, schema_editor):
+    # Logged-in readers come from the VIEW interactions; nothing has been
+    # pruned yet, since retention ships in the same release as the sketches.
+    Interaction = apps.get_model('blog', 'Interaction')
+    PostReaderSketch = apps.get_model('blog', 'PostReaderSketch')
+
+    sketches = {}
+    views = Interaction.objects.filter(interaction_type=1).values_list('post_id', 'user_id')
+    for post_id, user_id in views.iterator():
+        sketches.setdefault(post_id, HyperLogLog()).add(f"u:{user_id}")
+
+    PostReaderSketch.objects.bulk_create(
+        [
+            PostReaderSketch(post_id=post_id, registers=sketch.to_bytes(), readers=sketch.count())
+            for post_id, sketch in sketches.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_interaction_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostReaderSketch',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reader_sketch', serialize=False, to='blog.post')),
+                ('registers', models.BinaryField()),
+                ('readers', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_reader_sketches, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='postdailystats',
+            name='reader_sketch',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='postdailystats',
+            name='unique_readers',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:25
+
+import blog.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='content',
+            field=blog.fields.CompressedTextField(),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from blog.sketches import BloomFilter
+
+
+def seed_seen_filters(apps, schema_editor):
+    # Whatever interaction history is still on disk (views and comments)
+    Interaction = apps.get_model('blog', 'Interaction')
+    SeenFilter = apps.get_model('blog', 'SeenFilter')
+
+    filters = {}
+    for user_id, post_id in Interaction.objects.values_list('user_id', 'post_id').iterator():
+        filters.setdefault(user_id, [BloomFilter(), 0])
+        entry = filters[user_id]
+        entry[1] += entry[0].add(post_id)
+
+    SeenFilter.objects.bulk_create(
+        [
+            SeenFilter(user_id=user_id, bits=seen.to_bytes(), items=items)
+            for user_id, (seen, items) in filters.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('blog', '0018_compressed_post_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenFilter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seen_filter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('bits', models.BinaryField()),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_seen_filters, migrations.RunPython.noop),
+    ]
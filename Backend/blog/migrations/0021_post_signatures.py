@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from blog.related import features, pack, signature
+
+
+def seed_signatures(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    PostSignature = apps.get_model('blog', 'PostSignature')
+
+    rows = []
+    for post in Post.objects.filter(status=1).only('id', 'title', 'content', 'topic', 'tags').iterator(chunk_size=200):
+        sig = signature(features(post.title, post.content, post.topic, post.tags))
+        rows.append(PostSignature(post_id=post.id, signature=pack(sig)))
+    PostSignature.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0020_user_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSignature',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='blog.post')),
+                ('signature', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(seed_signatures, migrations.RunPython.noop),
+    ]
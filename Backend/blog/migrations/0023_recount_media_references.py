@@ -0,0 +1,34 @@
+from django.db import migrations
+
+from blog.fields import decompress
+from blog.media import referenced_blobs
+
+
+def recount_references(apps, schema_editor):
+    # Cloudinary-hosted images were not recognised before, so their ref
+    # counts stayed at 0 and gc_media would have deleted them
+    MediaBlob = apps.get_model('blog', 'MediaBlob')
+    Post = apps.get_model('blog', 'Post')
+
+    counts = {}
+    for content in Post.objects.values_list('content', flat=True).iterator(chunk_size=500):
+        for sha256 in referenced_blobs(decompress(content)):
+            counts[sha256] = counts.get(sha256, 0) + 1
+
+    changed = []
+    for blob in MediaBlob.objects.only('id', 'sha256', 'ref_count').iterator(chunk_size=500):
+        if blob.ref_count != counts.get(blob.sha256, 0):
+            blob.ref_count = counts.get(blob.sha256, 0)
+            changed.append(blob)
+    MediaBlob.objects.bulk_update(changed, ['ref_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0022_notification_actor_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_references, migrations.RunPython.noop),
+    ]
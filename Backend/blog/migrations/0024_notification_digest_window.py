@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 20:26
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_latest_digests(apps, schema_editor):
+    # Existing rows start closed; the newest unread row per key stays open
+    # so it keeps collecting, its window anchored on when it was written
+    Notification = apps.get_model('blog', 'Notification')
+
+    latest = {}
+    rows = Notification.objects.filter(is_read=False).only('id', 'recipient_id', 'post_id', 'action', 'date')
+    for notif in rows.order_by('date', 'id').iterator(chunk_size=500):
+        latest[(notif.recipient_id, notif.post_id, notif.action)] = notif
+    for notif in latest.values():
+        notif.is_open = True
+        notif.opened_at = notif.date
+    Notification.objects.bulk_update(latest.values(), ['is_open', 'opened_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0023_recount_media_references'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='is_open',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='opened_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(open_latest_digests, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='notification',
+            name='is_open',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_open', True), ('is_read', False)), fields=('recipient', 'post', 'action'), name='unique_open_notification_digest'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 20:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0024_notification_digest_window'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='interaction',
+            name='date_interacted',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0025_interaction_event_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobcheckpoint',
+            name='lease_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='jobcheckpoint',
+            name='owner',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
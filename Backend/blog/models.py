@@ -2,6 +2,8 @@ from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .fields import CompressedTextField
+
 # Choices
 STATUS_CHOICES = ((0, 'Draft'), (1, 'Published'))
 
@@ -17,7 +19,7 @@ class PublishedManager(models.Manager):
 
 class Post(models.Model):
     title = models.CharField(max_length=100)
-    content = models.TextField()
+    content = CompressedTextField()  # Plain text column, see blog/fields.py
     date_posted = models.DateTimeField(default=timezone.now)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     status = models.IntegerField(choices=STATUS_CHOICES, default=0) 
@@ -82,39 +84,184 @@ class Comment(models.Model):
 
 
 class Interaction(models.Model):
+    # Stored as a small integer: this table has a row per reader per post
+    VIEW = 1
+    COMMENT = 2
     INTERACTION_TYPES = (
-        ('VIEW', 'View'),              
-        ('COMMENT', 'Comment'), 
+        (VIEW, 'View'),
+        (COMMENT, 'Comment'),
     )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='interactions')
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='interactions')
-    interaction_type = models.CharField(max_length=10, choices=INTERACTION_TYPES)
-    date_interacted = models.DateTimeField(auto_now=True) # Updates automatically on every view
+    interaction_type = models.PositiveSmallIntegerField(choices=INTERACTION_TYPES)
+    date_interacted = models.DateTimeField(default=timezone.now) # Time of the latest view, set by the view buffer
 
     class Meta:
-
-        # 1. Fast lookup: "Has User X seen Post Y?"
-        # 2. Fast lookup: "Get all interactions of type VIEW"
+        # 1. One row per (user, post, type): writes are upserts (ON CONFLICT DO UPDATE)
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post', 'interaction_type'], name='unique_user_post_interaction'),
+        ]
+        # 2. Fast lookup: "Last N interactions of User X" (feed + recommendations)
+        # 3. Fast lookup: "VIEW rows of Post Y" (view counts)
         indexes = [
-            models.Index(fields=['user', 'post']),
-            models.Index(fields=['interaction_type']), 
+            models.Index(fields=['user', '-date_interacted']),
+            models.Index(fields=['post', 'interaction_type']),
         ]
         
     def __str__(self):
-        return f"{self.user.username} {self.interaction_type} {self.post.title}"
+        return f"{self.user.username} {self.get_interaction_type_display()} {self.post.title}"
     
 
 
+class PostDailyStats(models.Model):
+    """ Per-post, per-day rollup of raw interactions. Feeds author analytics. """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)     # Logged-in views that day, added at flush
+    comments = models.PositiveIntegerField(default=0)  # Comments posted that day
+
+    # Distinct readers that day, anonymous ones included (blog/sketches.py)
+    reader_sketch = models.BinaryField(null=True, blank=True)
+    unique_readers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='unique_post_day_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.post.title} {self.day}: {self.views} views, {self.comments} comments"
+
+
+class PostReaderSketch(models.Model):
+    """
+    Lifetime distinct readers of a post (logged-in and anonymous), as a
+    HyperLogLog sketch. ``readers`` caches the estimate so the feed can
+    sort and display it with a plain join.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='reader_sketch')
+    registers = models.BinaryField()
+    readers = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"~{self.readers} readers of {self.post_id}"
+
+
+class SeenFilter(models.Model):
+    """
+    Every post a user has read or dismissed, as a fixed-size Bloom filter
+    (blog/sketches.py). Recommendations test candidates against it in memory.
+    ``items`` counts the ids added, to watch the filter's fill level.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='seen_filter')
+    bits = models.BinaryField()
+    items = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.items} posts seen by {self.user_id}"
+
+
+class UserRecommendations(models.Model):
+    """
+    Precomputed top candidates for one user (blog/recommender.py).
+    ``entries`` packs (post id, relevance) pairs, 5 bytes each, best first.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='recommendations')
+    label = models.CharField(max_length=20)
+    entries = models.BinaryField()
+    stale = models.BooleanField(default=False)  # New interactions since computed_at
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.label} for {self.user_id} ({len(self.entries) // 5} posts)"
+
+
+class PostSignature(models.Model):
+    """ MinHash signature of a published post, the source of the related-posts index (blog/related.py). """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    signature = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Workers sync what changed since
+
+    def __str__(self):
+        return f"Signature of {self.post_id}"
+
+
+class JobCheckpoint(models.Model):
+    """ Progress marker for resumable background jobs, one row per job name. """
+    name = models.CharField(max_length=50, unique=True)
+    cursor = models.CharField(max_length=100, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Lease held by the run in progress, in any process (mysite/jobs.py)
+    owner = models.CharField(max_length=32, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.cursor}"
+
+
+class MediaBlob(models.Model):
+    """
+    Content-addressed index of processed uploads (see blog/media.py).
+    Files are named after the SHA-256 of the original upload, so the same
+    image is stored once. ``ref_count`` is the number of posts embedding it.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)  # Largest variant
+    url = models.CharField(max_length=500)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    variants = models.JSONField(default=list)
+    size = models.PositiveIntegerField()  # Bytes of the original upload
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'created_at']), # Garbage collection scan
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+
 class Notification(models.Model):
+    ACTIONS = (
+        ('COMMENT', 'Comment'),
+        ('REPLY', 'Reply'),
+    )
+    VERBS = {'COMMENT': 'commented on', 'REPLY': 'replied to you'}
+
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     text = models.CharField(max_length=255)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True)
     is_read = models.BooleanField(default=False)
     date = models.DateTimeField(auto_now_add=True)
 
+    # DIGEST: One row per (recipient, post, action) while unread
+    action = models.CharField(max_length=10, choices=ACTIONS, default='COMMENT')
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    actor_count = models.PositiveIntegerField(default=1)
+    actor_ids = models.JSONField(default=list, blank=True) # Distinct actors so far, actor_count == len()
+    opened_at = models.DateTimeField(default=timezone.now) # First event; the window runs from here
+    is_open = models.BooleanField(default=True) # Cleared once the window has passed
+
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['recipient', 'post', 'action']), # Fast open-digest lookup
+        ]
+        constraints = [
+            # At most one digest per key collecting events, whichever worker gets there first
+            models.UniqueConstraint(
+                fields=['recipient', 'post', 'action'],
+                condition=models.Q(is_open=True, is_read=False),
+                name='unique_open_notification_digest',
+            ),
+        ]
 
     def __str__(self):
         return f"Notif for {self.recipient}: {self.text}"
\ No newline at end of file
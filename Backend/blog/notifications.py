@@ -0,0 +1,118 @@
+"""
+Coalesced comment notifications.
+
+Instead of one Notification row per comment, events are grouped per
+(recipient, post, action). While the recipient's digest for that group is
+unread and its first event is younger than NOTIFICATION_DIGEST_WINDOW, new
+activity updates it in place ("alice and 12 others commented on: ...").
+Writes happen off the request path through a write-behind buffer.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from mysite.buffers import WriteBehindBuffer
+from .models import Notification, Post
+
+
+def notification_text(actor_name, actor_count, action, post_title):
+    verb = Notification.VERBS.get(action, action)
+    others = actor_count - 1
+    if others == 1:
+        who = f"{actor_name} and 1 other"
+    elif others > 1:
+        who = f"{actor_name} and {others} others"
+    else:
+        who = actor_name
+    return f"{who} {verb}: {post_title[:20]}..."
+
+
+class NotificationBuffer(WriteBehindBuffer):
+    """
+    Key:   (recipient_id, post_id, action)
+    Value: list of actor ids in arrival order (latest last, no duplicates)
+    """
+    name = 'notifications'
+
+    def merge(self, pending, item):
+        return [a for a in pending if a not in item] + item
+
+    def write(self, batch):
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW)
+
+        recipient_ids = {key[0] for key in batch}
+        post_ids = {key[1] for key in batch}
+        actor_ids = {a for actors in batch.values() for a in actors}
+
+        # 1. Names and titles in two queries for the whole batch
+        usernames = dict(
+            User.objects.filter(id__in=actor_ids | recipient_ids).values_list('id', 'username')
+        )
+        titles = dict(Post.objects.filter(id__in=post_ids).values_list('id', 'title'))
+
+        events = {}
+        for (recipient_id, post_id, action), actors in batch.items():
+            # Recipient or post deleted while the event was queued
+            if recipient_id not in usernames or post_id not in titles:
+                continue
+            actors = [a for a in actors if a in usernames]
+            if actors:
+                events[(recipient_id, post_id, action)] = actors
+        if not events:
+            return
+
+        keys = Notification.objects.filter(
+            recipient_id__in={key[0] for key in events},
+            post_id__in={key[1] for key in events},
+            is_read=False,
+        )
+        with transaction.atomic():
+            # 2. Close digests whose window, counted from their first event, has passed
+            keys.filter(is_open=True, opened_at__lt=cutoff).update(is_open=False)
+
+            # 3. An empty open digest for every key that lacks one. The unique
+            #    constraint turns a row another worker just created into a no-op.
+            Notification.objects.bulk_create(
+                [
+                    Notification(recipient_id=recipient_id, post_id=post_id, action=action,
+                                 actor_count=0, opened_at=now)
+                    for recipient_id, post_id, action in events
+                ],
+                ignore_conflicts=True,
+            )
+
+            # 4. Lock the open digests and merge the new actors in
+            to_update = []
+            for notif in keys.filter(is_open=True).select_for_update():
+                actors = events.get((notif.recipient_id, notif.post_id, notif.action))
+                if not actors:
+                    continue
+                # Rows from before actor_ids only know their latest actor, if any
+                seen = [a for a in notif.actor_ids or [notif.actor_id] if a is not None]
+                new = [a for a in actors if a not in seen]
+                notif.actor_ids = seen + new
+                notif.actor_count += len(new)
+                notif.actor_id = actors[-1]
+                notif.date = now
+                notif.text = notification_text(
+                    usernames[actors[-1]], notif.actor_count, notif.action, titles[notif.post_id]
+                )
+                to_update.append(notif)
+            Notification.objects.bulk_update(
+                to_update, ['actor', 'actor_count', 'actor_ids', 'date', 'text']
+            )
+
+
+notification_buffer = NotificationBuffer()
+
+
+def queue_notification(recipient_id, post_id, action, actor_id):
+    """ Queue an event once the surrounding transaction (if any) commits. """
+    transaction.on_commit(
+        lambda: notification_buffer.add((recipient_id, post_id, action), [actor_id])
+    )
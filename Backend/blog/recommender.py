@@ -0,0 +1,268 @@
+"""
+Recommendation engine.
+
+Scoring a user means up to three annotated queries (relevance-scored
+"For You", a "Top Picks" aggregate over all posts, newest posts), far too
+much for every page view. ``refresh_recommendations`` runs that scoring
+off the request path and keeps the top RECOMMENDATION_TOP_K candidates per
+active user in UserRecommendations, packed as (post id, relevance) pairs.
+
+The endpoint (``serve``) reads that one row, drops what the user has seen
+since (Bloom filter, blog/seen.py) and loads the posts. Only a missing or
+used-up list falls back to live scoring, whose result is stored for the
+next request.
+
+Lists are marked stale when the user reads something (view flusher) or
+changes their interests, and the refresh job recomputes stale lists, lists
+older than RECOMMENDATION_MAX_AGE_HOURS (new posts) and lists missing for
+users active within RECOMMENDATION_ACTIVE_DAYS.
+"""
+
+import logging
+import struct
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Case, Count, Exists, F, FloatField, IntegerField, OuterRef, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Bookmark, Interaction, Post, UserRecommendations
+from .seen import CANDIDATE_SCAN, aload_seen, load_seen
+
+logger = logging.getLogger(__name__)
+
+FOR_YOU = 'For You'
+TOP_PICKS = 'Top Picks'
+# How many posts the endpoint returns per label
+DISPLAY = {FOR_YOU: 8, TOP_PICKS: 32}
+
+_ENTRY = struct.Struct('<IB')  # post id, relevance
+
+
+def pack(entries):
+    return b''.join(_ENTRY.pack(post_id, relevance) for post_id, relevance in entries)
+
+
+def unpack(data):
+    return list(_ENTRY.iter_unpack(bytes(data or b'')))
+
+
+def with_stats(queryset):
+    """ The read-only numbers PostSerializer shows on a card. """
+    return queryset.annotate(
+        views=Coalesce('reader_sketch__readers', 0),
+        total_comments=Count('comments', distinct=True),
+        op_replies=Count('comments', filter=Q(comments__author=F('author')), distinct=True),
+    ).annotate(
+        quality_ratio=Case(
+            When(total_comments=0, then=Value(0.0)),
+            default=F('op_replies') * 1.0 / F('total_comments'),
+            output_field=FloatField()
+        )
+    )
+
+
+def with_viewer_state(queryset, user):
+    """ Per-viewer flags PostSerializer shows, as subqueries of the same SELECT. """
+    if not user.is_authenticated:
+        return queryset.annotate(viewer_bookmarked=Value(False))
+    return queryset.annotate(
+        viewer_bookmarked=Exists(Bookmark.objects.filter(user=user, post=OuterRef('pk'))),
+    )
+
+
+# ==========================================
+# SCORING
+# ==========================================
+def rank(user, limit=None, recent_limit=50):
+    """
+    Live scoring. Returns (label, [(post_id, relevance), ...]) with at most
+    ``limit`` unseen candidates, best first.
+    """
+    limit = limit or settings.RECOMMENDATION_TOP_K
+
+    # 1. LEARNING (Get User Interests)
+    try:
+        explicit_topics = [x.strip() for x in user.profile.interests.split(',') if x.strip()]
+    except Exception:
+        explicit_topics = []
+
+    # Get recent interactions to find implied interests
+    recent_interactions = Interaction.objects.filter(user=user).select_related('post').order_by('-date_interacted')[:recent_limit]
+
+    clicked_topics = set()
+    clicked_tags = set()
+    viewed_ids = set()
+
+    for interaction in recent_interactions:
+        post = interaction.post
+        viewed_ids.add(post.id)
+        clicked_topics.add(post.topic)
+        if post.tags:
+            tags = [t.strip().lower() for t in post.tags.split(',') if t.strip()]
+            clicked_tags.update(tags)
+
+    all_interested_topics = list(set(explicit_topics) | clicked_topics)
+
+    # Everything they've read or dismissed (whole history, Bloom filter), plus
+    # the latest views that may not be flushed into it yet
+    seen = load_seen(user.id)
+    for post_id in viewed_ids:
+        seen.add(post_id)
+
+    # 2. SCORING (Seen posts are filtered out in memory, see blog/seen.py)
+    queryset = Post.published.exclude(author=user)
+
+    tag_query = Q()
+    for tag in clicked_tags:
+        tag_query |= Q(tags__icontains=tag)
+
+    # Build Scoring Conditions
+    relevance_conditions = []
+    if tag_query:
+        relevance_conditions.append(When(tag_query, then=Value(5))) # High Priority (Tags)
+
+    relevance_conditions.append(When(topic__in=all_interested_topics, then=Value(2))) # Medium Priority (Topics)
+
+    recs = queryset.annotate(
+        relevance=Case(
+            *relevance_conditions,
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    ).annotate(
+        total_comments=Count('comments', distinct=True),
+        op_replies=Count('comments', filter=Q(comments__author=F('author')), distinct=True),
+    ).annotate(
+        quality_ratio=Case(
+            When(total_comments=0, then=Value(0.0)),
+            default=F('op_replies') * 1.0 / F('total_comments'),
+            output_field=FloatField()
+        )
+    )
+
+    # 3. RANKING (Updated Order)
+    # Priority 1: Relevance Score
+    # Priority 2: Date Posted (Newest First)
+    # Priority 3: Quality Ratio (Tie-breaker)
+    ranked = recs.filter(relevance__gt=0).order_by('-relevance', '-date_posted', '-quality_ratio')
+    entries = [
+        (post_id, relevance)
+        for post_id, relevance in ranked.values_list('id', 'relevance')[:CANDIDATE_SCAN]
+        if post_id not in seen
+    ][:limit]
+    if entries:
+        return FOR_YOU, entries
+
+    top_picks = with_stats(Post.published.exclude(author=user)).order_by('-quality_ratio', '-views')
+    entries = [(post_id, 0) for post_id in top_picks.values_list('id', flat=True)[:CANDIDATE_SCAN] if post_id not in seen][:limit]
+    if entries:
+        return TOP_PICKS, entries
+
+    # If Attempt 3 returned empty (e.g. math fail), just grab the newest posts.
+    newest = Post.published.exclude(author=user).order_by('-date_posted').values_list('id', flat=True)[:DISPLAY[TOP_PICKS]]
+    return TOP_PICKS, [(post_id, 0) for post_id in newest]
+
+
+def store(user_id, label, entries):
+    UserRecommendations.objects.update_or_create(
+        user_id=user_id,
+        defaults={'label': label, 'entries': pack(entries), 'stale': False},
+    )
+
+
+# ==========================================
+# SERVING
+# ==========================================
+def _load(entries, label):
+    """ Posts for the first DISPLAY[label] entries, in list order, relevance attached. """
+    entries = entries[:DISPLAY[label]]
+    posts = with_stats(Post.published.select_related('author__profile')).in_bulk([post_id for post_id, _ in entries])
+    return _in_order(entries, posts)
+
+
+async def _aload(entries, label):
+    entries = entries[:DISPLAY[label]]
+    queryset = with_stats(Post.published.select_related('author__profile')).filter(id__in=[post_id for post_id, _ in entries])
+    return _in_order(entries, {post.id: post async for post in queryset})
+
+
+def _in_order(entries, posts):
+    result = []
+    for post_id, relevance in entries:
+        post = posts.get(post_id)
+        if post is not None:  # Unpublished or deleted since the list was built
+            post.relevance = relevance
+            result.append(post)
+    return result
+
+
+def serve(user):
+    """ Returns (label, posts). Precomputed list if there is one, live scoring otherwise. """
+    row = UserRecommendations.objects.filter(user_id=user.id).first()
+    if row is not None:
+        seen = load_seen(user.id)
+        entries = [(post_id, relevance) for post_id, relevance in unpack(row.entries) if post_id not in seen]
+        posts = _load(entries, row.label)
+        if posts:
+            return row.label, posts
+
+    return _rescore(user)
+
+
+def _rescore(user):
+    label, entries = rank(user)
+    store(user.id, label, entries)
+    return label, _load(entries, label)
+
+
+async def aserve(user):
+    """ serve() for async views: the stored list is read with the async ORM. """
+    row = await UserRecommendations.objects.filter(user_id=user.id).afirst()
+    if row is not None:
+        seen = await aload_seen(user.id)
+        entries = [(post_id, relevance) for post_id, relevance in unpack(row.entries) if post_id not in seen]
+        posts = await _aload(entries, row.label)
+        if posts:
+            return row.label, posts
+
+    # Live scoring is a handful of dependent queries: one thread hop for all of them
+    return await sync_to_async(_rescore)(user)
+
+
+# ==========================================
+# BATCH REFRESH
+# ==========================================
+def mark_stale(user_ids):
+    UserRecommendations.objects.filter(user_id__in=user_ids, stale=False).update(stale=True)
+
+
+def users_to_refresh(full=False):
+    if full:
+        return User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)
+
+    now = timezone.now()
+    active_since = now - timedelta(days=settings.RECOMMENDATION_ACTIVE_DAYS)
+    expired = now - timedelta(hours=settings.RECOMMENDATION_MAX_AGE_HOURS)
+    return User.objects.filter(is_active=True).filter(
+        Q(recommendations__stale=True)
+        | Q(recommendations__computed_at__lt=expired)
+        | (Q(recommendations__isnull=True) & (Q(last_login__gte=active_since) | Q(interactions__date_interacted__gte=active_since)))
+    ).distinct().order_by('id').values_list('id', flat=True)
+
+
+def refresh_recommendations(full=False):
+    """ Recompute the lists that need it. Returns {'refreshed': n, 'failed': n}. """
+    refreshed = failed = 0
+    for user in User.objects.filter(id__in=list(users_to_refresh(full))).select_related('profile').iterator(chunk_size=200):
+        try:
+            label, entries = rank(user)
+            store(user.id, label, entries)
+            refreshed += 1
+        except Exception:
+            logger.exception("recommendations: refresh failed for user %s", user.id)
+            failed += 1
+    return {'refreshed': refreshed, 'failed': failed}
@@ -0,0 +1,216 @@
+"""
+Related posts ("more like this").
+
+Every published post gets a MinHash signature over its topic, its tags and
+the word 3-shingles of its plain text, computed when the post is saved and
+stored in PostSignature. Each process keeps an LSH index of those
+signatures in memory: SIGNATURE_SIZE slots cut into BANDS bands, a band
+being a dict bucket. Posts that share any bucket are candidates, ranked by
+the fraction of equal slots (the Jaccard similarity estimate).
+
+Bands of ROWS slots make two posts with ~50% similar features collide with
+~50% probability, ~80% similar ones almost always. A lookup touches BANDS
+buckets and a handful of candidates, so it costs microseconds.
+
+Saves and deletes in this process update the index once committed; changes
+made by other workers are pulled in at most every RELATED_INDEX_SYNC seconds.
+Each pull compares the indexed ids with the table's, so posts unpublished
+or deleted elsewhere drop out and rows committed late are picked up, and
+reloads the signatures changed since the previous pull. Results are
+hydrated from ``Post.published``, so a post unpublished or deleted
+elsewhere never shows up in the meantime.
+"""
+
+import hashlib
+import re
+import struct
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from mysite import metrics
+from .models import PostSignature
+
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+SHINGLE_WORDS = 3
+MAX_WORDS = 3000  # Long posts: the opening is representative enough
+# updated_at is the writer's clock when it saved, not when it committed:
+# each pull reaches this many seconds back into the previous one
+SYNC_OVERLAP = 60
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_SIGNATURE = struct.Struct(f'<{SIGNATURE_SIZE}I')
+
+# Fixed (seeded) permutations: signatures stay comparable across processes and restarts
+_seed = hashlib.blake2b(b'related-posts', digest_size=64).digest()
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(_seed + bytes([i, 0]), digest_size=8).digest(), 'big') % _PRIME | 1,
+        int.from_bytes(hashlib.blake2b(_seed + bytes([i, 1]), digest_size=8).digest(), 'big') % _PRIME,
+    )
+    for i in range(SIGNATURE_SIZE)
+]
+
+_WORD = re.compile(r'\w+')
+
+
+def features(title, content, topic, tags):
+    words = _WORD.findall(f"{title} {strip_tags(content or '')}".lower())[:MAX_WORDS]
+    found = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+    found.add(f"#topic:{topic}")
+    # Tags count double: they are the author's own statement of what the post is about
+    for tag in (tags or '').split(','):
+        tag = tag.strip().lstrip('#').lower()
+        if tag:
+            found.update((f"#tag:{tag}", f"#tag2:{tag}"))
+    return found
+
+
+def signature(feature_set):
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), 'big') for f in feature_set]
+    return tuple(
+        min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    )
+
+
+def post_signature(post):
+    return signature(features(post.title, post.content, post.topic, post.tags))
+
+
+def pack(sig):
+    return _SIGNATURE.pack(*sig)
+
+
+def unpack(data):
+    return _SIGNATURE.unpack(bytes(data))
+
+
+def similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+# ==========================================
+# IN-MEMORY LSH INDEX
+# ==========================================
+class RelatedIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signatures = {}
+        self._buckets = defaultdict(set)
+        self._loaded = False
+        self._synced_at = None  # Wall-clock start of the last sync
+        self._checked = 0.0     # Monotonic time of the last sync
+        self._counters = {'lookups': 0, 'syncs': 0, 'dropped': 0}
+
+    @staticmethod
+    def _bands(sig):
+        return [(band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def _put(self, post_id, sig):
+        self._drop(post_id)
+        self._signatures[post_id] = sig
+        for key in self._bands(sig):
+            self._buckets[key].add(post_id)
+
+    def _drop(self, post_id):
+        sig = self._signatures.pop(post_id, None)
+        if sig is None:
+            return
+        for key in self._bands(sig):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(post_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _sync(self):
+        """ Load everything once, then reconcile the id set and reload recent changes. """
+        now = time.monotonic()
+        if self._loaded and now - self._checked < settings.RELATED_INDEX_SYNC:
+            return
+        started = timezone.now()
+        rows = PostSignature.objects.all()
+        stored = None
+        if self._loaded:
+            stored = set(PostSignature.objects.values_list('post_id', flat=True))
+            with self._lock:
+                missing = stored.difference(self._signatures)
+            changed = Q(updated_at__gte=self._synced_at - timedelta(seconds=SYNC_OVERLAP))
+            rows = rows.filter(changed | Q(post_id__in=missing)) if missing else rows.filter(changed)
+        rows = list(rows.values_list('post_id', 'signature'))
+        with self._lock:
+            if stored is not None:
+                # Unpublished or deleted in another worker
+                gone = [post_id for post_id in self._signatures if post_id not in stored]
+                for post_id in gone:
+                    self._drop(post_id)
+                self._counters['dropped'] += len(gone)
+            for post_id, data in rows:
+                self._put(post_id, unpack(data))
+            self._loaded = True
+            self._synced_at = started
+            self._checked = now
+            self._counters['syncs'] += 1
+
+    def update(self, post_id, sig):
+        with self._lock:
+            self._put(post_id, sig)
+
+    def remove(self, post_id):
+        with self._lock:
+            self._drop(post_id)
+
+    def similar(self, post_id, limit):
+        """ [(post_id, similarity), ...] best first, excluding ``post_id`` itself. """
+        self._sync()
+        with self._lock:
+            self._counters['lookups'] += 1
+            sig = self._signatures.get(post_id)
+            if sig is None:
+                return []
+            candidates = set()
+            for key in self._bands(sig):
+                candidates |= self._buckets.get(key, set())
+            candidates.discard(post_id)
+            scored = [(other, similarity(sig, self._signatures[other])) for other in candidates]
+        scored.sort(key=lambda item: (-item[1], -item[0]))
+        return scored[:limit]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, posts=len(self._signatures), buckets=len(self._buckets))
+
+
+index = RelatedIndex()
+metrics.register('related_index', index.stats)
+
+
+# ==========================================
+# WRITE PATH (called from blog/signals.py)
+# ==========================================
+def index_post(post):
+    """ Published posts get a (re)computed signature; anything else leaves the index. """
+    if post.status != 1:
+        unindex_post(post.pk)
+        return
+    sig = post_signature(post)
+    PostSignature.objects.update_or_create(post_id=post.pk, defaults={'signature': pack(sig)})
+    # The in-memory index follows only committed changes
+    transaction.on_commit(lambda: index.update(post.pk, sig))
+
+
+def unindex_post(post_id):
+    PostSignature.objects.filter(post_id=post_id).delete()
+    transaction.on_commit(lambda: index.remove(post_id))
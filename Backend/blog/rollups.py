@@ -0,0 +1,140 @@
+"""
+Interaction rollups and retention.
+
+``Interaction`` gets a row per reader per post, and nothing ever removed
+them. ``PostDailyStats`` keeps one row per post per day: views are added
+by the view flusher as they are written, the rollup job fills in the
+comment counts and then prunes raw rows older than the retention horizon,
+keeping each user's most recent INTERACTION_HISTORY_SIZE rows because the
+feed and recommendations still read "last N interactions" from them.
+
+Days are rolled up once they are closed; today is rolled up on every run
+as a partial day. The last closed day is stored in ``JobCheckpoint`` so a
+run that dies half way simply picks up again. Closed days are not rolled
+up again, so deleting a comment takes it off its day's count directly.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Comment, Interaction, JobCheckpoint, PostDailyStats
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = 'interaction_rollup'
+PRUNE_CHUNK = 5000
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def rollup_day(day):
+    """ (Re)compute the rolled-up columns of one day's PostDailyStats rows. Returns the row count. """
+    start, end = _day_bounds(day)
+
+    # Views are not rolled up: Interaction keeps one row per reader, moved to
+    # their latest view, so the flusher counts them per day instead (blog/tracking.py)
+    comments = (
+        Comment.objects.filter(date_posted__gte=start, date_posted__lt=end)
+        .values('post_id')
+        .annotate(n=Count('id'))
+    )
+    rows = [PostDailyStats(post_id=row['post_id'], day=day, comments=row['n']) for row in comments]
+
+    PostDailyStats.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['post', 'day'],
+        update_fields=['comments'],
+    )
+    # Posts whose comments that day have all been deleted since the last run
+    PostDailyStats.objects.filter(day=day, comments__gt=0).exclude(
+        post_id__in=[row.post_id for row in rows]
+    ).update(comments=0)
+    return len(rows)
+
+
+def uncount_comment(post_id, date_posted):
+    """
+    Take a deleted comment off its day's count. If that day gets rolled up
+    again (today, or a day past the checkpoint), the recount overrides this.
+    """
+    PostDailyStats.objects.filter(
+        post_id=post_id, day=timezone.localdate(date_posted), comments__gt=0,
+    ).update(comments=F('comments') - 1)
+
+
+def rollup_pending_days():
+    """ Roll up every day since the checkpoint, up to and including today. """
+    today = timezone.localdate()
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+
+    if checkpoint.cursor:
+        day = datetime.strptime(checkpoint.cursor, '%Y-%m-%d').date() + timedelta(days=1)
+    else:
+        oldest = Interaction.objects.order_by('date_interacted').values_list('date_interacted', flat=True).first()
+        day = timezone.localdate(oldest) if oldest else today
+
+    rolled = 0
+    while day <= today:
+        rolled += rollup_day(day)
+        if day < today:
+            # Only closed days move the checkpoint; today is redone next run
+            checkpoint.cursor = day.isoformat()
+            checkpoint.save(update_fields=['cursor', 'updated_at'])
+        day += timedelta(days=1)
+    return rolled
+
+
+def prune_interactions(retention_days=None, history_size=None):
+    """
+    Delete raw interactions older than the retention horizon, except each
+    user's most recent ``history_size`` rows. Lifetime view counts are
+    unaffected: they come from PostReaderSketch, not from these rows.
+    """
+    if retention_days is None:
+        retention_days = settings.INTERACTION_RETENTION_DAYS
+    if history_size is None:
+        history_size = settings.INTERACTION_HISTORY_SIZE
+
+    # Never prune anything the rollup hasn't seen yet
+    checkpoint = JobCheckpoint.objects.filter(name=CHECKPOINT).values_list('cursor', flat=True).first()
+    if not checkpoint:
+        return 0
+    rolled_until, _ = _day_bounds(datetime.strptime(checkpoint, '%Y-%m-%d').date() + timedelta(days=1))
+    cutoff = min(timezone.now() - timedelta(days=retention_days), rolled_until)
+
+    # Rank over ALL of a user's rows, then apply the age filter outside,
+    # otherwise the window would only rank the already-old rows
+    beyond_history = (
+        Interaction.objects.annotate(
+            recency=Window(RowNumber(), partition_by=F('user_id'), order_by=F('date_interacted').desc())
+        )
+        .filter(recency__gt=history_size)
+        .values('id')
+    )
+    expired = Interaction.objects.filter(
+        id__in=beyond_history, date_interacted__lt=cutoff
+    ).values_list('id', flat=True)
+
+    pruned = 0
+    while True:
+        ids = list(expired[:PRUNE_CHUNK])
+        if not ids:
+            break
+        pruned += Interaction.objects.filter(id__in=ids).delete()[0]
+    return pruned
+
+
+def run_rollup(prune=True):
+    rolled = rollup_pending_days()
+    pruned = prune_interactions() if prune else 0
+    logger.info("interaction rollup: %d daily rows written, %d raw rows pruned", rolled, pruned)
+    return {'rolled_up': rolled, 'pruned': pruned}
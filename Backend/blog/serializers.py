@@ -1,11 +1,21 @@
 from rest_framework import serializers
 from .models import Post, Comment, Notification
+from .media import InvalidImage, extract_inline_images, update_references
+import logging
 import requests
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 # ==========================================
 # POST SERIALIZER
 # ==========================================
+TOPIC_NAMES = {
+    'TECH': 'Technology', 'PHIL': 'Philosophy',
+    'SCI': 'Science', 'SOC': 'Society',
+    'ART': 'Art & Culture', 'LIFE': 'Life & Self'
+}
+
 
 class PostSerializer(serializers.ModelSerializer):
     # === FIELDS ===
@@ -36,12 +46,7 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'date_posted']
 
     def get_topic_name(self, obj):
-        TOPIC_MAP = {
-            'TECH': 'Technology', 'PHIL': 'Philosophy',
-            'SCI': 'Science', 'SOC': 'Society',
-            'ART': 'Art & Culture', 'LIFE': 'Life & Self'
-        }
-        return TOPIC_MAP.get(obj.topic, obj.topic)
+        return TOPIC_NAMES.get(obj.topic, obj.topic)
 
     # === SOFT DELETE LOGIC FOR IMAGE ===
     def get_author_image(self, obj):
@@ -55,6 +60,9 @@ class PostSerializer(serializers.ModelSerializer):
 
     # === CHECK IF USER BOOKMARKED THIS POST ===
     def get_is_bookmarked(self, obj):
+        # Annotated by the detail view (recommender.with_viewer_state): no extra query
+        if hasattr(obj, 'viewer_bookmarked'):
+            return obj.viewer_bookmarked
         user = self.context.get('request').user
         if user.is_authenticated:
             from .models import Bookmark 
@@ -77,17 +85,39 @@ class PostSerializer(serializers.ModelSerializer):
             
         return ret
 
+    # === INLINE IMAGES -> STORAGE ===
+    def _offload_inline_images(self, validated_data):
+        # Pasted images arrive as base64 data URIs; store them like uploads
+        if 'content' not in validated_data:
+            return
+        request = self.context.get('request')
+        base_url = request.build_absolute_uri('/').rstrip('/') if request else ''
+        try:
+            content, images, saved = extract_inline_images(validated_data['content'], base_url=base_url)
+        except InvalidImage:
+            raise serializers.ValidationError({'content': "Unsupported or corrupt inline image."})
+        if images:
+            logger.info("offloaded %d inline images, %d bytes saved", images, saved)
+            validated_data['content'] = content
+
     def create(self, validated_data):
+        self._offload_inline_images(validated_data)
         if 'tags' in validated_data:
             tags_list = validated_data.pop('tags')
             validated_data['tags'] = ",".join(tags_list)
-        return super().create(validated_data)
+        post = super().create(validated_data)
+        update_references('', post.content) # Uploaded images now in use
+        return post
 
     def update(self, instance, validated_data):
+        self._offload_inline_images(validated_data)
         if 'tags' in validated_data:
             tags_list = validated_data.pop('tags')
             validated_data['tags'] = ",".join(tags_list)
-        return super().update(instance, validated_data)
+        old_content = instance.content
+        post = super().update(instance, validated_data)
+        update_references(old_content, post.content)
+        return post
 
 # ==========================================
 # COMMENT SERIALIZER
@@ -175,8 +205,95 @@ class CommentSerializer(serializers.ModelSerializer):
 
 
 class NotificationSerializer(serializers.ModelSerializer):
-    post_id = serializers.IntegerField(source='post.id', read_only=True)
+    post_id = serializers.IntegerField(read_only=True)  # FK column: no Post fetch per row
 
     class Meta:
         model = Notification
-        fields = ['id', 'text', 'post_id', 'is_read', 'date']
\ No newline at end of file
+        fields = ['id', 'text', 'post_id', 'is_read', 'date', 'action', 'actor_count']
+
+
+# ==========================================
+# FLAT RENDERING (READ-ONLY LISTS)
+# ==========================================
+# The same dicts PostSerializer / CommentSerializer produce for reading,
+# built with plain attribute access: no field binding, no per-row method
+# dispatch. Rows must come with author__profile selected (and replies
+# prefetched for comments), as the list views already do. Any change to
+# the serializers above must be mirrored here; blog/tests.py compares both.
+_DATETIME = serializers.DateTimeField()
+_POST_STATS = (('views', int), ('total_comments', int), ('quality_ratio', float), ('relevance', int))
+
+
+def _author_card(author):
+    """ (masked, image url) as the serializers show an author. """
+    profile = getattr(author, 'profile', None)
+    if profile is None:
+        return False, None
+    if profile.is_soft_deleted:
+        return True, None
+    return False, profile.image.url if profile.image else None
+
+
+def _split_tags(tags):
+    if isinstance(tags, str) and tags:
+        return [t.strip() for t in tags.split(',') if t.strip()]
+    return []
+
+
+def post_rows(posts, user):
+    """ PostSerializer(posts, many=True).data, for reading. """
+    posts = list(posts)
+    bookmarked = set()
+    if user.is_authenticated and any(not hasattr(post, 'viewer_bookmarked') for post in posts):
+        from .models import Bookmark
+        # One query for the page instead of one per row
+        bookmarked = set(Bookmark.objects.filter(user=user, post__in=posts).values_list('post_id', flat=True))
+
+    rows = []
+    for post in posts:
+        author = post.author
+        masked, image = _author_card(author)
+        row = {
+            'id': post.id,
+            'title': str(post.title),
+            'content': str(post.content),
+            'date_posted': _DATETIME.to_representation(post.date_posted),
+            'status': post.status,
+            'topic': post.topic,
+            'topic_name': TOPIC_NAMES.get(post.topic, post.topic),
+            'tags': _split_tags(post.tags),
+            'author': post.author_id,
+            'author_username': "Deleted User" if masked else author.username,
+            'author_image': image,
+            'is_bookmarked': post.viewer_bookmarked if hasattr(post, 'viewer_bookmarked') else post.id in bookmarked,
+        }
+        for name, cast in _POST_STATS:
+            # Read-only fields the row has no value for are left out, as DRF does
+            if hasattr(post, name):
+                value = getattr(post, name)
+                row[name] = None if value is None else cast(value)
+        rows.append(row)
+    return rows
+
+
+def _comment_row(comment):
+    masked, image = _author_card(comment.author)
+    return {
+        'id': comment.id,
+        'post': comment.post_id,
+        'author': "Deleted User" if masked else comment.author.username,
+        'author_image': image,
+        'text': str(comment.text),
+        'date_posted': _DATETIME.to_representation(comment.date_posted),
+        'parent': comment.parent_id,
+    }
+
+
+def comment_rows(comments):
+    """ CommentSerializer(comments, many=True).data, for reading (one level of replies). """
+    rows = []
+    for comment in comments:
+        row = _comment_row(comment)
+        row['replies'] = [] if comment.parent_id else [_comment_row(reply) for reply in comment.replies.all()]
+        rows.append(row)
+    return rows
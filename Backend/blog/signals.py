@@ -1,6 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import Comment, Notification
+from .models import Comment, Post
+from .notifications import queue_notification
+from .media import update_references
+from .recommender import mark_stale
+from .related import index_post, unindex_post
+from .features import store as feature_store
+from .rollups import uncount_comment
+from users.models import Profile
+from django.contrib.auth.models import User
+from mysite import caching
 from django_rest_passwordreset.signals import reset_password_token_created
 from .gmail import send_gmail
 from django.conf import settings
@@ -9,26 +18,69 @@ from django.conf import settings
 def create_comment_notification(sender, instance, created, **kwargs):
     if created:
         post = instance.post
-        sender_user = instance.author # The person typing right now
+        sender_id = instance.author_id # The person typing right now
         
         # 1. Determine who gets the notification
         if instance.parent:
             # Case A: It's a REPLY -> Notify the person who wrote the parent comment
-            recipient = instance.parent.author
-            action = "replied to you"
+            recipient_id = instance.parent.author_id
+            action = "REPLY"
         else:
             # Case B: It's a ROOT COMMENT -> Notify the Post Author
-            recipient = post.author
-            action = "commented on"
+            recipient_id = post.author_id
+            action = "COMMENT"
 
         # 2. Anti-Spam Check
         # Don't notify if I reply to myself OR if I comment on my own post
-        if sender_user != recipient:
-            Notification.objects.create(
-                recipient=recipient,
-                post=post,
-                text=f"{sender_user.username} {action}: {post.title[:20]}..."
-            )
+        if sender_id != recipient_id:
+            # Written (and coalesced) off the request path, see blog/notifications.py
+            queue_notification(recipient_id, post.id, action, sender_id)
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    # Closed days are never rolled up again (blog/rollups.py)
+    uncount_comment(instance.post_id, instance.date_posted)
+
+@receiver(post_delete, sender=Post)
+def release_post_media(sender, instance, **kwargs):
+    # Images only this post used drop to zero refs -> gc_media removes them
+    update_references(instance.content, '')
+
+@receiver(post_save, sender=Post)
+def update_related_index(sender, instance, **kwargs):
+    # Publish / edit / unpublish: (re)compute the MinHash signature (blog/related.py)
+    index_post(instance)
+
+@receiver(post_delete, sender=Post)
+def remove_from_related_index(sender, instance, **kwargs):
+    unindex_post(instance.pk)
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=Comment)
+def refresh_feed_features(sender, instance, **kwargs):
+    # Dates, topics, tags and comment counts rank the default feed (blog/features.py)
+    feature_store.mark_dirty([instance.post_id if sender is Comment else instance.pk])
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_caches(sender, instance, **kwargs):
+    # Lists holding the post carry its post:<id> tag; topic/feed tags catch the lists it joins
+    caching.invalidate(f'post:{instance.pk}', f'topic:{instance.topic}', 'feed:global')
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_thread_caches(sender, instance, **kwargs):
+    caching.invalidate(f'post:{instance.post_id}')
+
+@receiver([post_save, post_delete], sender=Profile)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_author_caches(sender, instance, **kwargs):
+    # Name, avatar and soft deletion show on every card of this author
+    caching.invalidate(f'author:{instance.user_id if sender is Profile else instance.pk}')
+
+@receiver(post_save, sender=Profile)
+def refresh_recommendations_on_interests(sender, instance, created, **kwargs):
+    # Interests feed the scoring: rebuild this user's list on the next refresh
+    if not created:
+        mark_stale([instance.user_id])
 
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token, *args, **kwargs):
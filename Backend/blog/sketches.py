@@ -0,0 +1,125 @@
+"""
+Fixed-size probabilistic structures.
+
+HyperLogLog counts distinct readers of a post at a fixed cost of
+2**PRECISION one-byte registers (1 KB, ~3% standard error) no matter how
+many readers there are. Two sketches merge by taking the register-wise
+max, so per-worker and per-day sketches can be combined without double
+counting a reader.
+
+BloomFilter answers "has this user seen post X?" for the whole history in
+BLOOM_BITS bits (4 KB). No false negatives; false positives (a post
+wrongly treated as seen) stay around 1% up to BLOOM_CAPACITY items and
+grow slowly past it.
+"""
+
+import hashlib
+import math
+import zlib
+
+import numpy as np
+
+PRECISION = 10
+REGISTERS = 1 << PRECISION
+_RANK_BITS = 64 - PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+# Storage format: one version byte, then the zlib-compressed registers.
+# Sketches of quiet posts are mostly zero registers and shrink to a few bytes.
+_FORMAT = b'\x01'
+
+
+class HyperLogLog:
+    __slots__ = ('registers',)
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(REGISTERS)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        data = bytes(data)
+        if data[:1] != _FORMAT:
+            raise ValueError("Unknown sketch format")
+        return cls(zlib.decompress(data[1:]))
+
+    def to_bytes(self):
+        return _FORMAT + zlib.compress(bytes(self.registers))
+
+    def add(self, key):
+        if isinstance(key, str):
+            key = key.encode()
+        h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+        index = h >> _RANK_BITS
+        rest = h & ((1 << _RANK_BITS) - 1)
+        rank = _RANK_BITS - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    @classmethod
+    def union(cls, sketches):
+        """ One sketch holding every reader of ``sketches``, merged in a single pass. """
+        registers = [np.frombuffer(sketch.registers, dtype=np.uint8) for sketch in sketches]
+        return cls(np.maximum.reduce(registers).tobytes()) if registers else cls()
+
+    def merge(self, other):
+        # In place: the array is a view onto our bytearray
+        mine = np.frombuffer(self.registers, dtype=np.uint8)
+        np.maximum(mine, np.frombuffer(other.registers, dtype=np.uint8), out=mine)
+        return self
+
+    def count(self):
+        zeros = self.registers.count(0)
+        estimate = _ALPHA * REGISTERS * REGISTERS / sum(2.0 ** -r for r in self.registers)
+        # Small range correction: linear counting is far more accurate here
+        if estimate <= 2.5 * REGISTERS and zeros:
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+
+BLOOM_BITS = 1 << 15
+BLOOM_HASHES = 7
+BLOOM_CAPACITY = 3400  # Items at which the false positive rate reaches ~1%
+
+_BLOOM_FORMAT = b'\x01'
+
+
+class BloomFilter:
+    __slots__ = ('bits',)
+
+    def __init__(self, bits=None):
+        self.bits = bytearray(bits) if bits else bytearray(BLOOM_BITS // 8)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        data = bytes(data)
+        if data[:1] != _BLOOM_FORMAT:
+            raise ValueError("Unknown filter format")
+        return cls(zlib.decompress(data[1:]))
+
+    def to_bytes(self):
+        return _BLOOM_FORMAT + zlib.compress(bytes(self.bits))
+
+    def _positions(self, key):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+    def add(self, key):
+        """ Returns True if the key was (probably) not in the filter yet. """
+        added = False
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
@@ -1,3 +1,610 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import FieldError
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import ScopedRateThrottle
+
+from mysite import caching
+from mysite.renderers import ORJSONRenderer
+from mysite.streaming import ExportRateThrottle
+from users.models import Profile
+from .features import FeatureStore
+from .fields import is_compressed
+from .media import referenced_blobs, update_references
+from .models import Bookmark, Comment, Interaction, MediaBlob, Notification, Post, PostDailyStats, PostSignature
+from .notifications import notification_buffer
+from .recommender import with_stats, with_viewer_state
+from .related import RelatedIndex, pack, post_signature
+from .rollups import rollup_day
+from .serializers import CommentSerializer, PostSerializer, comment_rows, post_rows
+from .sketches import HyperLogLog
+from .tracking import reader_buffer, reader_key, view_buffer
+
+
+class FlatRenderingParityTests(TestCase):
+    """ post_rows / comment_rows + ORJSONRenderer must match the DRF path byte for byte. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='x')
+        cls.reader = User.objects.create_user('reader', password='x')
+        cls.gone = User.objects.create_user('gone', password='x')
+        cls.author.profile.image = 'profile_pics/author.jpg'
+        cls.author.profile.save()
+        cls.gone.profile.is_soft_deleted = True
+        cls.gone.profile.save()
+
+        cls.posts = [
+            Post.objects.create(title="Plain", content="<p>Hello</p>", author=cls.author, status=1,
+                                topic='TECH', tags="python, django ,,web"),
+            Post.objects.create(title="Ünïcode \u2028 line", content="<p>naïve “quotes” \u2029</p>",
+                                author=cls.gone, status=1, topic='ART', tags=""),
+            Post.objects.create(title="Draft", content="", author=cls.reader, status=0, topic='XYZ', tags=None),
+        ]
+        root = Comment.objects.create(post=cls.posts[0], author=cls.reader, text="First")
+        Comment.objects.create(post=cls.posts[0], author=cls.author, text="OP reply", parent=root)
+        Comment.objects.create(post=cls.posts[0], author=cls.gone, text="Masked reply", parent=root)
+        Comment.objects.create(post=cls.posts[0], author=cls.author, text="Second \u2028")
+        Bookmark.objects.create(user=cls.reader, post=cls.posts[0])
+
+    def _request(self, user):
+        request = Request(APIRequestFactory().get('/api/posts/'))
+        request.user = user
+        return request
+
+    def _posts(self):
+        return with_stats(Post.objects.select_related('author__profile')).order_by('id')
+
+    def assertSameBytes(self, expected, actual):
+        self.assertEqual(JSONRenderer().render(expected), ORJSONRenderer().render(actual))
+
+    def test_post_rows(self):
+        for user in (AnonymousUser(), self.reader):
+            with self.subTest(user=user):
+                posts = list(self._posts())
+                expected = PostSerializer(posts, many=True, context={'request': self._request(user)}).data
+                self.assertSameBytes(expected, post_rows(self._posts(), user))
+
+    def test_post_rows_with_viewer_state_and_relevance(self):
+        posts = list(with_viewer_state(self._posts(), self.reader))
+        for score, post in enumerate(posts):
+            post.relevance = score
+        expected = PostSerializer(posts, many=True, context={'request': self._request(self.reader)}).data
+        self.assertSameBytes(expected, post_rows(posts, self.reader))
+
+    def test_post_rows_without_stats(self):
+        # Read-only numbers the rows don't carry are left out, as DRF does
+        posts = Post.objects.select_related('author__profile').order_by('id')
+        expected = PostSerializer(posts, many=True, context={'request': self._request(AnonymousUser())}).data
+        self.assertSameBytes(expected, post_rows(posts, AnonymousUser()))
+
+    def test_comment_rows(self):
+        comments = Comment.objects.filter(post=self.posts[0], parent=None)\
+            .select_related('author__profile')\
+            .prefetch_related('replies', 'replies__author', 'replies__author__profile')\
+            .order_by('-date_posted')
+        expected = CommentSerializer(comments, many=True, context={'request': self._request(AnonymousUser())}).data
+        self.assertSameBytes(expected, comment_rows(comments))
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'when': timezone.now(), 'day': timezone.now().date(), 'price': Decimal('1.50'),
+            'text': "tab\t quote\" slash\\ \u2028 ü", 'nested': [{'a': None, 'b': 0.1, 'c': True}],
+        }
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+class NotificationDigestTests(TestCase):
+
+    def test_returning_actor_is_counted_once(self):
+        owner = User.objects.create_user('owner', password='x')
+        alice = User.objects.create_user('alice', password='x')
+        bob = User.objects.create_user('bob', password='x')
+        post = Post.objects.create(title="Digest post", content="", author=owner, status=1)
+
+        for actor in (alice, bob, alice):
+            notification_buffer.write({(owner.id, post.id, 'COMMENT'): [actor.id]})
+
+        notif = Notification.objects.get(recipient=owner)
+        self.assertEqual(notif.actor_count, 2)
+        self.assertEqual(notif.text, "alice and 1 other commented on: Digest post...")
+
+    @override_settings(NOTIFICATION_DIGEST_WINDOW=600)
+    def test_window_is_anchored_on_the_first_event(self):
+        owner = User.objects.create_user('owner', password='x')
+        post = Post.objects.create(title="Digest post", content="", author=owner, status=1)
+        actors = [User.objects.create_user(f'actor{i}', password='x') for i in range(3)]
+        start = timezone.now()
+
+        # Activity every 6 minutes would keep a sliding window open forever
+        for minutes, actor in zip((0, 6, 12), actors):
+            with mock.patch('blog.notifications.timezone.now', return_value=start + timedelta(minutes=minutes)):
+                notification_buffer.write({(owner.id, post.id, 'COMMENT'): [actor.id]})
+
+        first, second = Notification.objects.filter(recipient=owner).order_by('opened_at')
+        self.assertEqual((first.actor_count, first.is_open), (2, False))
+        self.assertEqual((second.actor_count, second.opened_at), (1, start + timedelta(minutes=12)))
+
+    def test_legacy_row_without_actor(self):
+        owner = User.objects.create_user('owner', password='x')
+        alice = User.objects.create_user('alice', password='x')
+        post = Post.objects.create(title="Digest post", content="", author=owner, status=1)
+        Notification.objects.create(recipient=owner, post=post, text="old", actor=None, actor_ids=[])
+
+        notification_buffer.write({(owner.id, post.id, 'COMMENT'): [alice.id]})
+
+        notif = Notification.objects.get(recipient=owner)
+        self.assertEqual(notif.actor_ids, [alice.id])
+        self.assertEqual(notif.actor_count, 2)
+
+    def test_digest_created_by_another_worker_is_merged_into(self):
+        owner = User.objects.create_user('owner', password='x')
+        alice = User.objects.create_user('alice', password='x')
+        bob = User.objects.create_user('bob', password='x')
+        post = Post.objects.create(title="Digest post", content="", author=owner, status=1)
+        Notification.objects.create(recipient=owner, post=post, text="alice", actor=alice, actor_ids=[alice.id])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Notification.objects.create(recipient=owner, post=post, text="bob", actor=bob, actor_ids=[bob.id])
+
+        notification_buffer.write({(owner.id, post.id, 'COMMENT'): [bob.id]})
+
+        notif = Notification.objects.get(recipient=owner)
+        self.assertEqual(notif.actor_ids, [alice.id, bob.id])
+        self.assertEqual(notif.text, "bob and 1 other commented on: Digest post...")
+
+
+class ViewRecordingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _reader(self, **meta):
+        request = APIRequestFactory().post('/', REMOTE_ADDR='10.0.0.1', HTTP_USER_AGENT='ua', **meta)
+        request.user = AnonymousUser()
+        return reader_key(request)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_forwarded_for_prefix_is_ignored(self):
+        honest = self._reader(HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(honest, self._reader(HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.7'))
+        self.assertNotEqual(honest, self._reader(HTTP_X_FORWARDED_FOR='203.0.113.8'))
+
+    @override_settings(TRUSTED_PROXY_COUNT=0)
+    def test_no_trusted_proxy_uses_remote_addr(self):
+        self.assertEqual(self._reader(), self._reader(HTTP_X_FORWARDED_FOR='1.2.3.4'))
+
+    def test_views_keep_their_event_time(self):
+        author = User.objects.create_user('author', password='x')
+        post = Post.objects.create(title="Viewed", content="", author=author, status=1)
+        yesterday = timezone.now() - timedelta(days=1)
+        sketch = HyperLogLog()
+        sketch.add('u:1')
+
+        # Flushed now, but both land where the view happened
+        view_buffer.write({(author.id, post.id): yesterday})
+        reader_buffer.write({(post.id, timezone.localdate(yesterday)): sketch})
+
+        self.assertEqual(Interaction.objects.get(post=post).date_interacted, yesterday)
+        stats = PostDailyStats.objects.get(post=post)
+        self.assertEqual((stats.day, stats.views, stats.unique_readers), (timezone.localdate(yesterday), 1, 1))
+
+    def test_exit_flush_is_skipped_when_writing_inline(self):
+        with mock.patch.object(view_buffer, '_pending', {(1, 1): timezone.now()}), \
+                mock.patch.object(view_buffer, 'write') as write:
+            with override_settings(WRITE_BEHIND_SYNC=True):
+                view_buffer._flush_at_exit()
+            write.assert_not_called()
+            with override_settings(WRITE_BEHIND_SYNC=False):
+                view_buffer._flush_at_exit()
+            write.assert_called_once()
+
+    def test_record_view_is_throttled(self):
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'record_view': '2/min'}):
+            codes = [self.client.post('/api/posts/999999/record_view/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+
+class MediaReferenceTests(TestCase):
+    SHA = 'ab' * 32
+
+    def test_local_and_cloudinary_urls(self):
+        for url in (
+            f'/media/posts/{self.SHA}-1200.webp',
+            f'https://res.cloudinary.com/demo/image/upload/v1/media/posts/{self.SHA}-1200_x7k2qz',
+            f'https://res.cloudinary.com/demo/image/upload/v1712/media/posts/{self.SHA}-480_a1b2c3.jpg',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(referenced_blobs(f'<p><img src="{url}"></p>'), {self.SHA})
+
+    def test_cloudinary_reference_is_counted(self):
+        blob = MediaBlob.objects.create(sha256=self.SHA, name='n', url='u', width=1, height=1, size=1)
+        content = f'<img src="https://res.cloudinary.com/demo/image/upload/v1/media/posts/{self.SHA}-1200_x7k2qz">'
+        update_references('', content)
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+
+
+@override_settings(POST_CONTENT_COMPRESSION=True, POST_CONTENT_COMPRESSION_MIN_BYTES=100)
+class CompressedContentTests(TestCase):
+    LONG = "<p>A long body about compression.</p>" * 20
+
+    def setUp(self):
+        author = User.objects.create_user('author', password='x')
+        self.long = Post.objects.create(title="Long", content=self.LONG, author=author, status=1)
+        self.short = Post.objects.create(title="Short", content="<p>short</p>", author=author, status=1)
+        with override_settings(POST_CONTENT_COMPRESSION=False):
+            self.plain = Post.objects.create(title="Plain", content=self.LONG + "!", author=author, status=1)
+
+    def test_round_trip(self):
+        stored = Post.objects.filter(pk=self.long.pk).values_list('content', flat=True).get()
+        self.assertTrue(is_compressed(stored))
+        self.assertEqual(Post.objects.get(pk=self.long.pk).content, self.LONG)
+
+        Post.objects.filter(pk=self.long.pk).update(content="\x1fnot a payload")
+        self.assertEqual(Post.objects.get(pk=self.long.pk).content, "\x1fnot a payload")
+
+    def test_exact_and_in_match_plain_and_compressed_rows(self):
+        self.assertEqual(Post.objects.get(content=self.LONG), self.long)
+        self.assertEqual(Post.objects.get(content="<p>short</p>"), self.short)
+        self.assertCountEqual(
+            Post.objects.filter(content__in=[self.LONG, self.LONG + "!"]), [self.long, self.plain],
+        )
+
+    def test_pattern_lookups_are_refused(self):
+        with self.assertRaisesMessage(FieldError, "stored__icontains"):
+            Post.objects.filter(content__icontains="compression")
+        # ...unless asked for the stored text, which only covers uncompressed rows
+        self.assertEqual(list(Post.objects.filter(content__stored__icontains="compression")), [self.plain])
+
+    def test_search_still_works(self):
+        response = self.client.get('/api/posts/', {'search': 'compression'})
+        self.assertEqual([post['id'] for post in response.json()], [self.plain.pk])
+
+
+@override_settings(RELATED_INDEX_SYNC=0)
+class RelatedIndexTests(TestCase):
+    BODY = "<p>Vector databases store embeddings and answer nearest neighbour queries quickly.</p>"
+
+    def setUp(self):
+        author = User.objects.create_user('author', password='x')
+        self.posts = [
+            Post.objects.create(title=f"Embeddings {i}", content=self.BODY, author=author, status=1,
+                                topic='TECH', tags='ai, search')
+            for i in range(3)
+        ]
+        self.other = Post.objects.create(title="Baking bread", content="<p>Flour, water, salt and time.</p>",
+                                         author=author, status=1, topic='SOC', tags='food')
+        self.index = RelatedIndex()
+
+    def _similar(self, post):
+        return [post_id for post_id, _ in self.index.similar(post.pk, 10)]
+
+    def test_similar_posts(self):
+        first, second, third = self.posts
+        self.assertCountEqual(self._similar(first), [second.pk, third.pk])
+        self.assertEqual(self._similar(self.other), [])
+
+    def test_posts_removed_by_another_worker_drop_out(self):
+        first, second, third = self.posts
+        self._similar(first)
+        # Unpublished and deleted elsewhere: no signal reaches this index
+        Post.objects.filter(pk=second.pk).update(status=0)
+        PostSignature.objects.filter(post_id=second.pk).delete()
+        Post.objects.filter(pk=third.pk).delete()
+
+        self.assertEqual(self._similar(first), [])
+        self.assertEqual(self.index.stats()['dropped'], 2)
+
+    def test_rows_committed_late_are_picked_up(self):
+        first, second, third = self.posts
+        PostSignature.objects.filter(post_id=third.pk).delete()
+        self.assertEqual(self._similar(first), [second.pk])
+
+        # Saved (stamped) long before the last sync, but only committed now
+        PostSignature.objects.create(post_id=third.pk, signature=pack(post_signature(third)))
+        PostSignature.objects.filter(post_id=third.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertCountEqual(self._similar(first), [second.pk, third.pk])
+
+
+class FeedRankingTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+        self.reader.profile.interests = 'SCI'
+        self.reader.profile.save()
+        now = timezone.now()
+
+        def post(title, topic, tags, hours_ago):
+            created = Post.objects.create(title=title, content="", author=self.author, status=1, topic=topic, tags=tags)
+            Post.objects.filter(pk=created.pk).update(date_posted=now - timedelta(hours=hours_ago))
+            return created
+
+        self.newest = post("Newest", 'ART', '', 1)
+        self.topical = post("Topical", 'SCI', '', 2)
+        self.tagged = post("Tagged", 'ART', 'rust', 3)
+        self.clicked = post("Clicked", 'PHIL', 'rust, systems', 4)
+        Interaction.objects.create(user=self.reader, post=self.clicked, interaction_type=Interaction.VIEW)
+
+    def test_store_ranks_tags_then_topics_then_date(self):
+        ids, relevance = FeatureStore().rank(topics={'SCI'}, tags={'rust'})
+        self.assertEqual(list(ids), [self.tagged.pk, self.clicked.pk, self.topical.pk, self.newest.pk])
+        self.assertEqual(list(relevance), [5, 5, 2, 0])
+
+    def test_filtered_list_keeps_recent_interaction_relevance(self):
+        self.client.force_login(self.reader)
+        results = self.client.get('/api/posts/', {'ordering': '-date_posted'}).json()
+        relevance = {row['id']: row['relevance'] for row in results}
+        self.assertEqual(relevance, {self.newest.pk: 0, self.topical.pk: 2, self.tagged.pk: 5, self.clicked.pk: 5})
+
+    def test_snapshot_is_shared_between_stores(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(FEATURE_STORE_SNAPSHOT=root):
+            built = FeatureStore()
+            expected = built.rank(tags={'rust'})
+            loaded = FeatureStore()
+            ids, relevance = loaded.rank(tags={'rust'})
+
+        self.assertEqual((loaded.stats()['rebuilds'], loaded.stats()['snapshot_loads']), (0, 1))
+        self.assertEqual((list(ids), list(relevance)), (list(expected[0]), list(expected[1])))
+
+    def test_stale_store_is_rebuilt_in_the_background(self):
+        store = FeatureStore()
+        store.rank()
+        store._built_at -= 3600
+        with mock.patch.object(store, '_ensure_refresher') as refresher, mock.patch.object(store, '_rebuild') as rebuild:
+            store.rank()
+        rebuild.assert_not_called()
+        refresher.assert_called_once()
+
+        store.refresh()  # What the refresher thread runs
+        self.assertEqual(store.stats()['rebuilds'], 2)
+
+
+class DailyStatsTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.post = Post.objects.create(title="Counted", content="", author=self.author, status=1)
+
+    def _comments(self):
+        return PostDailyStats.objects.get(post=self.post, day=timezone.localdate()).comments
+
+    def test_deleted_comments_leave_the_daily_count(self):
+        first, second = [Comment.objects.create(post=self.post, author=self.author, text=t) for t in 'ab']
+        rollup_day(timezone.localdate())
+        self.assertEqual(self._comments(), 2)
+
+        first.delete()
+        self.assertEqual(self._comments(), 1)
+        second.delete()
+        rollup_day(timezone.localdate())
+        self.assertEqual(self._comments(), 0)
+
+    def test_rollup_zeroes_days_whose_comments_are_gone(self):
+        PostDailyStats.objects.create(post=self.post, day=timezone.localdate(), comments=3)
+        rollup_day(timezone.localdate())
+        self.assertEqual(self._comments(), 0)
+
+    def test_analytics_counts_each_reader_once_across_days(self):
+        today = timezone.localdate()
+        for offset, readers in ((0, range(0, 60)), (1, range(30, 90))):
+            sketch = HyperLogLog()
+            for i in readers:
+                sketch.add(f'u:{i}')
+            PostDailyStats.objects.create(post=self.post, day=today - timedelta(days=offset),
+                                          reader_sketch=sketch.to_bytes(), unique_readers=sketch.count())
+        self.client.force_login(self.author)
+
+        totals = self.client.get('/api/analytics/posts/').json()['posts'][0]['totals']
+
+        self.assertAlmostEqual(totals['unique_readers'], 90, delta=5)
+
+
+class ConditionalFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='x')
+        Post.objects.create(title="Feed post", content="<p>x</p>", author=cls.reader, status=1, topic='TECH')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_signed_in_feed_does_not_revalidate_the_anonymous_body(self):
+        anonymous = self.client.get('/api/posts/')
+        self.assertIn('Authorization', anonymous['Vary'])
+
+        self.client.force_login(self.reader)
+        signed_in = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(signed_in.status_code, 200)
+        self.assertIn('relevance', signed_in.json()['results'][0])
+
+        revalidated = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=signed_in['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertIn('Authorization', revalidated['Vary'])
+
+
+class ResponseCacheInvalidationTests(TestCase):
+    """ Anonymous reads are served from mysite/caching.py; writes through the API must reach them. """
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        Profile.objects.filter(user=self.author).update(image='profile_pics/old.png')  # No signal
+        with self.captureOnCommitCallbacks(execute=True):  # The feed's feature store learns of them on commit
+            self.post = Post.objects.create(title="Original", content="<p>x</p>", author=self.author, status=1, topic='TECH')
+            self.other = Post.objects.create(title="Other", content="<p>y</p>", author=self.author, status=1, topic='TECH')
+        self.detail_url = f'/api/posts/{self.post.pk}/'
+        # The edit endpoint asks the moderation service first; treat it as down
+        patcher = mock.patch('httpx.AsyncClient.post', side_effect=httpx.ConnectError("down"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _list(self, url='/api/posts/?topic=TECH'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['results'] if isinstance(data, dict) else data  # Filtered lists are not paged
+
+    def _titles(self, url='/api/posts/?topic=TECH'):
+        return sorted(post['title'] for post in self._list(url))
+
+    def _as_author(self, method, url, data=None):
+        self.client.force_login(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, content_type='application/json')
+        self.client.logout()
+        self.assertLess(response.status_code, 300)
+        return response
+
+    def test_edit_reaches_the_detail_and_list_pages(self):
+        self.assertEqual(self.client.get(self.detail_url).json()['title'], "Original")
+        self.assertEqual(self._titles(), ["Original", "Other"])
+        self.assertEqual(self._titles('/api/posts/'), ["Original", "Other"])
+
+        tags = [f'post:{self.post.pk}', 'topic:TECH', 'feed:global']
+        before = caching.generations(tags)
+        self._as_author('patch', self.detail_url, {'title': "Edited"})
+        # Cache keys carry the validator too; the signals must bump the tags all the same
+        after = caching.generations(tags)
+        self.assertTrue(all(after[tag] != before[tag] for tag in tags))
+        self.assertEqual(self.client.get(self.detail_url).json()['title'], "Edited")
+        self.assertEqual(self._titles(), ["Edited", "Other"])
+        self.assertEqual(self._titles('/api/posts/'), ["Edited", "Other"])
+
+    def test_unpublish_leaves_the_lists(self):
+        self.assertEqual(self._titles(), ["Original", "Other"])
+        before = caching.generations(['topic:TECH'])
+        self._as_author('patch', self.detail_url, {'status': 0})
+        self.assertNotEqual(caching.generations(['topic:TECH']), before)
+        self.assertEqual(self._titles(), ["Other"])
+        self.assertEqual(self.client.get(self.detail_url).json()['status'], 0)
+
+    def test_delete_leaves_the_detail_and_list_pages(self):
+        self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+        self.assertEqual(self._titles(), ["Original", "Other"])
+        before = caching.generations([f'post:{self.post.pk}'])
+        self._as_author('delete', self.detail_url)
+        self.assertNotEqual(caching.generations([f'post:{self.post.pk}']), before)
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertEqual(self._titles(), ["Other"])
+
+    def test_profile_edit_reaches_every_card_of_the_author(self):
+        profile_url = f'/api/profile/{self.author.username}/'
+        self.assertTrue(self.client.get(profile_url).json()['image'].endswith('old.png'))
+        self.assertTrue(self.client.get(self.detail_url).json()['author_image'].endswith('old.png'))
+        self.assertTrue(all(post['author_image'].endswith('old.png') for post in self._list()))
+
+        # The list validator does not cover avatars: only the author:<id> tag drops these entries
+        self._as_author('put', '/api/profile/', {'remove_image': True})
+        self.assertIsNone(self.client.get(profile_url).json()['image'])
+        self.assertIsNone(self.client.get(self.detail_url).json()['author_image'])
+        self.assertEqual({post['author_image'] for post in self._list()}, {None})
+
+
+class ExportAccessTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='x')
+        cls.other = User.objects.create_user('other', password='x')
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.post = Post.objects.create(title="Mine", content="<p>x</p>", author=cls.author, status=1)
+        Comment.objects.create(post=cls.post, author=cls.other, text="Hi")
+
+    def setUp(self):
+        cache.clear()
+
+    async def _export(self, url, user=None):
+        await self.async_client.alogout()
+        if user is not None:
+            await self.async_client.aforce_login(user)
+        response = await self.async_client.get(url)
+        if response.streaming:
+            self.assertTrue([block async for block in response.streaming_content])
+        return response.status_code
+
+    async def test_who_may_export(self):
+        own_posts = '/api/posts/?export=ndjson&author__username=author'
+        own_comments = f'/api/comments/?export=ndjson&post_id={self.post.pk}'
+        self.assertEqual(await self._export('/api/posts/?export=ndjson'), 401)
+        self.assertEqual(await self._export('/api/posts/?export=ndjson', self.other), 403)
+        self.assertEqual(await self._export(own_posts, self.other), 403)
+        self.assertEqual(await self._export(own_posts, self.author), 200)
+        self.assertEqual(await self._export('/api/posts/?export=json', self.staff), 200)
+        self.assertEqual(await self._export('/api/comments/?export=ndjson'), 401)
+        self.assertEqual(await self._export(own_comments, self.other), 403)
+        self.assertEqual(await self._export(own_comments, self.author), 200)
+        self.assertEqual(await self._export('/api/comments/?export=ndjson', self.staff), 200)
+
+    async def test_exports_are_throttled(self):
+        with mock.patch.object(ExportRateThrottle, 'THROTTLE_RATES', {'export': '2/hour'}):
+            codes = [await self._export('/api/posts/?export=ndjson', self.staff) for _ in range(3)]
+            # Regular reads of the same endpoint are not
+            self.assertEqual(await self._export('/api/posts/', self.staff), 200)
+        self.assertEqual(codes, [200, 200, 429])
+
+
+class InteractionStorageMigrationTests(TransactionTestCase):
+    """ 0014: string types become small-int codes and duplicates collapse. """
+    before = [('blog', '0013_notification_digest')]
+    after = [('blog', '0014_interaction_upsert_storage')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        apps = self.executor.loader.project_state(self.before).apps
+        User = apps.get_model('auth', 'User')
+        Post = apps.get_model('blog', 'Post')
+        self.Interaction = apps.get_model('blog', 'Interaction')
+        self.user = User.objects.create(username='reader')
+        self.post = Post.objects.create(title='t', content='', author_id=self.user.id)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def _seed(self, kind, days_ago):
+        row = self.Interaction.objects.create(user_id=self.user.id, post_id=self.post.id, interaction_type=kind)
+        self.Interaction.objects.filter(id=row.id).update(date_interacted=timezone.now() - timedelta(days=days_ago))
+
+    def _migrate(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.after)
+        Interaction = self.executor.loader.project_state(self.after).apps.get_model('blog', 'Interaction')
+        return Interaction.objects.order_by('interaction_type')
+
+    def test_duplicates_and_legacy_likes_collapse(self):
+        for kind, days_ago in (('VIEW', 3), ('VIEW', 1), ('LIKE', 2), ('COMMENT', 5)):
+            self._seed(kind, days_ago)
+
+        rows = self._migrate()
+
+        self.assertEqual([row.interaction_type for row in rows], [1, 2])
+        self.assertEqual(rows[0].date_interacted.date(), (timezone.now() - timedelta(days=1)).date())
+
+    def test_unknown_type_fails_before_altering(self):
+        self._seed('VIEW', 0)
+        self._seed('SHARE', 0)
+
+        with self.assertRaisesMessage(RuntimeError, "unknown interaction_type ['SHARE']"):
+            self._migrate()
+        # Nothing of 0014 was applied
+        self.assertEqual(
+            self.Interaction.objects.order_by('id').values_list('interaction_type', flat=True)[1], 'SHARE',
+        )
+        self.Interaction.objects.filter(interaction_type='SHARE').delete()  # So tearDown can migrate forward
@@ -0,0 +1,218 @@
+"""
+View recording.
+
+Page views are the hottest write in the app, so they never touch the
+database on the request path. ``record_view`` drops the event into a
+write-behind buffer; repeat views of the same post by the same user within
+VIEW_DEDUPE_WINDOW are discarded in memory, and the rest are upserted into
+``Interaction`` in bulk by the flusher thread, which also adds them to the
+day's ``PostDailyStats.views``.
+
+Every reader, anonymous ones included, also lands in a per-post
+HyperLogLog sketch: the feed's view count is the estimated number of
+distinct readers, at a fixed storage cost per post.
+"""
+
+import hashlib
+import hmac
+import threading
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from cachetools import TTLCache
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from mysite.buffers import WriteBehindBuffer
+from .models import Interaction, Post, PostDailyStats, PostReaderSketch
+from .seen import mark_seen
+from .recommender import mark_stale
+from .sketches import HyperLogLog
+
+
+class ViewBuffer(WriteBehindBuffer):
+    """
+    Key:   (user_id, post_id)
+    Value: time of the latest view, which the row is stamped with
+    """
+    name = 'views'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Keys seen recently. Bounded like the buffer itself, so a flood of
+        # distinct readers evicts old entries instead of growing memory.
+        self._recent = TTLCache(maxsize=self.max_pending, ttl=settings.VIEW_DEDUPE_WINDOW)
+        self._recent_lock = threading.Lock()
+        self._counters['deduped'] = 0
+
+    def record(self, user_id, post_id):
+        key = (user_id, post_id)
+        with self._recent_lock:
+            if key in self._recent:
+                with self._lock:
+                    self._counters['deduped'] += 1
+                return True
+        # Only a queued view may dedupe later ones: a dropped one must not
+        accepted = self.add(key, timezone.now())
+        if accepted:
+            with self._recent_lock:
+                self._recent[key] = True
+        return accepted
+
+    def merge(self, pending, item):
+        return max(pending, item)
+
+    def write(self, batch):
+        user_ids = {user_id for user_id, _ in batch}
+        post_ids = {post_id for _, post_id in batch}
+
+        # Posts or users deleted while the event was queued are skipped
+        live_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        live_posts = set(Post.objects.filter(id__in=post_ids).values_list('id', flat=True))
+        batch = {
+            key: seen_at for key, seen_at in batch.items()
+            if key[0] in live_users and key[1] in live_posts
+        }
+        if not batch:
+            return
+
+        # One statement per batch:
+        # INSERT ... ON CONFLICT (user, post, type) DO UPDATE SET date_interacted
+        Interaction.objects.bulk_create(
+            [
+                Interaction(user_id=user_id, post_id=post_id, interaction_type=Interaction.VIEW,
+                            date_interacted=seen_at)
+                for (user_id, post_id), seen_at in batch.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'post', 'interaction_type'],
+            update_fields=['date_interacted'],
+        )
+        self._count_daily_views(batch)
+        # ...and the readers' seen-sets, which outlive the pruned raw rows.
+        # Their precomputed recommendations get rebuilt by the next refresh.
+        mark_seen(batch)
+        mark_stale(user_ids & live_users)
+
+    def _count_daily_views(self, batch):
+        # Daily views are counted per event here, not derived later from the
+        # Interaction rows: those are moved to each reader's latest view.
+        counts = Counter((post_id, timezone.localdate(seen_at)) for (_, post_id), seen_at in batch.items())
+        with transaction.atomic():
+            PostDailyStats.objects.bulk_create(
+                [PostDailyStats(post_id=pk, day=day) for pk, day in counts],
+                ignore_conflicts=True,
+            )
+            rows = list(PostDailyStats.objects.select_for_update().filter(
+                post_id__in={pk for pk, _ in counts}, day__in={day for _, day in counts},
+            ))
+            rows = [row for row in rows if (row.post_id, row.day) in counts]
+            for row in rows:
+                row.views += counts[(row.post_id, row.day)]
+            PostDailyStats.objects.bulk_update(rows, ['views'])
+
+
+class ReaderBuffer(WriteBehindBuffer):
+    """
+    Key:   (post_id, day of the view)
+    Value: HyperLogLog of the readers seen since the last flush
+
+    Each worker keeps its own sketches and merges them into the stored
+    lifetime sketch (PostReaderSketch) and that day's sketch (PostDailyStats)
+    under a row lock, so concurrent workers never overwrite each other.
+    """
+    name = 'readers'
+
+    def start(self, item):
+        sketch = HyperLogLog()
+        sketch.add(item)
+        return sketch
+
+    def merge(self, pending, item):
+        pending.add(item)
+        return pending
+
+    def write(self, batch):
+        post_ids = set(Post.objects.filter(id__in={pk for pk, _ in batch}).values_list('id', flat=True))
+        batch = {key: sketch for key, sketch in batch.items() if key[0] in post_ids}
+        if not batch:
+            return
+        # A batch straddling midnight holds two sketches for the same post
+        per_post = {}
+        for (pk, _), sketch in batch.items():
+            per_post.setdefault(pk, HyperLogLog()).merge(sketch)
+
+        with transaction.atomic():
+            # Make sure the rows exist, then lock and merge into them
+            PostReaderSketch.objects.bulk_create(
+                [PostReaderSketch(post_id=pk, registers=HyperLogLog().to_bytes()) for pk in post_ids],
+                ignore_conflicts=True,
+            )
+            PostDailyStats.objects.bulk_create(
+                [PostDailyStats(post_id=pk, day=day) for pk, day in batch],
+                ignore_conflicts=True,
+            )
+
+            lifetime = list(PostReaderSketch.objects.select_for_update().filter(post_id__in=post_ids))
+            for row in lifetime:
+                sketch = HyperLogLog.from_bytes(row.registers).merge(per_post[row.post_id])
+                row.registers, row.readers = sketch.to_bytes(), sketch.count()
+            PostReaderSketch.objects.bulk_update(lifetime, ['registers', 'readers'])
+
+            daily = list(PostDailyStats.objects.select_for_update().filter(
+                post_id__in=post_ids, day__in={day for _, day in batch},
+            ))
+            daily = [row for row in daily if (row.post_id, row.day) in batch]
+            for row in daily:
+                sketch = HyperLogLog.from_bytes(row.reader_sketch).merge(batch[(row.post_id, row.day)])
+                row.reader_sketch, row.unique_readers = sketch.to_bytes(), sketch.count()
+            PostDailyStats.objects.bulk_update(daily, ['reader_sketch', 'unique_readers'])
+
+
+view_buffer = ViewBuffer()
+# A pending sketch is 1 KB, so this buffer gets a tighter key bound
+reader_buffer = ReaderBuffer(max_pending=min(settings.WRITE_BEHIND_MAX_PENDING, 2000))
+
+
+def client_ip(request):
+    """
+    Address of the client as seen by our outermost trusted proxy: the
+    TRUSTED_PROXY_COUNT-th X-Forwarded-For entry from the right. Entries
+    to its left are client-controlled and ignored.
+    """
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if not settings.TRUSTED_PROXY_COUNT or not forwarded:
+        return request.META.get('REMOTE_ADDR', '')
+    hops = forwarded.split(',')
+    return hops[-min(settings.TRUSTED_PROXY_COUNT, len(hops))].strip()
+
+
+def reader_key(request):
+    """
+    Sketch key for whoever is reading: the user id when logged in,
+    otherwise a keyed hash of IP + User-Agent (never stored in the clear).
+    """
+    if request.user.is_authenticated:
+        return f"u:{request.user.pk}"
+    ip = client_ip(request)
+    agent = request.META.get('HTTP_USER_AGENT', '')
+    digest = hmac.new(settings.SECRET_KEY.encode(), f"{ip}|{agent}".encode(), hashlib.sha256)
+    return f"a:{digest.hexdigest()[:32]}"
+
+
+def record_view(request, post_id):
+    """ Request-path entry point. Never queries the database. """
+    post_id = int(post_id)
+    reader_buffer.add((post_id, timezone.localdate()), reader_key(request))
+    if request.user.is_authenticated:
+        view_buffer.record(request.user.pk, post_id)
+
+
+async def arecord_view(request, post_id):
+    """ record_view for async views. Writing inline needs the database, so only then hop to a thread. """
+    if settings.WRITE_BEHIND_SYNC:
+        await sync_to_async(record_view)(request, post_id)
+    else:
+        record_view(request, post_id)
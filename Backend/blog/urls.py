@@ -17,6 +17,8 @@ urlpatterns = [
     path('explore/', views.ExploreAPIView.as_view(), name='explore'),
 
     path('recommendations/', views.recommendations, name='recommendations'), # The Engine
+    path('posts/<int:pk>/dismiss/', views.dismiss_post, name='dismiss-post'),
+    path('posts/<int:pk>/related/', views.related_posts, name='related-posts'),
 
     path('notifications/', views.get_notifications, name='get-notifs'),
     path('notifications/<int:pk>/read/', views.mark_notification_read, name='read-notif'),
@@ -24,6 +26,11 @@ urlpatterns = [
     path('upload/', views.ImageUploadAPI.as_view(), name='image-upload'),
 
     path('posts/<int:pk>/record_view/', views.RecordViewAPI.as_view(), name='record_view'),
+
+    # ANALYTICS (Served from daily rollups)
+    path('analytics/posts/', views.post_analytics, name='post-analytics'),
+    path('cron/rollup/', views.rollup_interactions_cron, name='rollup-cron'),
+    path('cron/recommendations/', views.refresh_recommendations_cron, name='recommendations-cron'),
 ]
 
     
@@ -0,0 +1,75 @@
+"""
+Validators for conditional GETs (mysite/conditional.py).
+
+Each function returns what changes when the payload of an endpoint does,
+from one aggregate query over the rows behind it: edit timestamps, max
+ids (new rows), counts (deleted rows), reader and comment counters, and
+the viewer's own bookmarks. Results are tuples (hashed into the ETag) plus
+the latest timestamp seen, for Last-Modified.
+
+Gaps, by design: a changed avatar or username does not change a list's
+validator (soft deletion does); it shows with the next change to the list.
+"""
+
+from django.db.models import Case, Count, IntegerField, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Notification, Post
+from .recommender import with_viewer_state
+
+
+def _latest(*stamps):
+    return max((stamp for stamp in stamps if stamp is not None), default=None)
+
+
+def _flag(condition):
+    return Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def post_detail(pk, user):
+    """ (shared, viewer bookmarked, last modified), or None for a missing post. """
+    row = with_viewer_state(Post.objects.filter(pk=pk), user).annotate(
+        comment_count=Count('comments'),
+        last_comment=Max('comments__id'),
+        last_commented=Max('comments__date_posted'),
+    ).values_list(
+        'updated_on', 'status', 'reader_sketch__readers', 'comment_count', 'last_comment', 'last_commented',
+        'author__username', 'author__profile__image', 'author__profile__is_soft_deleted', 'viewer_bookmarked',
+    ).first()
+    if row is None:
+        return None
+    return row[:-1], row[-1], _latest(row[0], row[5])
+
+
+def post_list(queryset, user):
+    """ (parts, last modified) for a list of posts, in any order. """
+    rows = with_viewer_state(queryset, user).annotate(
+        v_readers=Coalesce('reader_sketch__readers', 0),
+        v_comments=Count('comments'),
+        v_last_comment=Max('comments__id'),
+        v_masked=_flag(Q(author__profile__is_soft_deleted=True)),
+        v_bookmarked=_flag(Q(viewer_bookmarked=True)),
+    ).aggregate(
+        posts=Count('id'), last_post=Max('id'), edited=Max('updated_on'),
+        readers=Sum('v_readers'), comments=Sum('v_comments'), last_comment=Max('v_last_comment'),
+        masked=Sum('v_masked'), bookmarked=Sum('v_bookmarked'),
+    )
+    return tuple(rows.values()), rows['edited']
+
+
+def comment_thread(post_id):
+    """ (parts, last modified) for the comments of a post. """
+    rows = Comment.objects.filter(post_id=post_id).aggregate(
+        comments=Count('id'), last_comment=Max('id'), posted=Max('date_posted'),
+        masked=Count('id', filter=Q(author__profile__is_soft_deleted=True)),
+    )
+    return tuple(rows.values()), rows['posted']
+
+
+def notifications(user):
+    """ (parts, last modified) for a user's notifications; digests bump ``date`` when they grow. """
+    rows = Notification.objects.filter(recipient=user).aggregate(
+        notifications=Count('id'), last_notification=Max('id'), latest=Max('date'),
+        unread=Count('id', filter=Q(is_read=False)),
+    )
+    return tuple(rows.values()), rows['latest']
@@ -4,56 +4,218 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Count, Case, When, Value, IntegerField, Q, F, FloatField
-from django.core.files.storage import default_storage
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from django.contrib.auth.models import User
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.throttling import ScopedRateThrottle
 import requests
 from rest_framework import status
-from .models import Bookmark, Post, Comment, Interaction, Notification
-from .serializers import PostSerializer, CommentSerializer, NotificationSerializer
-from mysite.permissions import IsOwnerOrModeratorOrReadOnly 
+from .models import Bookmark, Post, Comment, Interaction, Notification, PostDailyStats
+from .serializers import PostSerializer, CommentSerializer, NotificationSerializer, comment_rows, post_rows
+from .tracking import arecord_view
+from .seen import mark_seen
+from . import features
+from . import recommender
+from . import related
+from . import rollups
+from . import versions
+from mysite import jobs
+from .sketches import HyperLogLog
+from .media import astore_upload, strip_inline_images, InvalidImage
+from mysite.permissions import IsOwnerOrModeratorOrReadOnly, HasCronSecret
+from mysite.replicas import read_alias, replica_reads
+from mysite import caching, conditional, streaming
 from django.conf import settings
-from rest_framework.authentication import TokenAuthentication
+from django.utils import timezone
+from datetime import timedelta
+from users.authentication import CachedTokenAuthentication
+from users import roles
 import httpx
 from adrf.generics import ListCreateAPIView
 from asgiref.sync import sync_to_async
 from adrf.generics import RetrieveUpdateDestroyAPIView
+from adrf.views import APIView as AsyncAPIView
+from adrf.decorators import api_view as async_api_view
+from adrf.generics import aget_object_or_404
+from adrf.mixins import get_data
+from rest_framework.utils.urls import replace_query_param
+from urllib.parse import urlencode
 
 
 # ==========================================
 #  POST LIST API (ASYNC)
 # ==========================================
+# Any of these means a filtered list (SQL); without them it's the ranked feed
+FEED_FILTER_PARAMS = {'search', 'topic', 'author__username', 'ordering'}
+
+
+def _list_tags(data):
+    """ Cache tags of a serialized post list: each post and its author card. """
+    tags = set()
+    for item in data:
+        tags.add(f"post:{item['id']}")
+        tags.add(f"author:{item['author']}")
+    return tags
+
+
 class PostListAPI(ListCreateAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [streaming.ExportRateThrottle]
     
     filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
-    search_fields = ['title', 'content', 'tags', 'author__username']
+    search_fields = ['title', 'content__stored', 'tags', 'author__username']  # Uncompressed bodies only (blog/fields.py)
     ordering_fields = ['views', 'date_posted']
 
-    # 1. PRE-FETCH DATA SAFELY
-    async def list(self, request, *args, **kwargs):
-        self.recent_interactions = []
-        if request.user.is_authenticated:
-            try:
-                self.recent_interactions = await sync_to_async(list)(
-                    Interaction.objects.filter(user=request.user)
-                    .select_related('post')
-                    .order_by('-date_interacted')[:20]
-                )
-            except Exception as e:
-                print(f"⚠️ Recommendation Error: {e}")
-                self.recent_interactions = []
-        return await super().list(request, *args, **kwargs)
+    # 1. DEFAULT FEED: ranked in memory by the feature store, one page hydrated
+    @replica_reads
+    async def alist(self, request, *args, **kwargs):
+        if 'export' in request.query_params:
+            return await self.export(request, request.query_params['export'])
+
+        # Validator first: a client already holding this list gets a 304 (mysite/conditional.py)
+        version, last_modified = await sync_to_async(self.list_version)(request)
+        tag = conditional.etag(*version)
+        not_modified = conditional.not_modified(request, 'posts', tag)
+        if not_modified is not None:
+            return not_modified
+
+        params = request.query_params
+        private = request.user.is_authenticated
+        # Personalized (relevance, bookmarks) or unbounded (search): not cached
+        if private or 'search' in params:
+            data = await self.list_data(request, *args, **kwargs)
+        else:
+            known = sorted((k, v) for k, v in params.items() if k in FEED_FILTER_PARAMS or k == 'page')
+            only_topic = {k for k, _ in known} - {'page'} == {'topic'}
+            data = await caching.aget_or_set(
+                f'posts:{urlencode(known)}:{tag}',  # The body always matches the ETag sent with it
+                lambda: self.list_data(request, *args, **kwargs),
+                [f"topic:{params['topic']}" if only_topic else 'feed:global'],
+                tags_from=lambda data: _list_tags(data['results'] if isinstance(data, dict) else data),
+            )
+        return conditional.stamp(Response(data), 'posts', tag, last_modified, private=private)
+
+    def list_version(self, request):
+        """ Validator of the requested feed page or filtered list (blog/versions.py). """
+        user = request.user
+        # Signed-in bodies carry relevance and bookmarks: never the same tag as another viewer's
+        viewer = user.pk if user.is_authenticated else None
+        if FEED_FILTER_PARAMS.isdisjoint(request.query_params):
+            self.feed = self.feed_page(request)  # Ranked once, hydrated by ranked_feed on a miss
+            parts, last_modified = versions.post_list(Post.published.filter(id__in=self.feed['ids']), user)
+            return (viewer, self.feed['count'], self.feed['ids'], self.feed['relevance'], *parts), last_modified
+
+        parts, last_modified = versions.post_list(self.filter_queryset(self.get_queryset()), user)
+        parts = (viewer, *parts)
+        if user.is_authenticated:
+            topics, tags = self.interests(user)
+            parts += (sorted(topics), sorted(tags))  # Relevance of the filtered list
+        return parts, last_modified
+
+    def interests(self, user):
+        """
+        Topics and tags that make a post relevant to the viewer: their profile
+        interests plus what they interacted with last. Queried once per request.
+        """
+        if getattr(self, '_interests', None) is None:
+            topics, tags = set(), set()
+            if user.is_authenticated:
+                try:
+                    topics.update(x.strip() for x in user.profile.interests.split(',') if x.strip())
+                except Exception:
+                    pass
+                recent = Interaction.objects.filter(user=user).order_by('-date_interacted').values_list('post__topic', 'post__tags')[:20]
+                for topic, post_tags in recent:
+                    topics.add(topic)
+                    tags |= features.normalize_tags(post_tags)
+            self._interests = topics, tags
+        return self._interests
+
+    async def list_data(self, request, *args, **kwargs):
+        if FEED_FILTER_PARAMS.isdisjoint(request.query_params):
+            return await sync_to_async(self.ranked_feed)(request, self.feed)
+        # Read-only rows: flat rendering instead of PostSerializer (blog/serializers.py)
+        queryset = await self.afilter_queryset(self.get_queryset())
+        return await sync_to_async(post_rows)(queryset, request.user)
+
+    # 1b. EXPORT: every post the filters match, streamed row by row (mysite/streaming.py)
+    async def export(self, request, export_format):
+        if export_format not in streaming.EXPORT_FORMATS:
+            return Response(
+                {"detail": f"Unknown export format. Use one of: {', '.join(streaming.EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        user = request.user
+        # Role lookup, relevance (profile) and the replica probe may query: sync
+        queryset = await sync_to_async(self.export_queryset)(request)
+        if queryset is None:
+            self.permission_denied(request, message="Exports are for staff, moderators and authors exporting their own posts.")
+
+        async def rows():
+            async for post in queryset.aiterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+                yield post_rows([post], user)[0]  # Bookmark flag is annotated: no query per row
+
+        return streaming.export_response(rows(), export_format, 'posts')
+
+    def export_queryset(self, request):
+        """ Posts to export, bound to this request's read alias; None if the user may not. """
+        user = request.user
+        own = user.is_authenticated and request.query_params.get('author__username') == user.username
+        if not (own or user.is_staff or roles.is_moderator(user)):
+            return None
+        queryset = recommender.with_viewer_state(self.filter_queryset(self.get_queryset()), user)
+        return queryset.using(read_alias(Post))
+
+    def feed_page(self, request):
+        """ Ranks the feed and cuts the requested page: ids and relevance only, no rows. """
+        ids, relevance = features.store.rank(*self.interests(request.user))
+
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        size = settings.FEED_PAGE_SIZE
+        start = (page - 1) * size
+        return {
+            'count': len(ids),
+            'page': page,
+            'has_next': start + size < len(ids),
+            'ids': [int(post_id) for post_id in ids[start:start + size]],
+            'relevance': [int(r) for r in relevance[start:start + size]],
+        }
+
+    def ranked_feed(self, request, feed):
+        user = request.user
+        posts = recommender.with_stats(Post.published.select_related('author__profile')).in_bulk(feed['ids'])
+        results = []
+        for post_id, score in zip(feed['ids'], feed['relevance']):
+            post = posts.get(post_id)
+            if post is None:  # Unpublished or deleted since the store was built
+                continue
+            if user.is_authenticated:
+                post.relevance = score
+            results.append(post)
+
+        url = request.build_absolute_uri()
+        page = feed['page']
+        return {
+            'count': feed['count'],
+            'next': replace_query_param(url, 'page', page + 1) if feed['has_next'] else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': post_rows(results, user),
+        }
 
     # 2. ASYNC CREATE (AI CHECK)
     async def acreate(self, request, *args, **kwargs):
         data = request.data
         title = data.get('title', '')
         content = data.get('content', '')
-        full_text = f"{title} {content}"
+        # Inline base64 images are offloaded on save; the moderator only needs the text
+        full_text = f"{title} {strip_inline_images(content)}"
 
         try:
             async with httpx.AsyncClient() as client:
@@ -101,9 +263,10 @@ class PostListAPI(ListCreateAPIView):
             qs = Post.objects.filter(author__username=username, status=1)
         else:
             qs = Post.published.all()
+        qs = qs.select_related('author__profile')  # Author cards without a query per row
 
         qs = qs.annotate(
-            views=Count('interactions', filter=Q(interactions__interaction_type='VIEW'), distinct=True),
+            views=Coalesce('reader_sketch__readers', 0),
             total_comments=Count('comments', distinct=True),
             op_replies=Count('comments', filter=Q(comments__author=F('author')), distinct=True),
         ).annotate(
@@ -117,7 +280,7 @@ class PostListAPI(ListCreateAPIView):
         if search_query:
             return qs.filter(
                 Q(title__icontains=search_query) | 
-                Q(content__icontains=search_query) | 
+                Q(content__stored__icontains=search_query) |  # Compressed bodies can't be searched (blog/fields.py)
                 Q(tags__icontains=search_query)
             ).order_by('-date_posted')
 
@@ -128,20 +291,9 @@ class PostListAPI(ListCreateAPIView):
             return qs.order_by('-date_posted')
 
         if user.is_authenticated:
-            interested_topics = set()
-            clicked_tags = set()
-            try:
-                if hasattr(user, 'profile') and user.profile.interests:
-                    interested_topics.update([x.strip() for x in user.profile.interests.split(',') if x.strip()])
-            except: pass
-            
-            recent = getattr(self, 'recent_interactions', [])
-            
-            for i in recent:
-                interested_topics.add(i.post.topic)
-                if i.post.tags:
-                    clicked_tags.update([t.strip().lower() for t in i.post.tags.split(',')])
-            
+            # Same inputs as the ranked feed (feed_page); list_version has already run the query
+            interested_topics, clicked_tags = self.interests(user)
+
             tag_query = Q()
             for tag in clicked_tags:
                 tag_query |= Q(tags__icontains=tag)
@@ -166,27 +318,90 @@ class PostListAPI(ListCreateAPIView):
 # ==========================================
 #  COMMENT API (ASYNC)
 # ==========================================
+def _threads(comments):
+    """ Top-level comments with their replies and every author card, as the serializers read them. """
+    return comments.filter(parent=None)\
+        .select_related('author', 'author__profile')\
+        .prefetch_related(
+            'replies', 
+            'replies__author', 
+            'replies__author__profile'
+        )
+
+
 class CommentAPI(ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [streaming.ExportRateThrottle]
     
     def get_queryset(self):
         post_id = self.request.query_params.get('post_id')
         
         # If fetching for a specific post
         if post_id:
-            return Comment.objects.filter(post_id=post_id, parent=None)\
-                .select_related('author', 'author__profile')\
-                .prefetch_related(
-                    'replies', 
-                    'replies__author', 
-                    'replies__author__profile'
-                )\
-                .order_by('-date_posted')
+            return _threads(Comment.objects.filter(post_id=post_id)).order_by('-date_posted')
         
         # Fallback for POST validation 
         return Comment.objects.all()
 
+    @replica_reads
+    async def alist(self, request, *args, **kwargs):
+        post_id = request.query_params.get('post_id', '')
+        if 'export' in request.query_params:
+            return await self.export(request, request.query_params['export'], post_id)
+        if not post_id.isdigit():
+            return await super().alist(request, *args, **kwargs)
+
+        version, last_modified = await sync_to_async(versions.comment_thread)(post_id)
+        tag = conditional.etag(*version)
+        not_modified = conditional.not_modified(request, 'comments', tag)
+        if not_modified is not None:
+            return not_modified
+
+        # Commenters are only known from the rows; the names on the wire are masked
+        authors = set()
+
+        async def build():
+            queryset = self.get_queryset()
+            comments = [comment async for comment in queryset]
+            for comment in comments:
+                authors.add(comment.author_id)
+                authors.update(reply.author_id for reply in comment.replies.all())
+            return comment_rows(comments)  # Replies are prefetched: no queries
+
+        data = await caching.aget_or_set(
+            f'comments:{post_id}:{tag}', build, [f'post:{post_id}'],
+            tags_from=lambda data: [f'author:{author_id}' for author_id in authors],
+        )
+        return conditional.stamp(Response(data), 'comments', tag, last_modified)
+
+    # 1b. EXPORT: one post's threads, or every thread, streamed (mysite/streaming.py)
+    async def export(self, request, export_format, post_id):
+        if export_format not in streaming.EXPORT_FORMATS or (post_id and not post_id.isdigit()):
+            return Response(
+                {"detail": f"Use export={' or '.join(streaming.EXPORT_FORMATS)} and a numeric post_id, if any."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = await sync_to_async(self.export_queryset)(request, post_id)
+        if queryset is None:
+            self.permission_denied(request, message="Exports are for staff, moderators and the author of the post.")
+
+        async def rows():
+            # Replies are prefetched per chunk
+            async for comment in queryset.aiterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+                yield comment_rows([comment])[0]
+
+        return streaming.export_response(rows(), export_format, 'comments')
+
+    def export_queryset(self, request, post_id):
+        """ Threads to export, bound to this request's read alias; None if the user may not. """
+        user = request.user
+        own = user.is_authenticated and post_id and Post.objects.filter(pk=post_id, author=user).exists()
+        if not (own or user.is_staff or roles.is_moderator(user)):
+            return None
+        queryset = self.get_queryset() if post_id else _threads(Comment.objects.all()).order_by('id')
+        return queryset.using(read_alias(Comment))
+
     # 2. AI LOGIC 
     async def acreate(self, request, *args, **kwargs):
         content = request.data.get('text', '')
@@ -232,7 +447,11 @@ class CommentDetailAPI(generics.DestroyAPIView):
 # UTILS (Explore, Images, Recommendations)
 # ==========================================
 class ExploreAPIView(APIView):
+    @replica_reads
     def get(self, request):
+        return Response(caching.get_or_set('explore', self.top_tags, ['feed:global']))
+
+    def top_tags(self):
         all_tags = []
         posts = Post.objects.filter(status=1).values_list('tags', flat=True)
         for tag_str in posts:
@@ -243,101 +462,50 @@ class ExploreAPIView(APIView):
         from collections import Counter
         tag_counts = Counter(all_tags).most_common(10)
         data = [{'name': tag, 'count': count} for tag, count in tag_counts]
-        return Response({'top_tags': data, 'recent_tags': []})
+        return {'top_tags': data, 'recent_tags': []}
 
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def recommendations(request):
-    user = request.user
-
-    # 1. LEARNING (Get User Interests)
-    try:
-        explicit_topics = [x.strip() for x in user.profile.interests.split(',') if x.strip()]
-    except:
-        explicit_topics = []
+@replica_reads
+async def recommendations(request):
+    # Served from the user's precomputed list; live scoring only on a miss (blog/recommender.py)
+    label, posts = await recommender.aserve(request.user)
 
-    # Get recent interactions to find implied interests
-    recent_interactions = Interaction.objects.filter(user=user).select_related('post').order_by('-date_interacted')[:50]
-    
-    clicked_topics = set()
-    clicked_tags = set()
-    viewed_ids = set()
-
-    for interaction in recent_interactions:
-        post = interaction.post
-        viewed_ids.add(post.id)
-        clicked_topics.add(post.topic)
-        if post.tags:
-            tags = [t.strip().lower() for t in post.tags.split(',') if t.strip()]
-            clicked_tags.update(tags)
-
-    all_interested_topics = list(set(explicit_topics) | clicked_topics)
-
-    # 2. SCORING (Filter out posts they've already seen)
-    queryset = Post.published.exclude(id__in=viewed_ids).exclude(author=user)
-
-    tag_query = Q()
-    for tag in clicked_tags:
-        tag_query |= Q(tags__icontains=tag)
-
-    # Build Scoring Conditions
-    relevance_conditions = []
-    if tag_query: 
-        relevance_conditions.append(When(tag_query, then=Value(5))) # High Priority (Tags)
-    
-    relevance_conditions.append(When(topic__in=all_interested_topics, then=Value(2))) # Medium Priority (Topics)
-
-    recs = queryset.annotate(
-        relevance=Case(
-            *relevance_conditions, 
-            default=Value(0),
-            output_field=IntegerField(),
-        ),
-        total_comments=Count('comments', distinct=True),
-        op_replies=Count('comments', filter=Q(comments__author=F('author')), distinct=True),
-    ).annotate(
-        quality_ratio=Case(
-            When(total_comments=0, then=Value(0.0)),
-            default=F('op_replies') * 1.0 / F('total_comments'),
-            output_field=FloatField()
-        )
-    )
+    return Response({
+        "posts": await sync_to_async(post_rows)(posts, request.user),
+        "label": label
+    })
 
-    # 3. RANKING (Updated Order)
-    # Priority 1: Relevance Score
-    # Priority 2: Date Posted (Newest First)
-    # Priority 3: Quality Ratio (Tie-breaker)
-    final_recs = recs.filter(relevance__gt=0).order_by('-relevance', '-date_posted', '-quality_ratio')[:8]
-    label = "For You"
 
 
-    if not final_recs:
-        final_recs = Post.published.exclude(author=user).annotate(
-    
-            views=Count('interactions', filter=Q(interactions__interaction_type='VIEW'), distinct=True),
-            total_comments=Count('comments', distinct=True),
-            op_replies=Count('comments', filter=Q(comments__author=F('author')), distinct=True),
-        ).annotate(
-            quality_ratio=Case(
-                When(total_comments=0, then=Value(0.0)),
-                default=F('op_replies') * 1.0 / F('total_comments'),
-                output_field=FloatField()
-            )
-        ).order_by('-quality_ratio', '-views')[:32]  
-        label = "Top Picks"
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@replica_reads
+def related_posts(request, pk):
+    """ "More like this" for the post being read: MinHash/LSH index (blog/related.py) """
+    post = get_object_or_404(Post.objects.only('id', 'topic'), pk=pk)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 5)), 20))
+    except ValueError:
+        limit = 5
 
-    # If Attempt 3 returned empty (e.g. math fail), just grab the newest posts.
-    if not final_recs:
-        final_recs = Post.published.exclude(author=user).order_by('-date_posted')[:32]
-        label = "Top Picks"
+    matches = dict(related.index.similar(post.id, limit))
+    posts = recommender.with_stats(Post.published.select_related('author__profile')).in_bulk(list(matches))
+    ranked = [posts[post_id] for post_id in matches if post_id in posts]
 
-    serializer = PostSerializer(final_recs, many=True, context={'request': request})
-    return Response({
-        "posts": serializer.data, 
-        "label": label
-    })
+    # Not enough look-alikes (new topic, short post): top up with the newest of the same topic
+    if len(ranked) < limit:
+        ranked += recommender.with_stats(
+            Post.published.select_related('author__profile')
+            .filter(topic=post.topic)
+            .exclude(id__in=[post.id, *matches])
+        ).order_by('-date_posted')[:limit - len(ranked)]
 
+    data = post_rows(ranked, request.user)
+    for item in data:
+        item['similarity'] = round(matches.get(item['id'], 0.0), 3)
+    return Response({'posts': data})
 
 
 class PostDetailAPI(RetrieveUpdateDestroyAPIView):
@@ -345,36 +513,49 @@ class PostDetailAPI(RetrieveUpdateDestroyAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrModeratorOrReadOnly]
 
+    def get_queryset(self):
+        # Post, author card, feed stats and viewer flags in one SELECT
+        qs = recommender.with_stats(Post.objects.select_related('author__profile'))
+        return recommender.with_viewer_state(qs, self.request.user)
+
     # 1. ASYNC RETRIEVE ( View Recording Logic)
     async def aretrieve(self, request, *args, **kwargs):
-        #  Wrap the DB call
-        instance = await sync_to_async(self.get_object)()
-        
-        if request.user.is_authenticated:
-            try:
-                def record_interaction(user, post):
-                    interaction, created = Interaction.objects.get_or_create(
-                        user=user,
-                        post=post,
-                        interaction_type='VIEW'
-                    )
-                    if not created:
-                        interaction.save()
-                
-                await sync_to_async(record_interaction)(request.user, instance)
-            except Exception as e:
-                print(f"⚠️ View Record Error: {e}")
+        pk = self.kwargs['pk']
+        found = await sync_to_async(versions.post_detail)(pk, request.user)
+        if found is None:
+            raise Http404
+        version, is_bookmarked, last_modified = found
+        tag = conditional.etag(*version, is_bookmarked)
+
+        # Buffered in memory, written in bulk by the flusher (blog/tracking.py); a revalidation is a read too
+        await arecord_view(request, int(pk))
+
+        not_modified = conditional.not_modified(request, 'post', tag)
+        if not_modified is not None:
+            return not_modified
+
+        async def build():
+            # One query (async ORM); everything the serializer reads is on the instance
+            instance = await self.aget_object()
+            return self.get_serializer(instance).data
+
+        data = await caching.aget_or_set(
+            f'post-detail:{pk}:{conditional.etag(*version)}', build, [f'post:{pk}'],
+            tags_from=lambda data: [f"author:{data['author']}"],
+        )
 
-        return await super().aretrieve(request, *args, **kwargs)
+        # Cached for everyone: the viewer's own flag (from the validator) is laid over it
+        response = Response({**data, 'is_bookmarked': is_bookmarked})
+        return conditional.stamp(response, 'post', tag, last_modified, private=request.user.is_authenticated)
 
     # 2. ASYNC UPDATE (AI Check)
     async def aupdate(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = await self.aget_object()
 
-        instance = await sync_to_async(self.get_object)()
-        
         new_title = request.data.get('title', instance.title)
         new_content = request.data.get('content', instance.content)
-        full_text = f"{new_title} {new_content}"
+        full_text = f"{new_title} {strip_inline_images(new_content)}"
 
         try:
             async with httpx.AsyncClient() as client:
@@ -397,48 +578,128 @@ class PostDetailAPI(RetrieveUpdateDestroyAPIView):
         except Exception as e:
             print(f"⚠️ AI Service Error (Update): {e}")
 
-        return await super().aupdate(request, *args, **kwargs)
+        # Same instance as above: no second lookup
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await self.perform_aupdate(serializer)
+        return Response(await get_data(serializer))
 
     # 3. HELPER (Required for Async Save)
     async def perform_aupdate(self, serializer):
+        # PostSerializer.update offloads images and updates media refs: one thread hop for all of it
         await sync_to_async(serializer.save)()
 
     # 4. HELPER (Required for Async Delete)
     async def perform_adestroy(self, instance):
-        await sync_to_async(Post.objects.filter(pk=instance.pk).delete)()
+        await Post.objects.filter(pk=instance.pk).adelete()
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def get_notifications(request):
+def post_analytics(request):
+    """
+    Views and comments per day for the logged-in author's posts.
+    Served from the PostDailyStats rollup only (never raw interactions).
+    Optional: ?days=30 (max 365), ?post_id=<id>
+    """
+    try:
+        days = min(max(int(request.query_params.get('days', 30)), 1), 365)
+    except ValueError:
+        return Response({'error': 'days must be a number'}, status=400)
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = PostDailyStats.objects.filter(post__author=request.user, day__gte=since)
+
+    post_id = request.query_params.get('post_id')
+    if post_id:
+        rows = rows.filter(post_id=post_id)
+
+    posts, readers = {}, {}
+    fields = ('post_id', 'post__title', 'day', 'views', 'unique_readers', 'comments', 'reader_sketch')
+    for row in rows.values(*fields).order_by('post_id', 'day'):
+        entry = posts.setdefault(row['post_id'], {
+            'id': row['post_id'],
+            'title': row['post__title'],
+            'totals': {'views': 0, 'unique_readers': 0, 'comments': 0},
+            'series': [],
+        })
+        entry['totals']['views'] += row['views']
+        entry['totals']['comments'] += row['comments']
+        entry['series'].append({
+            'day': row['day'],
+            'views': row['views'],
+            'unique_readers': row['unique_readers'],
+            'comments': row['comments'],
+        })
+        # Daily reader counts can't be summed (same reader, many days): merge the sketches
+        if row['reader_sketch']:
+            readers.setdefault(row['post_id'], []).append(HyperLogLog.from_bytes(row['reader_sketch']))
+
+    for post_id, sketches in readers.items():
+        posts[post_id]['totals']['unique_readers'] = HyperLogLog.union(sketches).count()
+
+    return Response({'since': since, 'days': days, 'posts': list(posts.values())})
+
+
+@api_view(['POST', 'GET'])
+@permission_classes([HasCronSecret])
+def rollup_interactions_cron(request):
+    """ EXTERNAL CRON ENDPOINT: queues the daily rollup + retention (see blog/rollups.py) """
+    queued = jobs.enqueue(rollups.CHECKPOINT, rollups.run_rollup)
+    return Response({'queued': queued}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['POST', 'GET'])
+@permission_classes([HasCronSecret])
+def refresh_recommendations_cron(request):
+    """ EXTERNAL CRON ENDPOINT: queues the recommendation refresh (see blog/recommender.py) """
+    queued = jobs.enqueue('recommendations', recommender.refresh_recommendations)
+    return Response({'queued': queued}, status=status.HTTP_202_ACCEPTED)
+
+
+@async_api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+async def get_notifications(request):
+    version, last_modified = await sync_to_async(versions.notifications)(request.user)
+    tag = conditional.etag(*version)
+    not_modified = conditional.not_modified(request, 'notifications', tag)
+    if not_modified is not None:
+        return not_modified  # Polling clients: nothing new
+
     # Get last 20 notifications for the logged-in user
-    notifs = Notification.objects.filter(recipient=request.user)[:20]
+    notifs = [n async for n in Notification.objects.filter(recipient=request.user)[:20]]
     serializer = NotificationSerializer(notifs, many=True)
-    return Response(serializer.data)
+    return conditional.stamp(Response(serializer.data), 'notifications', tag, last_modified, private=True)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
-def mark_notification_read(request, pk):
-    try:
-        notif = Notification.objects.get(pk=pk, recipient=request.user)
-        notif.is_read = True
-        notif.save()
-        return Response({'status': 'marked read'})
-    except Notification.DoesNotExist:
+def dismiss_post(request, pk):
+    # "Not interested": never recommend this post again, on any device
+    post = get_object_or_404(Post, pk=pk)
+    mark_seen([(request.user.id, post.id)])
+    return Response({'status': 'dismissed'})
+
+@async_api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+async def mark_notification_read(request, pk):
+    # Single UPDATE, filtered by recipient so nobody can mark someone else's
+    updated = await Notification.objects.filter(pk=pk, recipient=request.user).aupdate(is_read=True)
+    if not updated:
         return Response({'error': 'Not found'}, status=404)
+    return Response({'status': 'marked read'})
     
-class ToggleBookmarkAPI(APIView):
+class ToggleBookmarkAPI(AsyncAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request, post_id):
-        post_obj = get_object_or_404(Post, id=post_id)
+    async def post(self, request, post_id):
+        post_obj = await aget_object_or_404(Post.objects.only('id'), id=post_id)
         
         # Get or Create the bookmark
-        bookmark, created = Bookmark.objects.get_or_create(user=request.user, post=post_obj)
+        bookmark, created = await Bookmark.objects.aget_or_create(user=request.user, post=post_obj)
 
         if not created:
             # If it already exists, DELETE it
-            bookmark.delete()
+            await bookmark.adelete()
 
             return Response({'is_bookmarked': False}, status=status.HTTP_200_OK)
         
@@ -455,41 +716,48 @@ class BookmarkedPostListAPI(generics.ListAPIView):
         return Post.objects.filter(bookmarked_by__user=self.request.user).order_by('-bookmarked_by__created_at')
     
 
-class ImageUploadAPI(APIView):
+class ImageUploadAPI(AsyncAPIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
-    def post(self, request):
+    async def post(self, request):
         if 'image' not in request.FILES:
             return Response({'error': 'No image provided'}, status=400)
 
         image_file = request.FILES['image']
         
+        # Hash, then decode / resize / re-encode / store on the image worker pool
+        # (blog/media.py). Bytes already uploaded before return the stored URLs.
         # This automatically uses whatever storage set in settings.py
-       
-        file_name = default_storage.save(f"posts/{image_file.name}", image_file)
-        file_url = default_storage.url(file_name)
-
-        return Response({'url': file_url}, status=200)
+        try:
+            result = await astore_upload(image_file, 'posts')
+        except InvalidImage:
+            return Response({'error': 'Unsupported or corrupt image'}, status=400)
+
+        # 'url' is the largest variant, 'srcset' lists every stored width
+        return Response({
+            'url': result['url'],
+            'srcset': result['srcset'],
+            'width': result['width'],
+            'height': result['height'],
+            'variants': [{'width': v['width'], 'url': v['url']} for v in result['variants']],
+            'deduplicated': result['deduplicated'],
+        }, status=200)
     
-class RecordViewAPI(APIView):
+class RecordViewAPI(AsyncAPIView):
     permission_classes = [AllowAny] 
     
     # 2. VITAL: This line disables CSRF checks by removing SessionAuthentication
-    authentication_classes = [TokenAuthentication] 
-
-    def post(self, request, pk):
-        # 3. Check Authentication MANUALLY
-        if not request.user.is_authenticated:
-            return Response({"status": "Anonymous view ignored"})
-
-        post = get_object_or_404(Post, pk=pk)
-        
-        # 4. Use get_or_create to prevent database spam
-        Interaction.objects.get_or_create(
-            user=request.user,
-            post=post,
-            interaction_type='VIEW'
-        )
+    authentication_classes = [CachedTokenAuthentication] 
+    # Open to anyone: bound what one client can push into the view buffers
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'record_view'
+
+    # Async handler: nothing below touches the database
+    async def post(self, request, pk):
+        # 3. Anonymous readers only feed the distinct-reader sketch,
+        #    logged-in ones also get an Interaction row (for recommendations)
+        # 4. Buffered + deduplicated in memory, no DB write on the request path
+        await arecord_view(request, pk)
         
         return Response({"status": "View recorded"})
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Write-behind buffers.
+
+Request handlers hand small write events to a buffer and return straight
+away; a daemon thread drains the buffer in batches. Events are keyed, so
+repeated events for the same key are merged in memory instead of becoming
+separate writes. Each buffer is bounded: once ``max_pending`` keys are
+waiting, new keys are dropped (and counted) rather than growing without
+limit. Whatever is still pending is flushed when the process exits.
+
+Events should carry their own timestamp where the write records one: a
+batch can be written several seconds after its events happened.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from mysite import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Base class. Subclasses implement ``merge`` (fold a new event into the
+    pending one for the same key) and ``write`` (persist a batch).
+    """
+    name = 'buffer'
+
+    def __init__(self, flush_interval=None, max_pending=None, flush_threshold=None):
+        self.flush_interval = flush_interval or settings.WRITE_BEHIND_FLUSH_INTERVAL
+        self.max_pending = max_pending or settings.WRITE_BEHIND_MAX_PENDING
+        # Wake the flusher early once this many keys are waiting
+        self.flush_threshold = flush_threshold or max(1, self.max_pending // 4)
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._counters = {
+            'accepted': 0,  # events taken in
+            'merged': 0,    # events folded into an already pending key
+            'dropped': 0,   # events refused because the buffer was full
+            'flushed': 0,   # keys written to the database
+            'failed': 0,    # keys lost to a failing write
+            'flushes': 0,   # number of batches written
+        }
+        atexit.register(self._flush_at_exit)
+        metrics.register(f'buffers.{self.name}', self.stats)
+
+    # --- To be implemented by subclasses ---
+    def start(self, item):
+        """ Pending value for a key's first event. """
+        return item
+
+    def merge(self, pending, item):
+        return item
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    # --- Public API ---
+    def add(self, key, item):
+        """ Queue an event. Returns False if it had to be dropped. """
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = self.merge(self._pending[key], item)
+                self._counters['merged'] += 1
+            elif len(self._pending) >= self.max_pending:
+                self._counters['dropped'] += 1
+                self._wakeup.set()
+                return False
+            else:
+                self._pending[key] = self.start(item)
+            self._counters['accepted'] += 1
+            size = len(self._pending)
+
+        if settings.WRITE_BEHIND_SYNC:
+            self.flush()
+        else:
+            self._ensure_thread()
+            if size >= self.flush_threshold:
+                self._wakeup.set()
+        return True
+
+    def flush(self):
+        """ Write everything pending right now. Returns the number of keys written. """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception("%s: flush of %d keys failed", self.name, len(batch))
+                with self._lock:
+                    self._counters['failed'] += len(batch)
+                return 0
+
+            with self._lock:
+                self._counters['flushed'] += len(batch)
+                self._counters['flushes'] += 1
+            return len(batch)
+
+    def _flush_at_exit(self):
+        # Synchronous buffers never hold anything, and under the test runner
+        # the database may already be gone by now
+        if settings.WRITE_BEHIND_SYNC or not self._pending:
+            return
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending))
+
+    # --- Background flusher ---
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-flusher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
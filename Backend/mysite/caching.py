@@ -0,0 +1,161 @@
+"""
+Tag-invalidated response cache.
+
+Cached entries declare the tags they depend on:
+
+    post:<id>      a post's row, stats and comment thread
+    author:<id>    a user's profile card (name, avatar, soft deletion)
+    topic:<code>   lists filtered to one topic
+    feed:global    lists spanning all posts (feed pages, explore tags)
+
+Every tag has a generation counter in the cache. An entry stores the
+generation of each of its tags when it was built and is only served while
+they all still match, so invalidating a tag is one ``incr`` no matter how
+many entries depend on it. A counter that gets evicted comes back as a
+fresh time-based value, never as a number an old entry could match.
+
+Write paths call ``invalidate`` (blog/signals.py, blog/views.py,
+users/views.py, users/cleanup.py); it runs once the current transaction
+commits, so a concurrent read cannot cache the pre-commit rows under the
+new generation. Entries also expire after RESPONSE_CACHE_TTL, which bounds
+anything an invalidation does not cover (view counts, for one).
+
+Views only cache what every caller sees alike: per-viewer bits (the
+bookmark flag, a personalized feed) are left out or laid over the hit.
+
+Storage is Django's cache framework: per-process memory by default, shared
+between workers with CACHE_URL (e.g. redis://...). Hits, misses, stale
+entries and invalidations are counted per tag family in /metrics/ under
+'response_cache'.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from mysite import metrics
+
+_lock = threading.Lock()
+_counters = defaultdict(lambda: {'hits': 0, 'misses': 0, 'stale': 0, 'invalidations': 0})
+
+
+def _family(tag):
+    return tag.split(':', 1)[0]
+
+
+def _entry_key(key):
+    return f'rc:entry:{key}'
+
+
+def _tag_key(tag):
+    return f'rc:tag:{tag}'
+
+
+def _count(tags, field):
+    with _lock:
+        for family in {_family(tag) for tag in tags}:
+            _counters[family][field] += 1
+
+
+# ==========================================
+# GENERATIONS
+# ==========================================
+def generations(tags):
+    """ {tag: current generation}; missing counters are started. """
+    tags = list(tags)
+    found = cache.get_many([_tag_key(tag) for tag in tags])
+    result = {}
+    for tag in tags:
+        value = found.get(_tag_key(tag))
+        if value is None:
+            cache.add(_tag_key(tag), time.time_ns(), None)
+            value = cache.get(_tag_key(tag))  # Whoever added first wins
+        result[tag] = value
+    return result
+
+
+def _bump(tags):
+    for tag in tags:
+        try:
+            cache.incr(_tag_key(tag))
+        except ValueError:  # Not there (never used, or evicted)
+            cache.set(_tag_key(tag), time.time_ns(), None)
+    _count(tags, 'invalidations')
+
+
+def invalidate(*tags):
+    """ Drop every entry depending on any of ``tags``, once the transaction commits. """
+    tags = [tag for tag in tags if tag]
+    if tags:
+        transaction.on_commit(lambda: _bump(tags))
+
+
+# ==========================================
+# LOOKUP
+# ==========================================
+def _valid(entry):
+    """ Returns (value, versions), versions None unless the entry is fresh. """
+    if entry is None:
+        return None, None
+    versions, value = entry
+    current = generations(versions)
+    if current == versions:
+        return value, versions
+    _count([tag for tag in versions if current[tag] != versions[tag]], 'stale')
+    return None, None
+
+
+def _store(key, value, versions, tags_from, timeout):
+    if tags_from is not None:
+        versions.update(generations(tags_from(value)))
+    cache.set(_entry_key(key), (versions, value), settings.RESPONSE_CACHE_TTL if timeout is None else timeout)
+    _count(versions, 'misses')
+
+
+def get_or_set(key, build, tags, tags_from=None, timeout=None):
+    """
+    Cached ``build()``. ``tags`` are known up front; ``tags_from(value)``
+    adds tags only known from the built value (an author id, say).
+    """
+    value, versions = _valid(cache.get(_entry_key(key)))
+    if versions is not None:
+        _count(versions, 'hits')
+        return value
+    # Generations are read before building: an invalidation racing the
+    # build makes the stored entry stale instead of wrongly fresh
+    versions = generations(tags)
+    value = build()
+    _store(key, value, versions, tags_from, timeout)
+    return value
+
+
+async def _call(func, *args):
+    if isinstance(caches['default'], LocMemCache):
+        return func(*args)  # Memory only: no I/O, no thread hop
+    return await sync_to_async(func, thread_sensitive=False)(*args)
+
+
+async def aget_or_set(key, build, tags, tags_from=None, timeout=None):
+    """ get_or_set for async views; ``build`` is a coroutine function. """
+    value, versions = await _call(lambda: _valid(cache.get(_entry_key(key))))
+    if versions is not None:
+        _count(versions, 'hits')
+        return value
+    versions = await _call(generations, tags)
+    value = await build()
+    await _call(_store, key, value, versions, tags_from, timeout)
+    return value
+
+
+def stats():
+    with _lock:
+        return {family: dict(counters) for family, counters in sorted(_counters.items())}
+
+
+metrics.register('response_cache', stats)
@@ -0,0 +1,245 @@
+"""
+Response compression (Brotli / gzip), negotiated per request.
+
+CompressionMiddleware encodes GET/HEAD responses whose Accept-Encoding
+allows it: Brotli when the client takes it (and the ``brotli`` package is
+installed, as requirements.txt does), gzip otherwise.
+
+  * Only text-like bodies (JSON, HTML, text, JS, CSS) of at least
+    COMPRESSION_MIN_BYTES; below that the framing costs more than it saves.
+    Responses to writes are left alone: they are small and may carry
+    secrets next to reflected input (login tokens, BREACH).
+  * Finished bodies that carry an ETag (the cacheable endpoints, see
+    mysite/conditional.py) are compressed once: the encoded bytes are kept
+    in the 'compressed' cache, keyed by a hash of the body and encoding,
+    for RESPONSE_CACHE_TTL. A repeat of the same body, for any client,
+    costs a hash and a cache get instead of compressing again. That cache
+    is separate from the default one and bounded (COMPRESSION_CACHE_ENTRIES
+    bodies of at most COMPRESSION_CACHE_MAX_BYTES each), so stored bodies
+    never evict tag generations, roles or replica pins.
+  * Streaming bodies are compressed chunk by chunk and flushed after each
+    one, so a client sees every record as soon as the view yields it.
+  * A strong ETag becomes weak (the bytes differ per encoding); the
+    validators of mysite/conditional.py are weak to begin with, so a 304
+    carries the same ETag as the 200 it revalidates.
+
+Counters (bytes in/out, compression CPU time, stored-body hits) are in
+/metrics/ under 'compression'; ``python manage.py benchmark_compression``
+compares encodings and levels on real feed payloads.
+"""
+
+import hashlib
+import re
+import threading
+import time
+import zlib
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+from mysite import metrics
+
+try:
+    import brotli
+except ImportError:  # gzip is the fallback
+    brotli = None
+
+_COMPRESSIBLE = re.compile(r'^(text/|application/(json|javascript|x-ndjson|xml)|image/svg)')
+_ACCEPT = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?')
+
+_lock = threading.Lock()
+_counters = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0, 'stored_hits': 0, 'streams': 0}
+
+
+# ==========================================
+# ENCODERS
+# ==========================================
+def gzip_compress(data, level=None):
+    level = settings.COMPRESSION_GZIP_LEVEL if level is None else level
+    encoder = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip framing
+    return encoder.compress(data) + encoder.flush()
+
+
+def brotli_compress(data, quality=None):
+    quality = settings.COMPRESSION_BROTLI_QUALITY if quality is None else quality
+    return brotli.compress(data, quality=quality)
+
+
+class _GzipStream:
+    def __init__(self):
+        self._encoder = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        return self._encoder.compress(data) + self._encoder.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._encoder.flush()
+
+
+class _BrotliStream:
+    def __init__(self):
+        self._encoder = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def chunk(self, data):
+        return self._encoder.process(data) + self._encoder.flush()
+
+    def finish(self):
+        return self._encoder.finish()
+
+
+# Preference order when the client accepts several equally
+ENCODERS = {'br': (brotli_compress, _BrotliStream), 'gzip': (gzip_compress, _GzipStream)}
+
+
+def available_encodings():
+    return [name for name in ENCODERS if name != 'br' or brotli is not None]
+
+
+def negotiate(accept_encoding):
+    """ Best encoding the Accept-Encoding header allows, or None. """
+    weights = {}
+    for part in accept_encoding.split(','):
+        match = _ACCEPT.match(part)
+        if not match:
+            continue
+        try:
+            weights[match.group(1).lower()] = float(match.group(2) or 1)
+        except ValueError:
+            continue
+    default = weights.get('*', 0)
+    candidates = [(weights.get(name, default), -rank, name) for rank, name in enumerate(available_encodings())]
+    weight, _, name = max(candidates)
+    return name if weight > 0 else None
+
+
+def _count(**values):
+    with _lock:
+        for field, value in values.items():
+            _counters[field] += value
+
+
+# ==========================================
+# BODIES
+# ==========================================
+def _stored_key(body, encoding):
+    return f'rc:encoded:{encoding}:{hashlib.blake2b(body, digest_size=16).hexdigest()}'
+
+
+def encode(body, encoding, store=False):
+    """ Compressed ``body``; with ``store``, reused from (and saved to) the cache. """
+    key = _stored_key(body, encoding) if store else None
+    if key is not None:
+        encoded = caches['compressed'].get(key)
+        if encoded is not None:
+            _count(stored_hits=1)
+            return encoded
+    start = time.process_time()
+    encoded = ENCODERS[encoding][0](body)
+    _count(cpu_ms=(time.process_time() - start) * 1000)
+    if key is not None and len(encoded) <= settings.COMPRESSION_CACHE_MAX_BYTES:
+        caches['compressed'].set(key, encoded, settings.RESPONSE_CACHE_TTL)
+    return encoded
+
+
+def _compressible(request, response):
+    if request.method not in SAFE_METHODS or response.has_header('Content-Encoding'):
+        return False
+    if response.status_code != 200 or not _COMPRESSIBLE.match(response.get('Content-Type', '')):
+        return False
+    return response.streaming or len(response.content) >= settings.COMPRESSION_MIN_BYTES
+
+
+def _weaken_etag(response):
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+
+
+def _stream(chunks, stream):
+    for chunk in chunks:
+        data = stream.chunk(chunk)
+        _count(bytes_in=len(chunk), bytes_out=len(data))
+        if data:
+            yield data
+    data = stream.finish()
+    _count(bytes_out=len(data))
+    yield data
+
+
+async def _astream(chunks, stream):
+    async for chunk in chunks:
+        data = stream.chunk(chunk)
+        _count(bytes_in=len(chunk), bytes_out=len(data))
+        if data:
+            yield data
+    data = stream.finish()
+    _count(bytes_out=len(data))
+    yield data
+
+
+def compress_response(request, response):
+    if response.status_code == 304 and request.method in SAFE_METHODS:
+        patch_vary_headers(response, ['Accept-Encoding'])  # As on the 200 it revalidates
+        return response
+    if not _compressible(request, response):
+        return response
+    patch_vary_headers(response, ['Accept-Encoding'])
+    encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return response
+
+    if response.streaming:
+        stream = ENCODERS[encoding][1]()
+        if response.is_async:
+            response.streaming_content = _astream(response.streaming_content, stream)
+        else:
+            response.streaming_content = _stream(response.streaming_content, stream)
+        response.headers.pop('Content-Length', None)
+        _count(streams=1)
+    else:
+        body = response.content
+        encoded = encode(body, encoding, store=response.has_header('ETag'))
+        if len(encoded) >= len(body):
+            return response
+        response.content = encoded
+        response['Content-Length'] = str(len(encoded))
+        _count(responses=1, bytes_in=len(body), bytes_out=len(encoded))
+
+    _weaken_etag(response)
+    response['Content-Encoding'] = encoding
+    return response
+
+
+@sync_and_async_middleware
+def CompressionMiddleware(get_response):
+    """ Brotli / gzip for large text responses; see the module docstring. """
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            if response.streaming or not _compressible(request, response):
+                return compress_response(request, response)
+            # zlib and brotli release the GIL, the stored-body lookup may be network I/O
+            return await sync_to_async(compress_response, thread_sensitive=False)(request, response)
+    else:
+        def middleware(request):
+            return compress_response(request, get_response(request))
+
+    return middleware
+
+
+def stats():
+    with _lock:
+        counters = dict(_counters)
+    counters['cpu_ms'] = round(counters['cpu_ms'], 2)
+    counters['saved_ratio'] = round(1 - counters['bytes_out'] / counters['bytes_in'], 3) if counters['bytes_in'] else 0.0
+    counters['encodings'] = available_encodings()
+    return counters
+
+
+metrics.register('compression', stats)
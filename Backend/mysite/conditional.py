@@ -0,0 +1,72 @@
+"""
+Conditional GET (ETag / If-None-Match).
+
+A view computes a small validator first: timestamps, max ids and counters
+of the rows its payload is made of (blog/versions.py), one aggregate query
+instead of the full fetch and serialization. The ETag is a hash of it, so
+a client or CDN revalidating an unchanged resource gets a bodiless 304.
+
+  * Only the ETag decides a 304. Last-Modified is sent as a hint, but
+    deletions, read flags and profile edits don't move it, so a request
+    with If-Modified-Since alone gets the full response.
+  * Every response varies on Authorization, 304s included: a browser that
+    cached a logged-out body never revalidates it into a signed-in one.
+    Personalized validators (bookmarks, relevance, one's notifications)
+    are also stamped ``private``, so shared caches don't store them.
+  * ``no-cache``: caches may store the response but revalidate every use.
+  * ETags are weak: they identify the content, not the bytes, which
+    differ per Content-Encoding (mysite/compression.py).
+
+304s and full responses are counted per view in /metrics/ under
+'conditional'.
+"""
+
+import hashlib
+import threading
+from collections import defaultdict
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from mysite import metrics
+
+_lock = threading.Lock()
+_counters = defaultdict(lambda: {'not_modified': 0, 'full': 0})
+
+
+def etag(*parts):
+    """ Weak ETag for a validator tuple (values with a stable repr). """
+    return 'W/"%s"' % hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def not_modified(request, name, tag):
+    """ A 304 when the client already holds ``tag``, else None. """
+    response = get_conditional_response(request, etag=tag)
+    if response is not None:
+        with _lock:
+            _counters[name]['not_modified'] += 1
+        response['ETag'] = tag
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def stamp(response, name, tag, last_modified=None, private=False):
+    """ Adds the validators and revalidation headers to a full response. """
+    if response.status_code != 200:
+        return response
+    with _lock:
+        _counters[name]['full'] += 1
+    response['ETag'] = tag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, no_cache=True, **({'private': True} if private else {}))
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def stats():
+    with _lock:
+        return {name: dict(counters) for name, counters in sorted(_counters.items())}
+
+
+metrics.register('conditional', stats)
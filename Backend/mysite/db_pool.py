@@ -0,0 +1,87 @@
+"""
+Pooled PostgreSQL connections.
+
+With ``conn_max_age`` every thread keeps its own persistent connection.
+Under uvicorn that is a lot of threads: Django runs each request's sync
+code on a fresh thread (ThreadSensitiveContext), and the write-behind
+flushers, the job runner and the image workers add theirs. Each new thread
+pays a full TLS handshake, and finished threads leave idle connections
+behind until the server drops them.
+
+DATABASE_POOL=True switches every PostgreSQL alias (replicas included) to
+Django's built-in psycopg 3 pool instead: connections are checked out for
+a request and returned when Django closes them (request end, and the
+close_old_connections() calls in the background threads).
+
+The default install keeps psycopg2, which has no pool. Pooling needs
+``pip install -r requirements-pool.txt`` (psycopg[binary,pool]); Django
+picks psycopg 3 over psycopg2 once it is installed.
+
+  * DATABASE_POOL_MIN / DATABASE_POOL_MAX: connections per alias and per
+    process. Budget MAX x uvicorn workers x aliases under the server limit;
+    a request holds one connection, so MAX caps concurrent DB work.
+  * DATABASE_POOL_TIMEOUT: seconds a request waits for a free connection
+    before failing.
+  * DATABASE_POOL_MAX_IDLE: idle connections above MIN are closed after
+    this many seconds; DATABASE_POOL_MAX_LIFETIME recycles old ones.
+  * Connections are checked before being handed out (CONN_HEALTH_CHECKS),
+    so one the server closed is replaced instead of failing a query.
+
+Pool counters (``connections_num``, ``requests_wait_ms``...) are exposed
+under 'db_pool' in /metrics/.
+"""
+
+from importlib.util import find_spec
+
+from django.core.exceptions import ImproperlyConfigured
+
+from mysite import metrics
+
+POSTGRES_ENGINE = 'django.db.backends.postgresql'
+
+
+def pool_installed():
+    return find_spec('psycopg') is not None and find_spec('psycopg_pool') is not None
+
+
+def configure(databases, min_size, max_size, timeout, max_idle, max_lifetime):
+    """ Called from settings.py: turn on pooling for every PostgreSQL alias. """
+    aliases = [alias for alias, database in databases.items() if database.get('ENGINE') == POSTGRES_ENGINE]
+    if aliases and not pool_installed():
+        raise ImproperlyConfigured(
+            "DATABASE_POOL needs psycopg 3 with its pool: pip install -r requirements-pool.txt"
+        )
+    for alias in aliases:
+        database = databases[alias]
+        database['CONN_MAX_AGE'] = 0  # Pooling replaces persistent connections
+        database['CONN_HEALTH_CHECKS'] = True
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'name': alias,
+            'min_size': min_size,
+            'max_size': max_size,
+            'timeout': timeout,
+            'max_idle': max_idle,
+            'max_lifetime': max_lifetime,
+        }
+
+
+def stats():
+    from django.db import connections
+
+    result = {}
+    for alias in connections:
+        connection = connections[alias]
+        if not connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            continue
+        pool = connection.pool  # Built on first use, but only opened by the first checkout
+        if pool is None or pool.closed:
+            result[alias] = {'opened': False}  # No query yet in this process
+            continue
+        counters = pool.get_stats()
+        requests = counters.get('requests_num', 0)
+        counters['avg_wait_ms'] = round(counters.get('requests_wait_ms', 0) / requests, 2) if requests else 0.0
+        result[alias] = counters
+    return result
+
+
+metrics.register('db_pool', stats)
@@ -0,0 +1,96 @@
+"""
+In-process background jobs.
+
+Cron-triggered endpoints enqueue their work here and answer immediately
+instead of doing it inside the HTTP request. Jobs run one at a time on a
+single worker thread, and a job name that is already queued or running is
+not queued twice. The queue lives in memory and is lost on restart, so
+jobs must be resumable on their own (see blog.models.JobCheckpoint).
+
+That dedupe only covers this process. Jobs that must not overlap with a
+run in another worker, or with one a restart left behind, also take a
+lease on their JobCheckpoint row (``claim`` / ``renew`` / ``release``).
+A lease that isn't renewed within JOB_LEASE_SECONDS lapses, so a crashed
+run never blocks the job for good.
+"""
+
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from blog.models import JobCheckpoint
+from mysite import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jobs')
+_active = set()
+_lock = threading.Lock()
+_counters = {'queued': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+
+def enqueue(name, func, *args, **kwargs):
+    """ Queue ``func`` under ``name``. Returns False if that job is already pending. """
+    with _lock:
+        if name in _active:
+            _counters['rejected'] += 1
+            return False
+        _active.add(name)
+        _counters['queued'] += 1
+    _executor.submit(_run, name, func, args, kwargs)
+    return True
+
+
+def _run(name, func, args, kwargs):
+    close_old_connections()
+    try:
+        result = func(*args, **kwargs)
+        logger.info("job %s finished: %s", name, result)
+        outcome = 'completed'
+    except Exception:
+        logger.exception("job %s failed", name)
+        outcome = 'failed'
+    finally:
+        close_old_connections()
+        with _lock:
+            _active.discard(name)
+    with _lock:
+        _counters[outcome] += 1
+
+
+def claim(name):
+    """ Take the lease on job ``name``. Returns the owner token, or None if another run holds it. """
+    JobCheckpoint.objects.get_or_create(name=name)
+    owner = uuid.uuid4().hex
+    now = timezone.now()
+    # One conditional UPDATE: of two racing runs, only one matches the row
+    claimed = JobCheckpoint.objects.filter(
+        Q(lease_until__isnull=True) | Q(lease_until__lt=now), name=name,
+    ).update(owner=owner, lease_until=now + timedelta(seconds=settings.JOB_LEASE_SECONDS))
+    return owner if claimed else None
+
+
+def renew(name, owner):
+    """ Extend the lease between batches. False means it lapsed and another run took over. """
+    return bool(JobCheckpoint.objects.filter(name=name, owner=owner).update(
+        lease_until=timezone.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+    ))
+
+
+def release(name, owner):
+    JobCheckpoint.objects.filter(name=name, owner=owner).update(owner='', lease_until=None)
+
+
+def stats():
+    with _lock:
+        return dict(_counters, active=sorted(_active))
+
+
+metrics.register('jobs', stats)
@@ -0,0 +1,19 @@
+"""
+Process-local runtime counters.
+
+Components register a callable returning a dict of numbers; the
+admin-only /metrics/ endpoint (mysite/views.py) returns a snapshot of all
+of them. Counters are per process, so with several uvicorn workers each
+response describes the worker that served it (hence the pid).
+"""
+
+_sources = {}
+
+
+def register(name, source):
+    _sources[name] = source
+
+
+def snapshot():
+    return {name: source() for name, source in sorted(_sources.items())}
+
@@ -1,4 +1,10 @@
+import logging
+
 from rest_framework import permissions
+from django.conf import settings
+from users import roles
+
+logger = logging.getLogger(__name__)
 
 class IsOwnerOrModeratorOrReadOnly(permissions.BasePermission):
     """
@@ -8,23 +14,44 @@ class IsOwnerOrModeratorOrReadOnly(permissions.BasePermission):
     """
     def has_object_permission(self, request, view, obj):
         
-        print(f"RBAC CHECK: User '{request.user}' accessing object by '{obj.author}'")
-        
-        # 2. Allow SAFE methods (Read-only) to everyone
-        
+        # 1. Allow SAFE methods (Read-only) to everyone
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # 3. CHECK A: Is it the Owner?
-        is_owner = obj.author == request.user
+        # 2. CHECK A: Is it the Owner?
+        is_owner = obj.author_id == request.user.pk
         
-        # 4. CHECK B: Is it a Moderator? (The RBAC Part)
-        # Checks if the user is inside the "Moderator" group in Django Admin
-        is_moderator = request.user.groups.filter(name='Moderator').exists()
+        # 3. CHECK B: Is it a Moderator? (The RBAC Part)
+        # Group membership is cached per user, see users/roles.py
+        is_moderator = not is_owner and roles.is_moderator(request.user)
 
-        # Debug Result
-        print(f" -> Is Owner? {is_owner}")
-        print(f" -> Is Moderator? {is_moderator}")
+        # Debug Result (only formatted when DEBUG logging is on for this logger)
+        logger.debug(
+            "rbac check user=%s object=%s:%s is_owner=%s is_moderator=%s",
+            request.user.pk, type(obj).__name__, obj.pk, is_owner, is_moderator,
+            extra={
+                'user_id': request.user.pk,
+                'object': f"{type(obj).__name__}:{obj.pk}",
+                'is_owner': is_owner,
+                'is_moderator': is_moderator,
+            },
+        )
 
         # Grant access if EITHER is true
-        return is_owner or is_moderator
\ No newline at end of file
+        return is_owner or is_moderator
+
+
+class HasCronSecret(permissions.BasePermission):
+    """
+    For endpoints hit by the external cron service.
+    The secret is accepted via the X-CRON-SECRET header OR ?secret=...
+    """
+    message = "Unauthorized access."
+
+    def has_permission(self, request, view):
+        if not settings.CRON_SECRET_KEY:
+            return False
+        return settings.CRON_SECRET_KEY in (
+            request.headers.get('X-CRON-SECRET'),
+            request.query_params.get('secret'),
+        )
@@ -0,0 +1,300 @@
+"""
+Read-replica routing.
+
+Replicas are configured with DATABASE_REPLICA_URLS and become the
+``replica1``, ``replica2``... aliases. Nothing goes to them by default:
+only reads inside a view (or block) marked with ``replica_reads`` do, so
+every other query, and every write, stays on the primary.
+
+Read-your-writes:
+  * Once a request has written anything, its remaining reads use the
+    primary too.
+  * ReplicaStickinessMiddleware pins a user whose POST/PUT/PATCH/DELETE
+    wrote to the database to the primary for REPLICA_STICKY_SECONDS (a
+    GET that only get_or_create()s does not pin). Pins live in Django's
+    cache, so they are shared between workers only if CACHES points at a
+    shared backend.
+
+Health: each replica is probed at most every REPLICA_CHECK_INTERVAL
+seconds per process (replay lag on PostgreSQL, a plain query elsewhere).
+A replica that fails the probe or lags more than REPLICA_MAX_LAG_SECONDS is
+skipped until a later probe passes; with no healthy replica, reads go to
+the primary.
+
+Local testing: point DATABASE_REPLICA_URLS at a copy of the SQLite file
+(``sqlite:////tmp/replica.sqlite3``); deleting or emptying the copy shows
+the fallback. mysite/tests.py does the same against a second SQLite alias.
+"""
+
+import contextvars
+import logging
+import random
+import re
+import threading
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, router
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+from mysite import metrics
+
+logger = logging.getLogger(__name__)
+
+_WRITE = re.compile(r'\s*(INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+_reads = contextvars.ContextVar('replica_reads', default=None)
+_request = contextvars.ContextVar('replica_request', default=None)
+
+_lock = threading.Lock()
+_health = {}  # alias -> (monotonic time checked, healthy, lag seconds)
+_counters = {'replica_reads': 0, 'primary_reads': 0, 'pinned': 0, 'fallbacks': 0, 'probes': 0}
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+class _ReadScope:
+    """ One marked view call. The alias is picked on its first query. """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.alias = None
+
+
+class _RequestState:
+    def __init__(self):
+        self.wrote = False
+
+
+# ==========================================
+# HEALTH
+# ==========================================
+def _probe(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            if connections[alias].vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT CASE WHEN pg_is_in_recovery() "
+                    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+                    "ELSE 0 END"
+                )
+                lag = float(cursor.fetchone()[0])
+            else:
+                # Catches a missing or empty stand-in database, not just a dead server
+                cursor.execute("SELECT COUNT(*) FROM django_migrations")
+                lag = 0.0
+    except DatabaseError:
+        logger.warning("replicas: %s is unreachable, reading from the primary", alias)
+        return False, None
+    if lag > settings.REPLICA_MAX_LAG_SECONDS:
+        logger.warning("replicas: %s lags %.1fs, reading from the primary", alias, lag)
+        return False, lag
+    return True, lag
+
+
+def is_healthy(alias):
+    now = time.monotonic()
+    checked = _health.get(alias)
+    if checked is not None and now - checked[0] < settings.REPLICA_CHECK_INTERVAL:
+        return checked[1]
+    healthy, lag = _probe(alias)
+    with _lock:
+        _health[alias] = (now, healthy, lag)
+        _counters['probes'] += 1
+    return healthy
+
+
+# ==========================================
+# STICKINESS
+# ==========================================
+def _pin_key(user_id):
+    return f'replicas:pin:{user_id}'
+
+
+def pin(user_id):
+    cache.set(_pin_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(_pin_key(user_id), False)
+
+
+def _pick(scope):
+    if is_pinned(scope.user_id):
+        with _lock:
+            _counters['pinned'] += 1
+        return DEFAULT_DB_ALIAS
+    healthy = [alias for alias in replica_aliases() if is_healthy(alias)]
+    if not healthy:
+        with _lock:
+            _counters['fallbacks'] += 1
+        return DEFAULT_DB_ALIAS
+    return random.choice(healthy)
+
+
+# ==========================================
+# ROUTER
+# ==========================================
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        scope = _reads.get()
+        state = _request.get()
+        instance = hints.get('instance')
+        if state is not None and state.wrote:
+            alias = DEFAULT_DB_ALIAS
+        elif instance is not None and instance._state.db:
+            # Related lookups follow the object they start from, also after the
+            # scope ended (prefetches of a stream bound with .using(read_alias()))
+            alias = instance._state.db
+        elif scope is None:
+            alias = DEFAULT_DB_ALIAS
+        else:
+            if scope.alias is None:
+                scope.alias = _pick(scope)
+            alias = scope.alias
+        with _lock:
+            _counters['primary_reads' if alias == DEFAULT_DB_ALIAS else 'replica_reads'] += 1
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+# ==========================================
+# WRITE DETECTION
+# ==========================================
+# Routing calls db_for_write for plain object assignment too, so "did this
+# request write" is taken from the SQL actually sent to the primary.
+def _detect_writes(execute, sql, params, many, context):
+    state = _request.get()
+    if state is not None and not state.wrote and _WRITE.match(sql):
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def _install(sender, connection, **kwargs):
+    if connection.alias == DEFAULT_DB_ALIAS and _detect_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_detect_writes)
+
+
+connection_created.connect(_install)
+
+
+# ==========================================
+# MARKING VIEWS
+# ==========================================
+def _find_request(args):
+    return next(arg for arg in args if hasattr(arg, 'method') and hasattr(arg, 'user'))
+
+
+def _scope_for(args):
+    request = _find_request(args)
+    if request.method not in SAFE_METHODS:
+        return None
+    user = request.user
+    return _ReadScope(user.pk if user.is_authenticated else None)
+
+
+def replica_reads(view):
+    """
+    Send the reads of this view (function or handler method, after DRF
+    authentication) to a replica. Unsafe methods are left on the primary.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            token = _reads.set(_scope_for(args))
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _reads.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _reads.set(_scope_for(args))
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _reads.reset(token)
+    return wrapper
+
+
+def read_alias(model):
+    """
+    Alias reads of ``model`` use in the current marked scope. Blocking (may
+    probe a replica). Querysets consumed after the view returns, like a
+    streamed export, are bound to it with ``.using()``: the scope is gone
+    by the time they run.
+    """
+    return router.db_for_read(model)
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)
+    if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+        return None  # Never resolved during the request: nothing user-specific was done
+    return user.pk if user.is_authenticated else None
+
+
+@sync_and_async_middleware
+def ReplicaStickinessMiddleware(get_response):
+    """ Pins users who wrote during the request to the primary for a while. """
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            state = _RequestState()
+            token = _request.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _request.reset(token)
+            if state.wrote and request.method not in SAFE_METHODS and replica_aliases():
+                user_id = _user_id(request)
+                if user_id is not None:
+                    await cache.aset(_pin_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+            return response
+    else:
+        def middleware(request):
+            state = _RequestState()
+            token = _request.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _request.reset(token)
+            if state.wrote and request.method not in SAFE_METHODS and replica_aliases():
+                user_id = _user_id(request)
+                if user_id is not None:
+                    pin(user_id)
+            return response
+
+    return middleware
+
+
+def stats():
+    with _lock:
+        return dict(
+            _counters,
+            replicas={alias: {'healthy': ok, 'lag': lag} for alias, (_, ok, lag) in _health.items()},
+        )
+
+
+metrics.register('replicas', stats)
@@ -5,6 +5,7 @@ Production Ready: NeonDB, Cloudinary, WhiteNoise, and Environment Variables.
 
 from pathlib import Path
 import os
+import sys
 import environ
 import dj_database_url 
 from datetime import timedelta
@@ -61,6 +62,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # <--- Added for Static Files
+    'mysite.compression.CompressionMiddleware',  # Brotli/gzip for API bodies (static files are precompressed by WhiteNoise)
     'corsheaders.middleware.CorsMiddleware',      # <--- CORS must be high up
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +70,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mysite.replicas.ReplicaStickinessMiddleware',  # Read-your-writes for replica reads
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -103,6 +106,58 @@ DATABASES = {
     )
 }
 
+# Read replicas (mysite/replicas.py): comma-separated URLs, exposed as
+# 'replica1', 'replica2', ... Only views marked @replica_reads use them.
+for number, replica_url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), start=1):
+    DATABASES[f'replica{number}'] = dj_database_url.parse(
+        replica_url,
+        conn_max_age=600,
+        ssl_require=True if not DEBUG else False
+    )
+    DATABASES[f'replica{number}']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['mysite.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=10)  # Reads of a user who just wrote stay on the primary
+REPLICA_MAX_LAG_SECONDS = env.float('REPLICA_MAX_LAG_SECONDS', default=5.0)
+REPLICA_CHECK_INTERVAL = env.int('REPLICA_CHECK_INTERVAL', default=10)  # Seconds between health probes per replica
+
+# Connection pooling for the ASGI deployment (mysite/db_pool.py): PostgreSQL + requirements-pool.txt only
+DATABASE_POOL = env.bool('DATABASE_POOL', default=False)
+if DATABASE_POOL:
+    from mysite import db_pool
+    db_pool.configure(
+        DATABASES,
+        min_size=env.int('DATABASE_POOL_MIN', default=2),
+        max_size=env.int('DATABASE_POOL_MAX', default=10),
+        timeout=env.float('DATABASE_POOL_TIMEOUT', default=10.0),  # Seconds to wait for a free connection
+        max_idle=env.float('DATABASE_POOL_MAX_IDLE', default=300.0),
+        max_lifetime=env.float('DATABASE_POOL_MAX_LIFETIME', default=1800.0),
+    )
+
+
+# =========================================================
+#  CACHE
+# =========================================================
+
+# Per-process memory by default; CACHE_URL=redis://... shares it between workers
+# (needs the redis package). Used by mysite/caching.py and mysite/replicas.py.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+    # Stored compressed bodies (mysite/compression.py): their own bounded store,
+    # so large bodies never evict tag generations, roles or replica pins
+    'compressed': env.cache('COMPRESSION_CACHE_URL', default='locmemcache://compressed'),
+}
+CACHES['compressed'].setdefault('OPTIONS', {}).setdefault(
+    'MAX_ENTRIES', env.int('COMPRESSION_CACHE_ENTRIES', default=500),
+)
+RESPONSE_CACHE_TTL = env.int('RESPONSE_CACHE_TTL', default=60)  # Upper bound on staleness of cached reads
+
+# Response compression (mysite/compression.py)
+COMPRESSION_MIN_BYTES = env.int('COMPRESSION_MIN_BYTES', default=1024)  # Smaller bodies are sent as is
+COMPRESSION_GZIP_LEVEL = env.int('COMPRESSION_GZIP_LEVEL', default=6)
+COMPRESSION_BROTLI_QUALITY = env.int('COMPRESSION_BROTLI_QUALITY', default=5)  # 0-11; above ~6 costs more CPU than it saves
+COMPRESSION_CACHE_MAX_BYTES = env.int('COMPRESSION_CACHE_MAX_BYTES', default=65536)  # Larger encoded bodies are not stored
+
 
 # =========================================================
 #  SECURITY & CORS
@@ -114,15 +169,29 @@ CORS_ALLOWED_ORIGINS = env.list('CORS_ALLOWED_ORIGINS', default=[FRONTEND_URL])
 CORS_ALLOW_CREDENTIALS = True
 CSRF_TRUSTED_ORIGINS = env.list('CSRF_TRUSTED_ORIGINS', default=[FRONTEND_URL])
 
+# Reverse proxies in front of the app that append to X-Forwarded-For. The
+# client address is the entry the outermost of them appended (0: REMOTE_ADDR);
+# anything further left is whatever the client sent. Production behind a
+# load balancer must set this: X-Forwarded-For is ignored by default.
+TRUSTED_PROXY_COUNT = env.int('TRUSTED_PROXY_COUNT', default=0)
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',  # <--- CRITICAL for "Token ..." header
+        'users.authentication.CachedTokenAuthentication',  # <--- CRITICAL for "Token ..." header (cached TokenAuthentication)
         'rest_framework.authentication.SessionAuthentication', 
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'mysite.renderers.ORJSONRenderer',  # Same bytes as JSONRenderer, faster (mysite/renderers.py)
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'NUM_PROXIES': TRUSTED_PROXY_COUNT,  # Throttles key on the same client address as blog/tracking.py
+    'DEFAULT_THROTTLE_RATES': {
+        'record_view': env.str('RECORD_VIEW_THROTTLE', default='60/min'),  # Per user / client address
+        'export': env.str('EXPORT_THROTTLE', default='10/hour'),  # Streamed exports per user (mysite/streaming.py)
+    },
 }
 
 
@@ -166,6 +235,16 @@ else:
     MY_MEDIA_BACKEND = "django.core.files.storage.FileSystemStorage"
 
 
+# Upload pipeline (blog/media.py): every image is re-encoded and resized
+IMAGE_FORMAT = env('IMAGE_FORMAT', default='WEBP')  # 'WEBP' or 'JPEG'
+IMAGE_QUALITY = env.int('IMAGE_QUALITY', default=80)
+IMAGE_MAX_DIMENSION = env.int('IMAGE_MAX_DIMENSION', default=2048)
+IMAGE_VARIANT_WIDTHS = [int(w) for w in env.list('IMAGE_VARIANT_WIDTHS', default=['480', '960', '1600'])]
+PROFILE_IMAGE_MAX_DIMENSION = env.int('PROFILE_IMAGE_MAX_DIMENSION', default=512)
+IMAGE_WORKERS = env.int('IMAGE_WORKERS', default=2)  # Max images processed at once per process
+MEDIA_GC_GRACE_HOURS = env.int('MEDIA_GC_GRACE_HOURS', default=24)  # Unreferenced uploads kept this long (drafts in progress)
+
+
 # =========================================================
 #  UNIFIED STORAGE CONFIGURATION
 # =========================================================
@@ -194,8 +273,65 @@ GOOGLE_CLIENT_ID = env('GOOGLE_CLIENT_ID', default='')
 GOOGLE_CLIENT_SECRET = env('GOOGLE_CLIENT_SECRET', default='')
 GOOGLE_REFRESH_TOKEN = env('GOOGLE_REFRESH_TOKEN', default='')
 
+# Token -> user snapshot cache (users/authentication.py), per worker process.
+# Revocations only evict in the worker that made them, so keep the TTL short.
+TOKEN_CACHE_TTL = env.int('TOKEN_CACHE_TTL', default=5)
+TOKEN_CACHE_SIZE = env.int('TOKEN_CACHE_SIZE', default=10000)
+
+# Seconds a user's group (role) set stays cached, see users/roles.py
+ROLE_CACHE_TTL = env.int('ROLE_CACHE_TTL', default=300)
+# ...and at most this long when the cache is per process: invalidation can't reach other workers
+ROLE_CACHE_LOCAL_TTL = env.int('ROLE_CACHE_LOCAL_TTL', default=5)
+
 # cleanup
 CRON_SECRET_KEY = env('CRON_SECRET_KEY', default='')
+# A background job run holds its lease this long past its last batch (mysite/jobs.py)
+JOB_LEASE_SECONDS = env.int('JOB_LEASE_SECONDS', default=300)
+
+# Interaction retention (blog/rollups.py): raw rows older than N days are
+# pruned after being rolled up, except each user's most recent HISTORY_SIZE
+INTERACTION_RETENTION_DAYS = env.int('INTERACTION_RETENTION_DAYS', default=90)
+INTERACTION_HISTORY_SIZE = env.int('INTERACTION_HISTORY_SIZE', default=50)
+
+# Opt-in compressed storage of long post bodies (blog/fields.py)
+POST_CONTENT_COMPRESSION = env.bool('POST_CONTENT_COMPRESSION', default=False)
+POST_CONTENT_COMPRESSION_MIN_BYTES = env.int('POST_CONTENT_COMPRESSION_MIN_BYTES', default=4096)
+POST_CONTENT_CODEC = env('POST_CONTENT_CODEC', default='zlib')  # 'zlib' or 'zstd' (needs zstandard)
+
+# Precomputed recommendation lists (blog/recommender.py)
+RECOMMENDATION_TOP_K = env.int('RECOMMENDATION_TOP_K', default=64)
+RECOMMENDATION_MAX_AGE_HOURS = env.int('RECOMMENDATION_MAX_AGE_HOURS', default=6)  # Picks up new posts
+RECOMMENDATION_ACTIVE_DAYS = env.int('RECOMMENDATION_ACTIVE_DAYS', default=30)  # Who gets a list built ahead
+
+# Seconds between pulls of other workers' changes into the related-posts index (blog/related.py)
+RELATED_INDEX_SYNC = env.int('RELATED_INDEX_SYNC', default=30)
+
+# Default feed ranking from the in-process feature store (blog/features.py)
+FEED_PAGE_SIZE = env.int('FEED_PAGE_SIZE', default=20)
+FEATURE_STORE_TTL = env.int('FEATURE_STORE_TTL', default=60)  # Seconds between full rebuilds
+FEATURE_STORE_SNAPSHOT = env('FEATURE_STORE_SNAPSHOT', default='')  # Shared directory for the mmap snapshot
+
+# ?export=ndjson|json on the post and comment lists (mysite/streaming.py)
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=500)  # Rows per database fetch
+EXPORT_BUFFER_BYTES = env.int('EXPORT_BUFFER_BYTES', default=65536)  # Bytes per block sent to the client
+
+# =========================================================
+#  WRITE-BEHIND BUFFERS (mysite/buffers.py)
+# =========================================================
+
+# Pending events are flushed every N seconds, or earlier once a buffer fills up
+WRITE_BEHIND_FLUSH_INTERVAL = env.float('WRITE_BEHIND_FLUSH_INTERVAL', default=5.0)
+WRITE_BEHIND_MAX_PENDING = env.int('WRITE_BEHIND_MAX_PENDING', default=10000)
+# Write inline instead of in the background (shell scripts). Always on under
+# `manage.py test`, so no flusher outlives the test database.
+WRITE_BEHIND_SYNC = env.bool('WRITE_BEHIND_SYNC', default=False) or sys.argv[1:2] == ['test']
+
+# Repeat views of a post by the same user within this window (seconds) are ignored
+VIEW_DEDUPE_WINDOW = env.int('VIEW_DEDUPE_WINDOW', default=5 * 60)
+
+# Unread notifications for the same (recipient, post, action) younger than
+# this (seconds) are updated in place instead of adding a new row
+NOTIFICATION_DIGEST_WINDOW = env.int('NOTIFICATION_DIGEST_WINDOW', default=6 * 60 * 60)
 
 # Password Validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -243,7 +379,13 @@ LOGGING = {
     },
     'root': {
         'handlers': ['console'],
-        'level': 'INFO',
+        'level': env('LOG_LEVEL', default='INFO'),
+    },
+    'loggers': {
+        # Per-request RBAC decisions; set to DEBUG to trace permission checks
+        'mysite.permissions': {
+            'level': env('RBAC_LOG_LEVEL', default='INFO'),
+        },
     },
 }
 
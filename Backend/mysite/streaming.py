@@ -0,0 +1,93 @@
+"""
+Streaming exports of large lists.
+
+``?export=ndjson`` (one JSON object per line) or ``?export=json`` (one
+JSON array, written as it goes) on a list endpoint streams every matching
+row instead of building the whole document in memory:
+
+  * Rows come from ``QuerySet.aiterator(chunk_size=EXPORT_CHUNK_SIZE)``:
+    a server-side cursor on PostgreSQL, chunked fetches elsewhere, and
+    prefetches run per chunk. Under ASGI nothing blocks the event loop.
+  * Each row is serialized on its own (flat rows, blog/serializers.py)
+    and lines are sent in blocks of about EXPORT_BUFFER_BYTES, so memory
+    stays flat whatever the result size.
+  * CompressionMiddleware compresses the stream block by block.
+
+Exports are for staff, moderators and authors archiving their own
+content (the views decide who may export what), and are throttled per
+user by ``ExportRateThrottle`` (EXPORT_THROTTLE). The rows are read after
+the view has returned, outside its ``replica_reads`` scope, so views bind
+the queryset to ``mysite.replicas.read_alias`` themselves.
+
+A failure mid-stream cannot change the status any more: the body just
+ends early (an unterminated array for ``json``), and the error is logged.
+"""
+
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.throttling import UserRateThrottle
+
+from mysite.renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+class ExportRateThrottle(UserRateThrottle):
+    """ Throttles only the ``?export=`` requests of the views it is set on. """
+    scope = 'export'
+
+    def allow_request(self, request, view):
+        if 'export' not in request.query_params:
+            return True
+        return super().allow_request(request, view)
+
+
+async def _ndjson(rows):
+    buffer = bytearray()
+    async for row in rows:
+        buffer += dumps(row)
+        buffer += b'\n'
+        if len(buffer) >= settings.EXPORT_BUFFER_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _json_array(rows):
+    buffer = bytearray(b'[')
+    separator = b''
+    async for row in rows:
+        buffer += separator
+        buffer += dumps(row)
+        separator = b','
+        if len(buffer) >= settings.EXPORT_BUFFER_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b']'
+    yield bytes(buffer)
+
+
+async def _logged(body, name):
+    try:
+        async for block in body:
+            yield block
+    except Exception:
+        logger.exception("export %s failed mid-stream", name)
+        raise
+
+
+def export_response(rows, export_format, name):
+    """ StreamingHttpResponse of the dicts from the async iterator ``rows``. """
+    body = _ndjson(rows) if export_format == 'ndjson' else _json_array(rows)
+    response = StreamingHttpResponse(_logged(body, name), content_type=EXPORT_FORMATS[export_format])
+    response['X-Accel-Buffering'] = 'no'  # Let nginx pass blocks on as they come
+    response['Cache-Control'] = 'no-store'
+    return response
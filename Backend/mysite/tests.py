@@ -0,0 +1,247 @@
+import gzip
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+
+from mysite import caching, compression, conditional, db_pool, jobs, replicas
+
+REPLICA = 'replica1'
+
+
+@replicas.replica_reads
+def _read_view(request, username):
+    return User.objects.filter(username=username).exists()
+
+
+@replicas.replica_reads
+def _write_then_read_view(request, username):
+    before = User.objects.filter(username=username).exists()
+    User.objects.create(username='written-in-request')
+    return before, User.objects.filter(username=username).exists()
+
+
+def _writing_view(request):
+    User.objects.filter(pk=request.user.pk).update(first_name='wrote')
+    return 'ok'
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """ A second SQLite file as the replica; each side holds a user the other lacks. """
+    databases = '__all__'  # Evaluated at class set-up, once the replica alias exists
+
+    @classmethod
+    def setUpClass(cls):
+        # The replica starts as a copy of the migrated, empty test database
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmpdir.name, 'replica.sqlite3')
+        connections[DEFAULT_DB_ALIAS].ensure_connection()
+        with sqlite3.connect(cls.path) as target:
+            connections[DEFAULT_DB_ALIAS].connection.backup(target)
+        connections.settings[REPLICA] = dict(connections.settings[DEFAULT_DB_ALIAS], NAME=cls.path)
+        # The primary may have connected before the router module was imported
+        replicas._install(None, connections[DEFAULT_DB_ALIAS])
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        replicas._health.clear()
+        self.user = User.objects.create_user('on-primary', password='x')
+        User.objects.using(REPLICA).bulk_create([User(username='on-replica')])  # No signals: they write to the primary
+
+    def _request(self, method='get', user=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.user = user or AnonymousUser()
+        return request
+
+    def _through_middleware(self, view, request, *args):
+        result = []
+        middleware = replicas.ReplicaStickinessMiddleware(lambda request: result.append(view(request, *args)))
+        middleware(request)
+        return result[0]
+
+    def test_marked_reads_go_to_the_replica(self):
+        self.assertTrue(_read_view(self._request(), 'on-replica'))
+        self.assertFalse(_read_view(self._request(), 'on-primary'))
+        # Unmarked reads and unsafe methods stay on the primary
+        self.assertTrue(User.objects.filter(username='on-primary').exists())
+        self.assertTrue(_read_view(self._request('post'), 'on-primary'))
+
+    def test_reads_after_a_write_in_the_request_use_the_primary(self):
+        before, after = self._through_middleware(_write_then_read_view, self._request(), 'on-primary')
+        self.assertFalse(before)
+        self.assertTrue(after)
+
+    def test_user_is_pinned_after_a_post(self):
+        self._through_middleware(_writing_view, self._request('post', self.user))
+        self.assertTrue(replicas.is_pinned(self.user.pk))
+        self.assertTrue(_read_view(self._request(user=self.user), 'on-primary'))
+        # Other readers still use the replica
+        self.assertFalse(_read_view(self._request(), 'on-primary'))
+
+    def test_falls_back_to_the_primary_when_the_replica_is_missing(self):
+        connections[REPLICA].close()
+        os.rename(self.path, self.path + '.moved')
+        try:
+            with self.assertLogs('mysite.replicas', 'WARNING'):
+                self.assertTrue(_read_view(self._request(), 'on-primary'))
+            self.assertFalse(replicas.is_healthy(REPLICA))
+        finally:
+            connections[REPLICA].close()
+            os.replace(self.path + '.moved', self.path)
+
+
+class CompressionTests(TestCase):
+    BODY = b'{"results":[%s]}' % b','.join(b'{"id":%d,"title":"post"}' % i for i in range(200))
+
+    def _response(self, request):
+        tag = conditional.etag('v1')
+        return conditional.not_modified(request, 'test', tag) or conditional.stamp(
+            HttpResponse(self.BODY, content_type='application/json'), 'test', tag,
+        )
+
+    def _get(self, encoding, **headers):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=encoding, **headers)
+        return compression.compress_response(request, self._response(request))
+
+    def test_encodings(self):
+        self.assertEqual(gzip.decompress(self._get('gzip').content), self.BODY)
+        if compression.brotli is not None:
+            self.assertEqual(compression.brotli.decompress(self._get('br, gzip').content), self.BODY)
+        self.assertNotIn('Content-Encoding', self._get('identity'))
+
+    def test_not_modified_keeps_the_etag_of_the_compressed_body(self):
+        full = self._get('gzip')
+        revalidated = self._get('gzip', HTTP_IF_NONE_MATCH=full['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], full['ETag'])
+        self.assertIn('Accept-Encoding', revalidated['Vary'])
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.builds = []
+
+    def _get(self, key, tags, tags_from=None):
+        def build():
+            self.builds.append(key)
+            return len(self.builds)
+        return caching.get_or_set(key, build, tags, tags_from=tags_from)
+
+    def test_invalidation_waits_for_the_commit(self):
+        self._get('post', ['post:1'])
+        before = caching.generations(['post:1'])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            caching.invalidate('post:1')
+            # Inside the transaction the entry still serves: readers can't see the new rows yet
+            self.assertEqual(caching.generations(['post:1']), before)
+            self._get('post', ['post:1'])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.builds, ['post'])
+
+        callbacks[0]()
+        self.assertNotEqual(caching.generations(['post:1']), before)
+        self._get('post', ['post:1'])
+        self.assertEqual(self.builds, ['post', 'post'])
+
+    def test_one_tag_drops_every_entry_that_depends_on_it(self):
+        self._get('profile', [], tags_from=lambda value: ['author:7'])
+        self._get('detail', ['post:1'], tags_from=lambda value: ['author:7'])
+        self._get('list', ['feed:global', 'post:1', 'post:2'])
+        self._get('other', ['post:2'], tags_from=lambda value: ['author:8'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.invalidate('author:7')
+        for key in ('profile', 'detail', 'list', 'other'):
+            self._get(key, [])
+        # 'list' had no author tag; 'other' belongs to another author
+        self.assertEqual(self.builds[4:], ['profile', 'detail'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.invalidate('post:2')
+        for key in ('profile', 'detail', 'list', 'other'):
+            self._get(key, [])
+        self.assertEqual(self.builds[6:], ['list', 'other'])
+
+    def test_an_evicted_generation_does_not_revive_old_entries(self):
+        self._get('post', ['post:1'])
+        cache.delete(caching._tag_key('post:1'))
+        self._get('post', ['post:1'])
+        self.assertEqual(self.builds, ['post', 'post'])
+
+
+class JobQueueTests(TestCase):
+
+    def test_a_pending_job_is_not_queued_twice(self):
+        started, release = threading.Event(), threading.Event()
+
+        def job():
+            started.set()
+            release.wait(5)
+
+        self.assertTrue(jobs.enqueue('test-job', job))
+        started.wait(5)
+        try:
+            self.assertFalse(jobs.enqueue('test-job', job))
+            self.assertIn('test-job', jobs.stats()['active'])
+        finally:
+            release.set()
+
+
+class DatabasePoolSettingsTests(TestCase):
+    SIZES = dict(min_size=2, max_size=10, timeout=10.0, max_idle=300.0, max_lifetime=1800.0)
+
+    def _databases(self):
+        postgres = {
+            'ENGINE': db_pool.POSTGRES_ENGINE, 'NAME': 'podium', 'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': False, 'OPTIONS': {'sslmode': 'require'},
+        }
+        return {
+            'default': postgres,
+            'replica1': dict(postgres, OPTIONS={}),
+            'local': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'db.sqlite3', 'CONN_MAX_AGE': 600},
+        }
+
+    def test_pools_every_postgres_alias(self):
+        databases = self._databases()
+        with mock.patch.object(db_pool, 'pool_installed', return_value=True):
+            db_pool.configure(databases, **self.SIZES)
+
+        for alias in ('default', 'replica1'):
+            self.assertEqual(databases[alias]['CONN_MAX_AGE'], 0)
+            self.assertTrue(databases[alias]['CONN_HEALTH_CHECKS'])
+            self.assertEqual(databases[alias]['OPTIONS']['pool'], dict(self.SIZES, name=alias))
+        # Connection options from the URL are kept
+        self.assertEqual(databases['default']['OPTIONS']['sslmode'], 'require')
+        self.assertEqual(databases['local'], self._databases()['local'])
+
+    def test_missing_psycopg3_fails_at_start_up(self):
+        with mock.patch.object(db_pool, 'pool_installed', return_value=False):
+            with self.assertRaises(ImproperlyConfigured):
+                db_pool.configure(self._databases(), **self.SIZES)
+            # Nothing to pool, nothing to install
+            sqlite_only = {'local': self._databases()['local']}
+            db_pool.configure(sqlite_only, **self.SIZES)
+        self.assertNotIn('OPTIONS', sqlite_only['local'])
+
+    def test_stats_skip_unpooled_aliases(self):
+        self.assertEqual(db_pool.stats(), {})
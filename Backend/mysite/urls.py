@@ -3,6 +3,7 @@ from django.http import JsonResponse
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from mysite.views import metrics_view
 
 def health_check(request):
     return JsonResponse({
@@ -15,6 +16,8 @@ def health_check(request):
 urlpatterns = [
     path('', health_check),
 
+    path('metrics/', metrics_view),
+
     path('admin/', admin.site.urls),
 
     path('api/', include('users.urls')),
@@ -0,0 +1,14 @@
+import os
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from mysite import metrics
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """ Runtime counters of the worker serving this request (see mysite/metrics.py). """
+    return Response({'pid': os.getpid(), 'metrics': metrics.snapshot()})
@@ -0,0 +1,111 @@
+"""
+Cached token authentication.
+
+Drop-in replacement for DRF's TokenAuthentication. The stock class does a
+Token + User lookup on every authenticated request; this one keeps a
+bounded, per-process TTL cache of token key -> (user id, user snapshot),
+so a cache hit authenticates without any I/O. The async (adrf) views use
+the same sync path: adrf authenticates inside the view's ``initial``,
+which it already runs in a worker thread.
+
+The snapshot holds only the fields below. The user object handed to the
+view is built with ``User.from_db`` and the other fields are deferred, so
+they load lazily if touched and ``save()`` never overwrites them.
+
+Entries are evicted in this process when the token is deleted, when the
+user is saved or deleted (deactivation included) and when the profile is
+soft deleted (see users/signals.py). That can't reach other workers, so
+they may accept a revoked token until their entry expires: TOKEN_CACHE_TTL
+is kept to a few seconds for that reason.
+"""
+
+import threading
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from mysite import metrics
+
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser',
+)
+
+_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
+# user id -> token key (one token per user), refreshed with every stored entry
+_keys = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _snapshot(user):
+    return tuple(getattr(user, field) for field in SNAPSHOT_FIELDS)
+
+
+def _restore(key, snapshot):
+    user = User.from_db(DEFAULT_DB_ALIAS, SNAPSHOT_FIELDS, snapshot)
+    return user, Token(key=key, user=user)
+
+
+def _lookup(key):
+    with _lock:
+        snapshot = _cache.get(key)
+        _counters['hits' if snapshot is not None else 'misses'] += 1
+    return snapshot
+
+
+def _store(key, user):
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    snapshot = _snapshot(user)
+    with _lock:
+        _cache[key] = snapshot
+        _keys[user.pk] = key
+    return snapshot
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        snapshot = _lookup(key)
+        if snapshot is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            snapshot = _store(key, token.user)
+        return _restore(key, snapshot)
+
+
+# ==========================================
+# INVALIDATION (called from users/signals.py)
+# ==========================================
+def evict_token(key):
+    with _lock:
+        if _cache.pop(key, None) is not None:
+            _counters['evictions'] += 1
+
+
+def evict_user(user_id):
+    with _lock:
+        key = _keys.pop(user_id, None)
+        if key is not None and _cache.pop(key, None) is not None:
+            _counters['evictions'] += 1
+
+
+def stats():
+    with _lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return dict(
+            _counters,
+            size=len(_cache),
+            hit_ratio=round(_counters['hits'] / lookups, 4) if lookups else None,
+        )
+
+
+metrics.register('auth.token_cache', stats)
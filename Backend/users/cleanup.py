@@ -0,0 +1,118 @@
+"""
+Hard deletion of accounts whose 30-day grace period has expired.
+
+Accounts are processed in batches of ``batch_size`` users, each batch in
+its own transaction:
+  1. Posts and comments of the whole batch are reassigned to the ghost
+     user with one UPDATE each (content survives, on_delete=CASCADE won't
+     reach it).
+  2. High-volume dependent rows (interactions, notifications, bookmarks)
+     are deleted with one set-based DELETE each.
+  3. The users are deleted in one go; the collector only has the small
+     per-user rows left (profile, token, group links).
+
+After every batch the last processed user id is stored in JobCheckpoint,
+so an interrupted run resumes where it stopped. A completed run clears it.
+Runs hold the job's lease (mysite/jobs.py), so a second worker or a
+restarted one never works through the same users at the same time.
+"""
+
+import logging
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from blog.models import Bookmark, Comment, Interaction, JobCheckpoint, Notification, Post
+from mysite import caching, jobs
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = 'account_cleanup'
+GHOST_USERNAME = 'deleted_user'
+
+
+def get_ghost_user():
+    """ System account that keeps the content of deleted users. """
+    ghost_user, _ = User.objects.get_or_create(username=GHOST_USERNAME)
+    profile, _ = Profile.objects.get_or_create(
+        user=ghost_user,
+        defaults={'bio': "This content is from a deleted account."},
+    )
+    # Ensure Ghost User is also flagged as "Soft Deleted" so the Serializer masks it properly
+    if not profile.is_soft_deleted:
+        profile.is_soft_deleted = True
+        profile.save()
+    return ghost_user
+
+
+def expired_user_ids():
+    return Profile.objects.filter(
+        is_soft_deleted=True,
+        scheduled_deletion_date__lte=timezone.now(),
+    ).exclude(user__username=GHOST_USERNAME).order_by('user_id').values_list('user_id', flat=True)
+
+
+def delete_batch(user_ids, ghost_user):
+    with transaction.atomic():
+        # update() sends no signals: drop the cached threads and cards by hand (mysite/caching.py)
+        post_ids = Comment.objects.filter(author_id__in=user_ids).values_list('post_id', flat=True).distinct()
+        caching.invalidate('feed:global', *(f'author:{user_id}' for user_id in user_ids),
+                           *(f'post:{post_id}' for post_id in post_ids))
+
+        # A. Reassign content (one UPDATE per table for the whole batch)
+        Post.objects.filter(author_id__in=user_ids).update(author=ghost_user)
+        Comment.objects.filter(author_id__in=user_ids).update(author=ghost_user)
+        Notification.objects.filter(actor_id__in=user_ids).update(actor=None)
+
+        # B. Bulk delete the big dependent tables
+        Interaction.objects.filter(user_id__in=user_ids).delete()
+        Notification.objects.filter(recipient_id__in=user_ids).delete()
+        Bookmark.objects.filter(user_id__in=user_ids).delete()
+
+        # C. The users themselves (+ profile, token, group links)
+        User.objects.filter(id__in=user_ids).delete()
+
+
+def cleanup_deleted_users(batch_size=100):
+    owner = jobs.claim(CHECKPOINT)
+    if owner is None:
+        logger.info("account cleanup: already running elsewhere")
+        return {'deleted_count': 0, 'skipped': True}
+    try:
+        return _cleanup(owner, batch_size)
+    finally:
+        jobs.release(CHECKPOINT, owner)
+
+
+def _cleanup(owner, batch_size):
+    checkpoint = JobCheckpoint.objects.get(name=CHECKPOINT)
+    last_id = int(checkpoint.cursor or 0)
+    if last_id:
+        logger.info("account cleanup: resuming after user %s", last_id)
+
+    ghost_user = get_ghost_user()
+    deleted = 0
+
+    while True:
+        user_ids = list(expired_user_ids().filter(user_id__gt=last_id)[:batch_size])
+        if not user_ids:
+            break
+
+        delete_batch(user_ids, ghost_user)
+        deleted += len(user_ids)
+        last_id = user_ids[-1]
+
+        checkpoint.cursor = str(last_id)
+        checkpoint.save(update_fields=['cursor', 'updated_at'])
+        logger.info("account cleanup: %d users deleted so far", deleted)
+        if not jobs.renew(CHECKPOINT, owner):
+            # The lease lapsed and another run resumed from our checkpoint
+            logger.warning("account cleanup: lease lost after user %s, stopping", last_id)
+            return {'deleted_count': deleted}
+
+    # Finished: the next run starts from the beginning again
+    checkpoint.cursor = ''
+    checkpoint.save(update_fields=['cursor', 'updated_at'])
+    return {'deleted_count': deleted}
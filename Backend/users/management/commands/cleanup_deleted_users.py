@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.cleanup import cleanup_deleted_users
+
+
+class Command(BaseCommand):
+    help = "Permanently delete accounts whose grace period expired (batched, resumable)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Users per transaction.")
+
+    def handle(self, *args, **options):
+        result = cleanup_deleted_users(batch_size=options['batch_size'])
+        if result.get('skipped'):
+            self.stdout.write(self.style.WARNING("Cleanup is already running elsewhere."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Deleted {result['deleted_count']} accounts."))
@@ -0,0 +1,53 @@
+"""
+Role resolver.
+
+A user's roles are the names of their Django groups. Permission checks
+and serializers used to query ``user.groups`` every time; the set is now
+cached per user (ROLE_CACHE_TTL) and memoised on the user object for the
+rest of the request. ``users/signals.py`` drops the cached entry whenever
+group membership changes.
+
+That invalidation only reaches every worker through a shared cache
+(CACHE_URL). With the default per-process cache, other workers would keep
+a revoked role for the whole TTL, so entries live ROLE_CACHE_LOCAL_TTL
+seconds at most there.
+"""
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+MODERATOR = 'Moderator'
+
+
+def _cache_key(user_id):
+    return f"roles:{user_id}"
+
+
+def _ttl():
+    if isinstance(caches['default'], (LocMemCache, DummyCache)):
+        return min(settings.ROLE_CACHE_TTL, settings.ROLE_CACHE_LOCAL_TTL)
+    return settings.ROLE_CACHE_TTL
+
+
+def get_roles(user):
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        roles = cache.get(_cache_key(user.pk))
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(_cache_key(user.pk), roles, _ttl())
+        user._roles = roles
+    return roles
+
+
+def is_moderator(user):
+    return MODERATOR in get_roles(user)
+
+
+def invalidate_roles(user_ids):
+    cache.delete_many([_cache_key(pk) for pk in user_ids])
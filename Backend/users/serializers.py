@@ -2,6 +2,9 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
 from .models import Profile
+from .roles import is_moderator
+from blog.media import process_image_blocking, InvalidImage
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
 
 # ==========================================
@@ -98,6 +101,18 @@ class ProfileSerializer(serializers.ModelSerializer):
             # Set the DB field to NULL
             instance.image = None
         
+        # New avatar: resized + re-encoded through the upload pipeline (blog/media.py)
+        new_image = validated_data.get('image')
+        if new_image:
+            try:
+                result = process_image_blocking(
+                    new_image, 'profile_pics',
+                    max_dimension=settings.PROFILE_IMAGE_MAX_DIMENSION, widths=(),
+                )
+            except InvalidImage:
+                raise serializers.ValidationError({'image': 'Unsupported or corrupt image.'})
+            validated_data['image'] = result['name']
+
         # If frontend sent a list of interests, join them into a string
         if 'interests_list' in validated_data:
             tags = validated_data.pop('interests_list')
@@ -106,8 +121,8 @@ class ProfileSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     
     def get_is_moderator(self, obj):
-        # Checks if the user is in the 'Moderator' group
-        return obj.user.groups.filter(name='Moderator').exists()
+        # Checks if the user is in the 'Moderator' group (cached, see users/roles.py)
+        return is_moderator(obj.user)
     
 
 class PublicProfileSerializer(serializers.ModelSerializer):
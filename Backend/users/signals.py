@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
-from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.contrib.auth.models import User, Group
 from django.dispatch import receiver
 from .models import Profile
+from .roles import invalidate_roles
+from .authentication import evict_token, evict_user
+from rest_framework.authtoken.models import Token
 from django.contrib.auth.signals import user_logged_in
 
 @receiver(post_save, sender=User)
@@ -11,3 +14,54 @@ def create_profile(sender, instance, created, **kwargs):
     """
     if created:
         Profile.objects.create(user=instance)
+
+
+# ==========================================
+# ROLE CACHE INVALIDATION (users/roles.py)
+# ==========================================
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Fires for both directions:
+    user.groups.add(group)      -> instance is the User, pk_set are group ids
+    group.user_set.add(user)    -> instance is the Group, pk_set are user ids
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        invalidate_roles([instance.pk])
+    elif action == 'pre_clear':
+        # pk_set is empty for clear(), so look the members up before they go
+        invalidate_roles(instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, **kwargs):
+    # Renaming or deleting a group changes the role set of all its members
+    invalidate_roles(instance.user_set.values_list('pk', flat=True))
+
+
+# ==========================================
+# TOKEN CACHE INVALIDATION (users/authentication.py)
+# ==========================================
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    # Covers logout and rotation (a new key is a new row, the old one is deleted)
+    evict_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_changed_user(sender, instance, **kwargs):
+    # Deactivation, renames, hard deletes: the cached snapshot is stale
+    evict_user(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def evict_soft_deleted_user(sender, instance, **kwargs):
+    if instance.is_soft_deleted:
+        evict_user(instance.user_id)
@@ -1,3 +1,111 @@
+from datetime import timedelta
+from unittest import mock
+
+from cachetools import TTLCache
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from blog.models import JobCheckpoint, Post
+from mysite import jobs
+from . import authentication, cleanup
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        # A controllable clock, and no entries left over from other tests
+        for name in ('_cache', '_keys'):
+            patcher = mock.patch.object(authentication, name, TTLCache(100, 5, timer=lambda: self.now))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('reader', password='x')
+        self.token = Token.objects.create(user=self.user)
+
+    def _get(self):
+        return self.client.get('/api/notifications/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cache_hit_needs_no_queries(self):
+        self.assertEqual(self._get().status_code, 200)
+        auth = authentication.CachedTokenAuthentication()
+        with self.assertNumQueries(0):
+            user, _ = auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_revoked_token_is_rejected(self):
+        self.assertEqual(self._get().status_code, 200)
+        self.token.delete()
+        self.assertEqual(self._get().status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self._get().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._get().status_code, 401)
+
+    def test_revocation_elsewhere_is_honoured_within_the_ttl(self):
+        self.assertEqual(self._get().status_code, 200)
+        # Another worker deleted the token: no signal reaches this process
+        Token.objects.filter(pk=self.token.pk)._raw_delete('default')
+        self.assertEqual(self._get().status_code, 200)
+        self.now += 6
+        self.assertEqual(self._get().status_code, 401)
+
+
+class AccountCleanupTests(TestCase):
+
+    def setUp(self):
+        self.expired = []
+        for i in range(5):
+            user = User.objects.create_user(f'leaving{i}', password='x')
+            user.profile.is_soft_deleted = True
+            user.profile.scheduled_deletion_date = timezone.now() - timedelta(days=1)
+            user.profile.save()
+            Post.objects.create(title=f"Post {i}", content="", author=user, status=1)
+            self.expired.append(user.pk)
+        self.staying = User.objects.create_user('staying', password='x')
+
+    def _remaining(self):
+        return sorted(User.objects.filter(pk__in=self.expired).values_list('pk', flat=True))
+
+    def test_resumes_after_a_failed_batch(self):
+        real = cleanup.delete_batch
+        calls = []
+
+        def failing_second_batch(user_ids, ghost_user):
+            calls.append(user_ids)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            real(user_ids, ghost_user)
+
+        with mock.patch.object(cleanup, 'delete_batch', failing_second_batch):
+            with self.assertRaises(RuntimeError):
+                cleanup.cleanup_deleted_users(batch_size=2)
+        self.assertEqual(self._remaining(), self.expired[2:])
+        self.assertEqual(JobCheckpoint.objects.get(name=cleanup.CHECKPOINT).cursor, str(self.expired[1]))
+
+        # The failed run let go of its lease; the next one picks up after the checkpoint
+        with mock.patch.object(cleanup, 'delete_batch', wraps=real) as batches:
+            self.assertEqual(cleanup.cleanup_deleted_users(batch_size=2), {'deleted_count': 3})
+        self.assertEqual(batches.call_args_list[0].args[0], self.expired[2:4])
+        self.assertEqual(self._remaining(), [])
+        self.assertEqual(Post.objects.filter(author__username=cleanup.GHOST_USERNAME).count(), 5)
+        self.assertTrue(User.objects.filter(pk=self.staying.pk).exists())
+        self.assertEqual(JobCheckpoint.objects.get(name=cleanup.CHECKPOINT).cursor, '')
+
+    def test_skips_while_another_run_holds_the_lease(self):
+        other = jobs.claim(cleanup.CHECKPOINT)
+
+        self.assertEqual(cleanup.cleanup_deleted_users(), {'deleted_count': 0, 'skipped': True})
+        self.assertEqual(self._remaining(), self.expired)
+
+        # A run that died without releasing stops blocking once its lease lapses
+        JobCheckpoint.objects.filter(owner=other).update(lease_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(cleanup.cleanup_deleted_users(), {'deleted_count': 5})
 
-# Create your tests here.
+    def test_stops_when_the_lease_is_lost(self):
+        with mock.patch.object(jobs, 'renew', return_value=False):
+            self.assertEqual(cleanup.cleanup_deleted_users(batch_size=2), {'deleted_count': 2})
+        self.assertEqual(self._remaining(), self.expired[2:])
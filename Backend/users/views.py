@@ -4,14 +4,16 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
-from django.conf import settings
-from django.utils import timezone
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 
 from .models import Profile
 from .serializers import RegisterSerializer, ProfileSerializer, PublicProfileSerializer
-from blog.models import Post, Comment
+from . import cleanup
+from mysite import jobs
+from mysite.permissions import HasCronSecret
+from mysite.replicas import replica_reads
+from mysite import caching
 
 # ==========================================
 # 0. CUSTOM LOGIN (Auto-Reactivate Account)
@@ -66,6 +68,7 @@ class RegisterAPI(generics.CreateAPIView):
 # ==========================================
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def ProfileAPI(request):
     try:
         # Get the profile for the currently logged-in user
@@ -96,6 +99,22 @@ class PublicProfileView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'username'
 
+    @replica_reads
+    def get(self, request, *args, **kwargs):
+        # Profile saves invalidate author:<id> (blog/signals.py): edits, soft deletion, reactivation
+        owner = []
+
+        def build():
+            profile = self.get_object()
+            owner.append(profile.user_id)
+            return self.get_serializer(profile).data
+
+        data = caching.get_or_set(
+            f"profile:{self.kwargs['username']}", build, [],
+            tags_from=lambda data: [f'author:{owner[0]}'],
+        )
+        return Response(data)
+
     def get_object(self):
         # 1. Get the username from the URL
         username = self.kwargs.get('username')
@@ -138,64 +157,15 @@ def RequestAccountDeletion(request):
     
 
 @api_view(['POST', 'GET']) # GET is easier for some cron services, POST is safer
-@permission_classes([AllowAny]) # We handle auth via Secret Key
+@permission_classes([HasCronSecret]) # Secret via X-CRON-SECRET header OR ?secret=...
 def CleanupDeletedUsers(request):
     """
     EXTERNAL CRON ENDPOINT
-    Permanently deletes users whose 30-day grace period has expired.
-    Reassigns content to a 'Ghost User' to preserve history.
+    Queues the permanent deletion of users whose 30-day grace period has expired
+    and returns immediately. The work runs in the background in resumable batches
+    (users/cleanup.py); content is reassigned to a 'Ghost User' to preserve history.
     """
-    # 1. SECURITY CHECK
-    auth_header = request.headers.get('X-CRON-SECRET')
-    query_param = request.query_params.get('secret')
-    
-    # Allow passing secret via Header OR Query Param (e.g. ?secret=...)
-    if auth_header != settings.CRON_SECRET_KEY and query_param != settings.CRON_SECRET_KEY:
-        return Response({"error": "Unauthorized access."}, status=status.HTTP_401_UNAUTHORIZED)
-
-    # 2. FIND USERS TO DELETE
-    now = timezone.now()
-    profiles_to_delete = Profile.objects.filter(
-        is_soft_deleted=True,
-        scheduled_deletion_date__lte=now
-    )
-    
-    count = profiles_to_delete.count()
-    if count == 0:
-        return Response({"message": "No accounts pending deletion."}, status=200)
-
-    # 3. GET/CREATE GHOST USER (To hold the content)
-    # We use a system account so posts don't vanish due to on_delete=CASCADE
-    ghost_user, _ = User.objects.get_or_create(username="deleted_user")
-    if not hasattr(ghost_user, 'profile'):
-        Profile.objects.create(user=ghost_user, bio="This content is from a deleted account.")
-    
-    # Ensure Ghost User is also flagged as "Soft Deleted" so the Serializer masks it properly
-    ghost_user.profile.is_soft_deleted = True 
-    ghost_user.profile.save()
+    if not jobs.enqueue(cleanup.CHECKPOINT, cleanup.cleanup_deleted_users):
+        return Response({"message": "Cleanup already running."}, status=status.HTTP_202_ACCEPTED)
 
-    deleted_usernames = []
-
-    # 4. PROCESS DELETION
-    for profile in profiles_to_delete:
-        user = profile.user
-        username = user.username
-        
-        # Skip if we accidentally picked up the ghost user
-        if user.id == ghost_user.id:
-            continue
-
-        # A. Reassign Posts & Comments to Ghost User
-        # This prevents CASCADE deletion
-        Post.objects.filter(author=user).update(author=ghost_user)
-        Comment.objects.filter(author=user).update(author=ghost_user)
-
-        # B. Hard Delete the User
-        user.delete()
-        deleted_usernames.append(username)
-
-    return Response({
-        "message": "Cleanup successful",
-        "deleted_count": count,
-        "users": deleted_usernames
-    }, status=200)
\ No newline at end of file
+    return Response({"message": "Cleanup queued."}, status=status.HTTP_202_ACCEPTED)